@@ -0,0 +1,235 @@
+"""
+Local emulation of booking.uz.gov.ua endpoints used by UZClient.
+
+    python -m benchmarks.fake_uz --port 8080 --latency 0.01 0.05 --error-rate 0.01
+
+then point the client to it: UZClient.base_url = 'http://127.0.0.1:8080/en'
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from collections import Counter
+from uuid import uuid4
+
+from aiohttp import web
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TOKEN_PAGE = os.path.join(HERE, '..', 'uz', 'tests', 'fixtures', 'index.html')
+# token encoded into the fixture page
+TOKEN = '33107f87dadad37307f93da538b73138'
+
+COACH_TYPES = [
+    ('Л', 'Suite / first-class sleeper'),
+    ('К', 'Coupe / coach with compartments'),
+    ('П', 'Berth / third-class sleeper'),
+]
+DEPARTURE = 1466451660
+
+
+class Inventory(object):
+    """
+    Seats per train, coach type and coach.
+    Starts with `available` share of free seats; more can be released later.
+    """
+
+    def __init__(self, trains=10, coaches=5, seats=36, available=0.0):
+        self.seats = seats
+        self.free = {}
+        self.taken = {}
+        for train in range(trains):
+            for letter, _ in COACH_TYPES:
+                for coach in range(1, coaches + 1):
+                    key = ('{:03d}К'.format(train), letter, coach)
+                    places = {str(i) for i in range(1, seats + 1)}
+                    self.free[key] = set(random.sample(
+                        sorted(places), int(seats * available)))
+                    self.taken[key] = places - self.free[key]
+
+    @property
+    def trains(self):
+        return sorted({i[0] for i in self.free})
+
+    def places(self, train, letter):
+        return sum(len(v) for k, v in self.free.items() if k[:2] == (train, letter))
+
+    def coaches(self, train, letter):
+        return sorted(k[2] for k in self.free if k[:2] == (train, letter))
+
+    def release(self, count=1):
+        for key in random.sample(sorted(self.taken), min(count, len(self.taken))):
+            if self.taken[key]:
+                seat = self.taken[key].pop()
+                self.free[key].add(seat)
+
+    def book(self, train, letter, coach, seat):
+        free = self.free.get((train, letter, coach), set())
+        if seat not in free:
+            return False
+        free.remove(seat)
+        self.taken[(train, letter, coach)].add(seat)
+        return True
+
+
+class FakeUZ(object):
+
+    def __init__(self, inventory=None, latency=(0, 0), error_rate=0.0, loop=None):
+        self.inventory = inventory or Inventory()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.loop = loop or asyncio.get_event_loop()
+        self.requests = Counter()
+        self.bookings = 0
+        with open(TOKEN_PAGE, encoding='utf-8') as f:
+            self.token_page = f.read()
+        self.coach_type_ids = {letter: i for i, (letter, _) in enumerate(COACH_TYPES)}
+        self._handler = None
+        self._server = None
+
+    def make_app(self):
+        app = web.Application(loop=self.loop)
+        routes = [
+            ('/en/', self.index),
+            ('/en/purchase/station/{name}/', self.station),
+            ('/en/purchase/search/', self.search),
+            ('/en/purchase/coaches/', self.coaches),
+            ('/en/purchase/coach/', self.coach),
+            ('/en/cart/add/', self.cart_add),
+        ]
+        for path, handler in routes:
+            app.router.add_route('POST', path, self.wrap(handler))
+        return app
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._handler = self.make_app().make_handler()
+        self._server = await self.loop.create_server(self._handler, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        await self._handler.finish_connections(1)
+        self._server.close()
+        await self._server.wait_closed()
+
+    def wrap(self, handler):
+        async def wrapper(request):
+            self.requests[handler.__name__] += 1
+            if self.latency[1]:
+                await asyncio.sleep(random.uniform(*self.latency))
+            if random.random() < self.error_rate:
+                return web.Response(status=503, body=b'Service Unavailable')
+            if handler != self.index and request.headers.get('GV-Token') != TOKEN:
+                return web.Response(status=400, body=b'Bad token')
+            return await handler(request, await request.post())
+        return wrapper
+
+    @staticmethod
+    def json(payload):
+        return web.Response(
+            body=json.dumps(payload).encode('utf-8'),
+            content_type='application/json', charset='utf-8')
+
+    async def index(self, request, data):
+        response = web.Response(
+            text=self.token_page, content_type='text/html', charset='utf-8')
+        response.set_cookie('_gv_sessid', uuid4().hex)
+        return response
+
+    async def station(self, request, data):
+        name = request.match_info['name']
+        return self.json({'value': [
+            {'station_id': 2200000 + sum(map(ord, name)) % 100000, 'title': name}]})
+
+    async def search(self, request, data):
+        value = []
+        for i, num in enumerate(self.inventory.trains):
+            value.append({
+                'category': 0,
+                'model': 0,
+                'num': num,
+                'travel_time': '7:25',
+                'from': {'date': DEPARTURE + i * 600, 'src_date': '2016-06-20 22:41:00',
+                         'station': 'Kyiv', 'station_id': data['station_id_from']},
+                'till': {'date': DEPARTURE + 30000 + i * 600, 'src_date': '2016-06-21 06:06:00',
+                         'station': 'Lviv', 'station_id': data['station_id_till']},
+                'types': [
+                    {'letter': letter, 'title': title,
+                     'places': self.inventory.places(num, letter)}
+                    for letter, title in COACH_TYPES]})
+        return self.json({'value': value})
+
+    async def coaches(self, request, data):
+        letter = data['coach_type']
+        return self.json({'coaches': [{
+            'allow_bonus': False,
+            'coach_class': 'Б',
+            'coach_type_id': self.coach_type_ids[letter],
+            'has_bedding': True,
+            'num': num,
+            'places_cnt': len(self.inventory.free[(data['train'], letter, num)]),
+            'prices': {'А': 33850},
+            'reserve_price': 1700,
+            'services': []} for num in self.inventory.coaches(data['train'], letter)]})
+
+    @staticmethod
+    def coach_key(train, data):
+        letter = COACH_TYPES[int(data['coach_type_id'])][0]
+        return train, letter, int(data['coach_num'])
+
+    async def coach(self, request, data):
+        free = self.inventory.free.get(self.coach_key(data['train'], data), set())
+        return self.json({'value': {'css': 'kr t19', 'places': {'А': sorted(free, key=int)}}})
+
+    async def cart_add(self, request, data):
+        place = {k[len('places[0]['):-1]: v for k, v in data.items() if k.startswith('places[0]')}
+        if not self.inventory.book(*self.coach_key(data['train'], place), place['place_num']):
+            return self.json({'error': True, 'value': 'Place is already taken'})
+        self.bookings += 1
+        return self.json({'error': None, 'value': 'OK'})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, nargs=2, default=(0, 0),
+                        metavar=('MIN', 'MAX'), help='response latency range, seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--trains', type=int, default=10)
+    parser.add_argument('--coaches', type=int, default=5)
+    parser.add_argument('--seats', type=int, default=36)
+    parser.add_argument('--available', type=float, default=0.1,
+                        help='share of free seats at start')
+    parser.add_argument('--release-rate', type=float, default=0,
+                        help='seats released per second')
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    inventory = Inventory(args.trains, args.coaches, args.seats, args.available)
+    server = FakeUZ(inventory, args.latency, args.error_rate, loop)
+    port = loop.run_until_complete(server.start(args.host, args.port))
+    if args.release_rate:
+        loop.create_task(release_seats(inventory, args.release_rate))
+    print('Fake UZ is listening on http://{}:{}/en'.format(args.host, port))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        loop.run_until_complete(server.stop())
+
+
+async def release_seats(inventory, rate, interval=0.1):
+    owed = 0
+    last = time.monotonic()
+    while True:
+        await asyncio.sleep(interval)
+        now = time.monotonic()
+        owed += (now - last) * rate
+        last = now
+        inventory.release(int(owed))
+        owed -= int(owed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Single pass JJDecoder compared to the original python-jjdecoder port
+on the token page fixtures, and on the token page payload repeated
+to show how both scale with its size.
+
+    python -m benchmarks.jjdecode
+"""
+import os
+import timeit
+
+from benchmarks.legacy_jjdecode import JJDecoder as LegacyJJDecoder
+from uz.client.jjdecode import JJDecoder
+from uz.client.utils import JJ_CODE_PATTERN
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), '..', 'uz', 'tests', 'fixtures')
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def scaled(encoded, times):
+    """
+    Repeats the payload of encoded script, keeping it decodable
+    """
+    decoder = JJDecoder(encoded)
+    startpos, endpos, _, _ = decoder.checkPalindrome(decoder.clean())
+    return encoded[:startpos] + encoded[startpos:endpos] * times + encoded[endpos:]
+
+
+def bench(name, encoded, number):
+    assert LegacyJJDecoder(encoded).decode() == JJDecoder(encoded).decode()
+    results = []
+    for decoder in (LegacyJJDecoder, JJDecoder):
+        elapsed = min(timeit.repeat(
+            lambda: decoder(encoded).decode(), number=number, repeat=3)) / number
+        results.append(elapsed)
+    print('{:<24} {:>8} chars  legacy {:>10.1f}us  single pass {:>8.1f}us  x{:.1f}'.format(
+        name, len(encoded), results[0] * 1e6, results[1] * 1e6, results[0] / results[1]))
+
+
+def main():
+    page = JJ_CODE_PATTERN.search(read_fixture('index.html')).groups()[0]
+    bench('jj_encoded.txt', read_fixture('jj_encoded.txt'), 1000)
+    bench('jj_encoded2.txt', read_fixture('jj_encoded2.txt'), 1000)
+    bench('index.html token', page, 100)
+    for times in (10, 100):
+        bench('index.html token x{}'.format(times), scaled(page, times), max(1, 100 // times))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Parse throughput of purchase/search/ and purchase/coaches/ payloads
+into uz.client.model objects, memory held per parsed object
+and cost of comparing them. LazyTrain is compared to the eager parsing
+on what the client does with search results: fetch_train picks one train
+by number, the scanner reads a found train, the bot prints them all.
+
+    python -m benchmarks.models
+"""
+import timeit
+import tracemalloc
+
+from benchmarks import payloads
+from uz.client.model import Train, LazyTrain, Coach
+
+
+def memory(parse, value):
+    """
+    Bytes allocated by the objects parse(value) keeps alive
+    """
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = parse(value)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(i.size_diff for i in after.compare_to(before, 'filename'))
+    del result
+    return size
+
+
+def bench(name, parse, value, count, number):
+    elapsed = min(timeit.repeat(lambda: parse(value), number=number, repeat=3)) / number
+    size = memory(parse, value)
+    print('{:<28} {:>10.0f} objects/s {:>8.0f} bytes/object'.format(
+        name, count / elapsed, size / count))
+
+
+def bench_eq(name, parse, value, number):
+    objects, copies = parse(value), parse(value)
+    elapsed = min(timeit.repeat(
+        lambda: [a == b for a, b in zip(objects, copies)],
+        number=number, repeat=3)) / number
+    print('{:<28} {:>10.0f} comparisons/s'.format(name, len(objects) / elapsed))
+
+
+def fetch_eager(value, num):
+    for train in [Train.from_dict(i) for i in value]:
+        if train.num == num:
+            return train
+
+
+def fetch_lazy(value, num):
+    for train in value:
+        if train['num'] == num:
+            return LazyTrain(train)
+
+
+def use(train):
+    return (train.source_station.id, train.destination_station.id, train.model,
+            train.departure_time.timestamp, [i.letter for i in train.coach_types])
+
+
+def bench_lazy(trains, number):
+    value = payloads.search(trains)['value']
+    num = value[-1]['num']
+    cases = [
+        ('fetch_train', lambda parse: parse(value, num)),
+        ('fetch_train + use', lambda parse: use(parse(value, num))),
+        ('list_trains + info', lambda parse: [
+            i.info() for i in parse(value)]),
+    ]
+    eager = {'fetch_train': fetch_eager, 'list_trains': parse_trains}
+    lazy = {'fetch_train': fetch_lazy, 'list_trains': parse_lazy}
+    print('purchase/search/ x{}'.format(trains))
+    for name, func in cases:
+        method = name.split()[0]
+        results = []
+        for parse in (eager[method], lazy[method]):
+            results.append(min(timeit.repeat(
+                lambda: func(parse), number=number, repeat=3)) / number)
+        print('  {:<26} eager {:>10.1f}us  lazy {:>10.1f}us  x{:.1f}'.format(
+            name, results[0] * 1e6, results[1] * 1e6, results[0] / results[1]))
+
+
+def parse_lazy(value):
+    return [LazyTrain(i) for i in value]
+
+
+def parse_trains(value):
+    return [Train.from_dict(i) for i in value]
+
+
+def parse_coaches(value):
+    return [Coach.from_dict(i) for i in value]
+
+
+def main():
+    for trains in (50, 500, 5000):
+        bench('purchase/search/ x{}'.format(trains), parse_trains,
+              payloads.search(trains)['value'], trains, max(1, 5000 // trains))
+    bench('purchase/coaches/ x20', parse_coaches,
+          payloads.coaches(20)['coaches'], 20, 500)
+    bench_eq('Train ==', parse_trains, payloads.search(500)['value'], 20)
+    bench_eq('Coach ==', parse_coaches, payloads.coaches(20)['coaches'], 500)
+    for trains in (50, 500, 5000):
+        bench_lazy(trains, max(1, 5000 // trains))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Payloads shaped after booking.uz.gov.ua responses (see uz/tests/conftest.py)
+"""
+import json
+
+
+def train(i):
+    return {
+        'category': 0,
+        'from': {'date': 1463368920 + i * 60,
+                 'src_date': '2016-05-16 06:22:00',
+                 'station': 'Kyiv-Pasazhyrsky',
+                 'station_id': '2200001'},
+        'model': 0,
+        'num': '{:03d}К'.format(i),
+        'till': {'date': 1463389200 + i * 60,
+                 'src_date': '2016-05-16 12:00:00',
+                 'station': 'Lviv',
+                 'station_id': '2218000'},
+        'travel_time': '5:38',
+        'types': [{'letter': 'Л', 'places': 12, 'title': 'Suite / first-class sleeper'},
+                  {'letter': 'К', 'places': 51, 'title': 'Coupe / coach with compartments'},
+                  {'letter': 'П', 'places': 120, 'title': 'Berth / third-class sleeper'}]}
+
+
+def search(trains=50):
+    return {'error': None, 'value': [train(i) for i in range(trains)]}
+
+
+def coach(places=54):
+    return {'error': None, 'value': {
+        'css': 'kr t19',
+        'places': {'А': [str(i) for i in range(1, places + 1)]}}}
+
+
+def coaches(count=20):
+    return {'error': None, 'coaches': [{
+        'allow_bonus': False,
+        'coach_class': 'Б',
+        'coach_type_id': 3,
+        'has_bedding': True,
+        'num': i,
+        'places_cnt': 10,
+        'prices': {'А': 33850},
+        'reserve_price': 1700,
+        'services': ['Ч', 'Ш']} for i in range(1, count + 1)]}
+
+
+def encode(payload):
+    return json.dumps(payload, ensure_ascii=False).encode('utf-8')
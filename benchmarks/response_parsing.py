@@ -0,0 +1,68 @@
+"""
+CPU cost of turning a response body into JSON:
+aiohttp's ClientResponse.json() (content type parsing, charset detection,
+decoding) compared to UZClient.parse_json.
+
+    python -m benchmarks.response_parsing
+"""
+import timeit
+
+import aiohttp
+from aiohttp.multidict import CIMultiDict
+
+from benchmarks import payloads
+from uz.client import UZClient
+
+
+NUMBER = 200
+
+
+def run(coro):
+    """
+    Drives a coroutine which never suspends
+    """
+    try:
+        coro.send(None)
+    except StopIteration as ex:
+        return ex.value
+    raise RuntimeError('Coroutine suspended')
+
+
+def aiohttp_response(body, content_type):
+    response = aiohttp.ClientResponse('POST', 'http://booking.uz.gov.ua/en/')
+    response.headers = CIMultiDict({'Content-Type': content_type})
+    response._content = body
+    return response
+
+
+def bench(name, body):
+    client = UZClient()
+    cases = [('UZClient.parse_json', lambda: client.parse_json(body))]
+    responses = []
+    for content_type in ('application/json; charset=utf-8', 'application/json'):
+        response = aiohttp_response(body, content_type)
+        responses.append(response)
+        cases.append(('ClientResponse.json [{}]'.format(content_type),
+                      lambda response=response: run(response.json())))
+    try:
+        import ujson
+    except ImportError:
+        pass
+    else:
+        fast = UZClient()
+        fast.json_loads = ujson.loads
+        cases.append(('UZClient.parse_json [ujson]', lambda: fast.parse_json(body)))
+
+    print('{} ({} bytes)'.format(name, len(body)))
+    for title, func in cases:
+        assert func() == cases[0][1]()
+        elapsed = min(timeit.repeat(func, number=NUMBER, repeat=3)) / NUMBER
+        print('  {:<55} {:>10.1f} us/request'.format(title, elapsed * 1e6))
+    for response in responses:
+        response.close()
+
+
+if __name__ == '__main__':
+    bench('purchase/search/', payloads.encode(payloads.search()))
+    bench('purchase/coaches/', payloads.encode(payloads.coaches()))
+    bench('purchase/coach/', payloads.encode(payloads.coach()))
@@ -0,0 +1,64 @@
+"""
+Writing scans to LogStore and restoring them on start.
+
+    python -m benchmarks.scan_store [--scans 100000]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from uz.client.model import Station
+from uz.scanner import UZScanner
+from uz.store import LogStore
+
+
+# what UZTGBot.callback_id keeps of a message
+CALLBACK_ID = [12345678, 'private']
+
+
+async def write(scanner, scans):
+    source = Station(2200001, 'Kyiv')
+    destination = Station(2218000, 'Lviv')
+    date = datetime(2016, 7, 1)
+    start = time.perf_counter()
+    scan_ids = [
+        scanner.add_item(CALLBACK_ID, 'Taras', 'Shevchenko', date, source, destination,
+                         '{:03d}К'.format(i % 1000))
+        for i in range(scans)]
+    added = time.perf_counter() - start
+    await scanner.store.flush()
+    print('add_item x{}: {:.3f}s on the loop, {:.3f}s until written'.format(
+        scans, added, time.perf_counter() - start))
+    start = time.perf_counter()
+    for scan_id in scan_ids[:len(scan_ids) // 10]:
+        scanner.abort(scan_id)
+    await scanner.store.flush()
+    print('abort x{}: {:.3f}s until written'.format(
+        len(scan_ids) // 10, time.perf_counter() - start))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scans', type=int, default=100000)
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'scans.log')
+        scanner = UZScanner(None, store=LogStore(path))
+        loop.run_until_complete(write(scanner, args.scans))
+        scanner.cleanup()
+        print('log: {:.1f}MB'.format(os.path.getsize(path) / 2 ** 20))
+
+        scanner = UZScanner(None, store=LogStore(path))
+        start = time.perf_counter()
+        restored = scanner.restore()
+        print('restore x{}: {:.3f}s'.format(restored, time.perf_counter() - start))
+        scanner.cleanup()
+
+
+if __name__ == '__main__':
+    main()
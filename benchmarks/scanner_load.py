@@ -0,0 +1,175 @@
+"""
+UZScanner under load, against the local fake UZ server.
+Reports requests/s, time-to-book percentiles, event loop lag and RSS.
+
+    python -m benchmarks.scanner_load --scans 1000 --routes 50
+    python -m benchmarks.scanner_load --scans 100000 --routes 500 --duration 120
+"""
+import argparse
+import asyncio
+import logging
+import random
+import resource
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.fake_uz import FakeUZ, Inventory, COACH_TYPES, release_seats
+from uz.client import UZClient
+from uz.client.model import Station
+from uz.client.ratelimit import TokenBucket, rate_limiter
+from uz.scanner import UZScanner
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # peak, not current, but better than nothing
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class LoopLag(object):
+    """
+    Measures how late the loop wakes up a sleeping coroutine
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.samples = []
+        self._running = False
+
+    async def run(self):
+        self._running = True
+        while self._running:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.samples.append(time.monotonic() - start - self.interval)
+
+    def stop(self):
+        self._running = False
+
+
+class Bench(object):
+
+    def __init__(self, args):
+        self.args = args
+        self.loop = asyncio.get_event_loop()
+        self.inventory = Inventory(args.trains, args.coaches, args.seats, args.available)
+        self.server = FakeUZ(self.inventory, args.latency, args.error_rate, self.loop)
+        self.scanner = UZScanner(self.success_cb, delay=args.delay, identities=args.identities)
+        self.lag = LoopLag()
+        self.added = {}
+        self.booked = []
+
+    async def success_cb(self, cb_id, session_id):
+        self.booked.append(time.monotonic() - self.added[cb_id])
+
+    def add_scans(self):
+        date = datetime.today() + timedelta(days=21)
+        routes = [
+            (Station(2200000 + i, 'Source {}'.format(i)),
+             Station(2300000 + i, 'Destination {}'.format(i)))
+            for i in range(self.args.routes)]
+        trains = self.inventory.trains
+        for i in range(self.args.scans):
+            source, destination = routes[i % len(routes)]
+            ct_letter = random.choice([None] + [letter for letter, _ in COACH_TYPES])
+            self.scanner.add_item(
+                i, 'firstname', 'lastname', date, source, destination,
+                random.choice(trains), ct_letter)
+            self.added[i] = time.monotonic()
+
+    @staticmethod
+    def unthrottle(rate):
+        rate_limiter.host = TokenBucket(rate)
+        rate_limiter.endpoint_rate = rate
+        rate_limiter.endpoints.clear()
+
+    async def run(self):
+        port = await self.server.start()
+        UZClient.base_url = 'http://127.0.0.1:{}/en'.format(port)
+        if self.args.rate:
+            self.unthrottle(self.args.rate)
+
+        tasks = [asyncio.ensure_future(self.lag.run())]
+        if self.args.release_rate:
+            tasks.append(asyncio.ensure_future(
+                release_seats(self.inventory, self.args.release_rate)))
+
+        rss_before = rss_mb()
+        self.add_scans()
+        start = time.monotonic()
+        tasks.append(asyncio.ensure_future(self.scanner.run()))
+        while (time.monotonic() - start < self.args.duration and
+               len(self.booked) < self.args.scans):
+            await asyncio.sleep(0.1)
+        elapsed = time.monotonic() - start
+        booked = list(self.booked)
+        rss_after = rss_mb()
+
+        self.scanner.stop()
+        self.lag.stop()
+        for task in tasks:
+            task.cancel()
+        await asyncio.sleep(0)
+        self.scanner.cleanup()
+        await self.server.stop()
+        self.report(elapsed, booked, rss_before, rss_after)
+
+    def report(self, elapsed, booked, rss_before, rss_after):
+        requests = sum(self.server.requests.values())
+        print('scans: {}, routes: {}, elapsed: {:.1f}s'.format(
+            self.args.scans, self.args.routes, elapsed))
+        print('requests: {} ({:.0f} req/s)'.format(requests, requests / elapsed))
+        for name, count in sorted(self.server.requests.items()):
+            print('  {:<10} {}'.format(name, count))
+        print('booked: {} of {}'.format(len(booked), self.args.scans))
+        print('time to book, s: p50 {:.3f}, p90 {:.3f}, p99 {:.3f}, max {:.3f}'.format(
+            *(percentile(booked, p) for p in (50, 90, 99, 100))))
+        print('loop lag, ms: p50 {:.1f}, p99 {:.1f}, max {:.1f}'.format(
+            *(percentile(self.lag.samples, p) * 1000 for p in (50, 99, 100))))
+        print('rss, MB: {:.1f} before scans, {:.1f} after'.format(rss_before, rss_after))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scans', type=int, default=1000)
+    parser.add_argument('--routes', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=30,
+                        help='stop after this many seconds')
+    parser.add_argument('--delay', type=float, default=1,
+                        help='interval between scans of an item, seconds')
+    parser.add_argument('--identities', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=1000,
+                        help='client rate limit, req/s; 0 keeps the defaults')
+    parser.add_argument('--latency', type=float, nargs=2, default=(0.005, 0.02),
+                        metavar=('MIN', 'MAX'), help='server latency range, seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--trains', type=int, default=10)
+    parser.add_argument('--coaches', type=int, default=5)
+    parser.add_argument('--seats', type=int, default=36)
+    parser.add_argument('--available', type=float, default=0.0,
+                        help='share of free seats at start')
+    parser.add_argument('--release-rate', type=float, default=50,
+                        help='seats released per second')
+    parser.add_argument('--log-level', default='CRITICAL',
+                        help='e.g. ERROR to see failed scans')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level)
+    asyncio.get_event_loop().run_until_complete(Bench(args).run())
+
+
+if __name__ == '__main__':
+    main()
@@ -3,15 +3,21 @@ import logging
 import os
 import sys
 
-from uz.interface.telegram import bot
+from uz.client.session import close_cassette, init_cassette
+from uz.interface.telegram import bot, client_pool
 from uz.metrics import statsd
 from uz.scanner import UZScanner
+from uz.store import LogStore
 
 
 logger = logging.getLogger('main')
 DEFAULT_LEVEL = logging.WARNING
 
 SCAN_DALAY_SEC = int(os.environ.get('SCAN_DALAY_SEC') or 10)
+SCANNER_IDENTITIES = int(os.environ.get('SCANNER_IDENTITIES') or 4)
+SCAN_BUDGET_SEC = int(os.environ.get('SCAN_BUDGET_SEC') or 30)
+# log of active scans, they are lost on restart if not set
+SCAN_STORE = os.environ.get('SCAN_STORE')
 
 
 def get_log_level():
@@ -48,21 +54,31 @@ def init_statsd():
 if __name__ == '__main__':
     configure_logging()
     init_statsd()
+    init_cassette()
 
-    scanner = UZScanner(bot.ticket_booked_cb, SCAN_DALAY_SEC)
+    store = LogStore(SCAN_STORE) if SCAN_STORE else None
+    scanner = UZScanner(bot.ticket_booked_cb, SCAN_DALAY_SEC, identities=SCANNER_IDENTITIES,
+                        scan_budget=SCAN_BUDGET_SEC, store=store)
+    scanner.restore()
     bot.set_scanner(scanner)
     loop = asyncio.get_event_loop()
+    loop.run_until_complete(asyncio.gather(client_pool.start(), scanner.identities.start()))
     loop.create_task(bot.loop())
     loop.create_task(scanner.run())
+    # keeps tokens of client_pool fresh
+    loop.create_task(client_pool.run())
     logger.warning('Running...')
     try:
         loop.run_forever()
     except KeyboardInterrupt:
         bot.stop()
         scanner.stop()
+        client_pool.stop()
         logger.warning('Shutting down...')
         logger.warning('Waiting for all tasks to complete...')
         pending = asyncio.Task.all_tasks()
         loop.run_until_complete(asyncio.gather(*pending))
         scanner.cleanup()
+        client_pool.close()
+        close_cassette()
         loop.stop()
@@ -0,0 +1,50 @@
+import time
+
+
+class AvailabilitySnapshot(object):
+    """
+    Places per (train num, coach letter) of every scanned route as of
+    the previous lookup. Places which did not change are reported again
+    after `refresh` seconds, in case a booking attempt missed them.
+    """
+
+    def __init__(self, refresh=600):
+        self.refresh = refresh
+        self._routes = {}
+
+    def __len__(self):
+        return len(self._routes)
+
+    def update(self, route, trains):
+        """
+        Stores places of trains, returns keys where places appeared
+        or increased since the previous lookup
+        """
+        now = time.monotonic()
+        previous = self._routes.get(route, {})
+        current = {}
+        changes = set()
+        for train in trains:
+            for coach_type in train.coach_types:
+                key = train.num, coach_type.letter
+                places = coach_type.places
+                old_places, reported = previous.get(key, (0, None))
+                if places > old_places or (
+                        places and reported is not None and now - reported >= self.refresh):
+                    changes.add(key)
+                    reported = now
+                current[key] = places, reported
+        self._routes[route] = current
+        return changes
+
+    def forget(self, route, keys):
+        """
+        Makes places of keys new again on the next lookup
+        """
+        snapshot = self._routes.get(route, {})
+        for key in keys:
+            snapshot.pop(key, None)
+
+    def retain(self, routes):
+        for route in set(self._routes) - set(routes):
+            del self._routes[route]
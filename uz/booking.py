@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from itertools import chain
+
+from uz.client.exceptions import ResponseError
+from uz.metrics import statsd
+
+
+logger = logging.getLogger('uz.scanner')
+
+
+class BookingEngine(object):
+    """
+    Fetches coaches and seat maps concurrently and tries seats as soon
+    as they are found, one at a time with a single client. UZ keeps
+    a seat added to a cart reserved, so there is never more than one cart
+    and no seat is held in a cart nobody is going to pay for.
+    """
+
+    def __init__(self, booking_pool, concurrency=8):
+        self.booking_pool = booking_pool
+        self.concurrency = concurrency
+
+    async def book(self, train, coach_types, firstname, lastname, deadline=None):
+        client = await self.booking_pool.acquire(deadline)
+        candidates = asyncio.Queue()
+        producer = asyncio.ensure_future(
+            self.find_seats(client, train, coach_types, candidates, deadline))
+        # the cart is known to be empty only once every seat was refused
+        cart_empty = False
+        try:
+            session_id = await self.try_seats(
+                client, train, candidates, firstname, lastname, deadline)
+            if session_id is None:
+                cart_empty = True
+                await producer  # propagate errors of coaches lookup
+            else:
+                statsd.increment('scanner.booking.success')
+            return session_id
+        finally:
+            producer.cancel()
+            if cart_empty:
+                # the session and token are still good for the next booking
+                self.booking_pool.release(client)
+            else:
+                self.booking_pool.close_client(client)
+
+    async def find_seats(self, client, train, coach_types, candidates, deadline=None):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def limited(fn, *args):
+            # a lookup cancelled while waiting leaves no coroutine behind
+            async with semaphore:
+                return await fn(*args)
+
+        async def queue_seats(coach):
+            try:
+                seats = await limited(client.list_seats, train, coach, deadline)
+            except ResponseError:
+                return
+            for seat in seats:
+                candidates.put_nowait((coach, seat))
+
+        try:
+            coaches = await asyncio.gather(
+                *(limited(client.list_coaches, train, i, deadline) for i in coach_types))
+            await asyncio.gather(*(queue_seats(i) for i in chain(*coaches)))
+        finally:
+            candidates.put_nowait(None)
+
+    async def try_seats(self, client, train, candidates, firstname, lastname, deadline=None):
+        while True:
+            candidate = await candidates.get()
+            if candidate is None:
+                return
+            coach, seat = candidate
+            statsd.increment('scanner.booking.attempts')
+            try:
+                await client.book_seat(train, coach, seat, firstname, lastname, deadline)
+            except ResponseError:
+                continue
+            return client.get_session_id()
@@ -0,0 +1,69 @@
+import time
+from collections import OrderedDict
+
+from uz.metrics import statsd
+
+
+class TTLCache(object):
+    """
+    Bounded LRU cache with per-entry time to live.
+    Empty (negative) results are kept for `negative_ttl` seconds only.
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=86400, negative_ttl=300):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    @staticmethod
+    def normalize(key):
+        return key.strip().lower()
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return total and self.hits / total
+
+    def _report(self, hit):
+        if hit:
+            self.hits += 1
+            statsd.increment('{}.hit'.format(self.name))
+        else:
+            self.misses += 1
+            statsd.increment('{}.miss'.format(self.name))
+        statsd.gauge('{}.hit_ratio'.format(self.name), self.hit_ratio)
+
+    def get(self, key, default=None):
+        key = self.normalize(key)
+        item = self._data.get(key)
+        if item is not None:
+            expires, value = item
+            if expires > time.time():
+                self._data.move_to_end(key)
+                self._report(hit=True)
+                return value
+            del self._data[key]
+        self._report(hit=False)
+        return default
+
+    def set(self, key, value):
+        key = self.normalize(key)
+        ttl = self.ttl if value else self.negative_ttl
+        self._data[key] = (time.time() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        statsd.gauge('{}.size'.format(self.name), len(self._data))
+
+    def clear(self):
+        self._data.clear()
+
+
+station_cache = TTLCache('client.station_cache')
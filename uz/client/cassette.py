@@ -0,0 +1,286 @@
+import asyncio
+import gzip
+import http.cookies
+import json
+import logging
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from uz.client.exceptions import CassetteError
+
+
+logger = logging.getLogger('uz.client')
+
+
+class Interaction(object):
+
+    __slots__ = ('method', 'uri', 'data', 'status', 'body', 'cookies', 'elapsed')
+
+    def __init__(self, method, uri, data, status, body, cookies, elapsed):
+        self.method = method
+        self.uri = uri
+        self.data = data
+        self.status = status
+        self.body = body
+        self.cookies = cookies
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return 'Interaction(%r, %r, %r)' % (self.method, self.uri, self.status)
+
+    @staticmethod
+    def make_key(method, uri, data=None):
+        return method, uri, tuple(sorted((k, str(v)) for k, v in (data or {}).items()))
+
+    @property
+    def key(self):
+        return self.make_key(self.method, self.uri, self.data)
+
+    @classmethod
+    def from_dict(cls, dikt):
+        return cls(
+            method=dikt['method'],
+            uri=dikt['uri'],
+            data=dikt['data'],
+            status=dikt['status'],
+            body=dikt['body'].encode('utf-8'),
+            cookies=dikt['cookies'],
+            elapsed=dikt['elapsed'])
+
+    def to_dict(self):
+        return dict(
+            method=self.method,
+            uri=self.uri,
+            data=self.data,
+            status=self.status,
+            body=self.body.decode('utf-8', 'replace'),
+            cookies=self.cookies,
+            elapsed=self.elapsed)
+
+
+class Cassette(object):
+    """
+    Gzipped JSON lines file with recorded UZ request/response pairs.
+
+    Recording wraps a real session; replaying substitutes it altogether.
+    Responses for the same (method, uri, form data) are replayed in recorded
+    order, the last one is repeated once they run out.
+    Recorded interactions are appended in batches by a single worker thread,
+    close() writes what is left.
+    """
+
+    def __init__(self, path, loop=None):
+        self.path = path
+        self.loop = loop or asyncio.get_event_loop()
+        self.executor = ThreadPoolExecutor(1)
+        self.interactions = defaultdict(list)
+        self._played = defaultdict(int)
+        self._pending = []
+        self._writer = None
+
+    def __len__(self):
+        return sum(len(i) for i in self.interactions.values())
+
+    def load(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                interaction = Interaction.from_dict(json.loads(line))
+                self.interactions[interaction.key].append(interaction)
+        return self
+
+    def record(self, interaction):
+        self.interactions[interaction.key].append(interaction)
+        self._pending.append(interaction)
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.ensure_future(self.write_pending(), loop=self.loop)
+
+    async def write_pending(self):
+        while self._pending:
+            interactions, self._pending = self._pending, []
+            try:
+                await self.loop.run_in_executor(self.executor, self.write, interactions)
+            except Exception:
+                logger.exception('Failed to write interactions to %s', self.path)
+
+    async def flush(self):
+        while self._writer is not None and not self._writer.done():
+            await asyncio.shield(self._writer)
+
+    def write(self, interactions):
+        # gzip members can be concatenated, so appending is safe
+        with gzip.open(self.path, 'at', encoding='utf-8') as f:
+            f.write(''.join(
+                json.dumps(i.to_dict(), ensure_ascii=False) + '\n' for i in interactions))
+
+    def close(self):
+        """
+        Writes what is left synchronously, the loop may not be running any more
+        """
+        self.executor.shutdown(wait=True)
+        if self._pending:
+            interactions, self._pending = self._pending, []
+            self.write(interactions)
+
+    def play(self, method, uri, data=None):
+        key = Interaction.make_key(method, uri, data)
+        recorded = self.interactions.get(key)
+        if not recorded:
+            raise CassetteError('No recorded response for {} {} {}'.format(method, uri, data))
+        index = min(self._played[key], len(recorded) - 1)
+        self._played[key] += 1
+        return recorded[index]
+
+    def recording(self, session):
+        return RecordingSession(self, session)
+
+    def replaying(self, speed=None):
+        return ReplaySession(self, speed)
+
+
+class RecordingSession(object):
+
+    def __init__(self, cassette, session):
+        self.cassette = cassette
+        self.session = session
+
+    @property
+    def cookies(self):
+        return self.session.cookies
+
+    def request(self, method, uri, **kwargs):
+        return RecordingRequest(self, method, uri, kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class RecordingRequest(object):
+
+    def __init__(self, session, method, uri, kwargs):
+        self.session = session
+        self.method = method
+        self.uri = uri
+        self.kwargs = kwargs
+        self._request = None
+
+    async def __aenter__(self):
+        self.started = time.monotonic()
+        self._request = self.session.session.request(self.method, self.uri, **self.kwargs)
+        return RecordingResponse(self, await self._request.__aenter__())
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        return await self._request.__aexit__(exc_type, exc_value, traceback)
+
+
+class RecordingResponse(object):
+
+    def __init__(self, request, response):
+        self.request = request
+        self.response = response
+        self.status = response.status
+        self.content = RecordingStream(self)
+        self.recorded = False
+
+    def record(self, body):
+        if self.recorded:
+            return
+        self.recorded = True
+        request = self.request
+        request.session.cassette.record(Interaction(
+            method=request.method,
+            uri=request.uri,
+            data=request.kwargs.get('data'),
+            status=self.status,
+            body=body,
+            cookies={k: v.value for k, v in self.response.cookies.items()},
+            elapsed=time.monotonic() - request.started))
+
+    async def read(self):
+        body = await self.response.read()
+        self.record(body)
+        return body
+
+    def close(self):
+        """
+        Records the part of body read so far
+        """
+        self.record(bytes(self.content.buffer))
+        self.response.close()
+
+
+class RecordingStream(object):
+
+    def __init__(self, response):
+        self.response = response
+        self.buffer = bytearray()
+
+    async def readany(self):
+        chunk = await self.response.response.content.readany()
+        if chunk:
+            self.buffer.extend(chunk)
+        else:
+            self.response.record(bytes(self.buffer))
+        return chunk
+
+
+class ReplaySession(object):
+
+    def __init__(self, cassette, speed=None):
+        self.cassette = cassette
+        self.speed = speed
+        self.cookies = http.cookies.SimpleCookie()
+
+    def request(self, method, uri, **kwargs):
+        return ReplayRequest(self, method, uri, kwargs.get('data'))
+
+    def close(self):
+        pass
+
+
+class ReplayRequest(object):
+    """
+    Replays recorded response, with original timing divided by `speed`
+    or instantly if speed is not set
+    """
+
+    def __init__(self, session, method, uri, data):
+        self.session = session
+        self.method = method
+        self.uri = uri
+        self.data = data
+
+    async def __aenter__(self):
+        interaction = self.session.cassette.play(self.method, self.uri, self.data)
+        if self.session.speed:
+            await asyncio.sleep(interaction.elapsed / self.session.speed)
+        for name, value in interaction.cookies.items():
+            self.session.cookies[name] = value
+        return ReplayResponse(interaction)
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class ReplayResponse(object):
+
+    def __init__(self, interaction):
+        self.status = interaction.status
+        self.body = interaction.body
+        self.content = ReplayStream(self.body)
+
+    async def read(self):
+        return self.body
+
+    def close(self):
+        pass
+
+
+class ReplayStream(object):
+
+    def __init__(self, body):
+        self.body = body
+
+    async def readany(self):
+        chunk, self.body = self.body, b''
+        return chunk
@@ -1,14 +1,25 @@
 import asyncio
+import json
 import logging
-import time
 from itertools import chain
 
 import aiohttp
 
+from uz.client.cache import station_cache as default_station_cache
 from uz.client.exceptions import (
-    FailedObtainToken, HTTPError, BadRequest, ResponseError, ImproperlyConfigured)
-from uz.client.model import DATE_FMT, Train, Station, Coach
-from uz.client.utils import parse_gv_token, get_random_user_agent
+    FailedObtainToken, HTTPError, BadRequest, ResponseError, ImproperlyConfigured, CircuitOpen,
+    DeadlineExceeded, truncate)
+from uz.client.hedging import hedge_policy as default_hedge_policy
+from uz.client.model import DATE_FMT, LazyTrain, Station, Coach
+from uz.client.ratelimit import endpoint_key, rate_limiter as default_rate_limiter
+from uz.client.retry import (
+    NOT_FAILURES, is_failure, retry_policy as default_retry_policy,
+    circuit_breakers as default_circuit_breakers)
+from uz.client.session import new_session
+from uz.client.tracing import tracer as default_tracer
+from uz.client.token import Token, TokenProvider
+from uz.client.utils import parse_gv_token_async, get_random_user_agent, read_token_script
+from uz.metrics import statsd
 
 
 logger = logging.getLogger('uz.client')
@@ -17,19 +28,29 @@ logger = logging.getLogger('uz.client')
 class UZClient(object):
 
     base_url = 'http://booking.uz.gov.ua/en'
+    # may be replaced with a faster decoder, e.g. ujson.loads
+    json_loads = staticmethod(json.loads)
 
-    def __init__(self, session=None, request_timeout=10):
+    def __init__(self, session=None, request_timeout=10, token_provider=None,
+                 station_cache=None, rate_limiter=None, retry_policy=None,
+                 circuit_breakers=None, hedge_policy=None, tracer=None):
         self._session = session
         self.request_timeout = request_timeout
 
-        self._token_lock = asyncio.Lock()
+        # clients sharing a session may share its token provider
+        self.token_provider = token_provider or TokenProvider(self)
+        self.station_cache = (
+            default_station_cache if station_cache is None else station_cache)
+        self.rate_limiter = rate_limiter or default_rate_limiter
+        self.retry_policy = retry_policy or default_retry_policy
+        self.circuit_breakers = circuit_breakers or default_circuit_breakers
+        self.hedge_policy = hedge_policy or default_hedge_policy
+        self.tracer = tracer or default_tracer
         self._token = None
-        self._token_date = 0
-        self._token_max_age = 600  # 10 minutes
         self._user_agent = None
 
     def __enter__(self):
-        self._session = aiohttp.ClientSession()
+        self._session = new_session()
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
@@ -47,30 +68,49 @@ class UZClient(object):
             self._user_agent = get_random_user_agent()
         return self._user_agent
 
-    def _is_token_outdated(self):
-        return (time.time() - self._token_date) > self._token_max_age
-
-    async def get_token(self):
-        if self._is_token_outdated():
-            async with self._token_lock:
-                if self._is_token_outdated():
-                    self._user_agent = None
-                    self.session.cookies.clear()
-                    headers = {'User-Agent': self.user_agent}
-                    page = await self.call('', raw=True, headers=headers)
-                    page = page.decode('utf-8')
-                    self._token = parse_gv_token(page)
-                    if self._token is None:
-                        raise FailedObtainToken(page)
-                    self._token_date = time.time()
-        return self._token
-
-    async def get_headers(self):
+    async def fetch_token(self):
+        """
+        Starts a new UZ session with a new user agent: the token comes along
+        with the session cookies, so it is fetched with the session using it
+        """
+        user_agent = get_random_user_agent()
+        self.session.cookies.clear()
+        headers = {'User-Agent': user_agent}
+        page = await self.call('', raw=True, headers=headers, reader=read_token_script)
+        page = page.decode('utf-8')
+        token = await parse_gv_token_async(page)
+        if token is None:
+            raise FailedObtainToken(truncate(page))
+        return Token(token, user_agent)
+
+    async def _get_token(self, deadline=None):
+        """
+        deadline limits the wait for a token being fetched
+        """
+        if deadline is None:
+            token = await self.token_provider.get()
+        else:
+            try:
+                token = await asyncio.wait_for(self.token_provider.get(), deadline.timeout())
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded('token', deadline.budget)
+        if token is not self._token:
+            # token is bound to the user agent it was issued for
+            self._token = token
+            self._user_agent = token.user_agent
+        return token
+
+    async def get_token(self, deadline=None):
+        return (await self._get_token(deadline)).value
+
+    async def get_headers(self, deadline=None):
+        # both come from the same token, it may be replaced while awaited
+        token = await self._get_token(deadline)
         return {
-            'User-Agent': self.user_agent,
+            'User-Agent': token.user_agent,
             'GV-Ajax': '1',
             'GV-Referer': self.base_url,
-            'GV-Token': await self.get_token()
+            'GV-Token': token.value
         }
 
     def uri(self, endpoint):
@@ -80,43 +120,129 @@ class UZClient(object):
         sid = self.session.cookies.get('_gv_sessid')
         return sid and sid.value
 
-    async def call(self, endpoint, method='POST', raw=False, *args, **kwargs):
-        if 'headers' not in kwargs:
-            kwargs['headers'] = await self.get_headers()
-
-        uri = self.uri(endpoint)
-        logger.debug('Fetching: %s', uri)
-        logger.debug('Headers: %s', kwargs['headers'])
-        logger.debug('Cookies: %s', self.session.cookies)
-
-        with aiohttp.Timeout(self.request_timeout):
-            async with self.session.request(
-                    method, uri, *args, **kwargs) as response:
-                body = await response.read()
-                if not response.status == 200:
-                    try:
-                        json = await response.json()
-                    except Exception:  # TODO: narrow exception
-                        json = None
-                    ex = BadRequest if response.status == 400 else HTTPError
-                    raise ex(response.status, body, kwargs.get('data'), json)
-                if raw:
-                    return body
-                json = await response.json()
-                if json.get('error'):
-                    raise ResponseError(response.status, body, kwargs.get('data'), json)
-                return json
+    async def call(self, endpoint, method='POST', raw=False, *args, deadline=None, reader=None,
+                   **kwargs):
+        """
+        deadline limits total time of the call, retries included.
+        reader(response) returns body instead of response.read(), e.g. a part of it.
+        """
+        key = endpoint_key(endpoint)
+        breaker = self.circuit_breakers[key]
+        attempt = 0
+        while True:
+            if deadline is not None:
+                deadline.check(key)
+            if not breaker.allow():
+                raise CircuitOpen(key, breaker.retry_in)
+            try:
+                result = await self.hedge_policy.call(key, lambda: self._call(
+                    endpoint, method, raw, *args, deadline=deadline, reader=reader, **kwargs))
+            except (asyncio.CancelledError, DeadlineExceeded):
+                raise
+            except Exception as ex:
+                if is_failure(ex):
+                    breaker.record(success=False)
+                elif isinstance(ex, NOT_FAILURES):
+                    # UZ handled the request
+                    breaker.record(success=True)
+                else:
+                    # raised before the request got to UZ, e.g. RateLimited
+                    breaker.release()
+                delay = self.retry_policy.backoff(key, ex, attempt)
+                if delay is None or deadline is not None and delay >= deadline.remaining:
+                    raise
+                attempt += 1
+                statsd.increment('client.retry', tags=['endpoint:{}'.format(key)])
+                await asyncio.sleep(delay)
+            else:
+                breaker.record(success=True)
+                return result
+
+    async def _call(self, endpoint, method, raw, *args, deadline=None, reader=None, **kwargs):
+        trace = self.tracer.start(endpoint_key(endpoint))
+        status = None
+        try:
+            if 'headers' not in kwargs:
+                kwargs['headers'] = await self.get_headers(deadline)
+            trace.mark('headers')
+
+            uri = self.uri(endpoint)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Fetching: %s', uri)
+                logger.debug('Headers: %s', kwargs['headers'])
+                logger.debug('Cookies: %s', self.session.cookies)
+
+            await self.rate_limiter.wait(endpoint)
+            trace.mark('wait')
+            timeout = self.request_timeout
+            if deadline is not None:
+                deadline.check(endpoint_key(endpoint))
+                timeout = deadline.timeout(timeout)
+            try:
+                with aiohttp.Timeout(timeout):
+                    async with self.session.request(
+                            method, uri, *args, **kwargs) as response:
+                        trace.mark('ttfb')
+                        status = response.status
+                        if reader is None:
+                            body = await response.read()
+                        else:
+                            body = await reader(response)
+                        trace.mark('body')
+            except asyncio.TimeoutError:
+                status = 'timeout'
+                if deadline is not None and deadline.expired:
+                    raise DeadlineExceeded(endpoint_key(endpoint), deadline.budget)
+                self.rate_limiter.report(endpoint, status=None)
+                raise
+            return self.handle_response(endpoint, status, body, raw, kwargs.get('data'))
+        finally:
+            trace.finish(status)
+
+    def parse_json(self, body):
+        body = body.strip()
+        if not body:
+            return None
+        return self.json_loads(body.decode('utf-8'))
+
+    def handle_response(self, endpoint, status, body, raw, data):
+        """
+        Body is read and parsed exactly once, whatever the outcome is
+        """
+        if not status == 200:
+            self.rate_limiter.report(endpoint, status)
+            try:
+                json = self.parse_json(body)
+            except ValueError:
+                json = None
+            ex = BadRequest if status == 400 else HTTPError
+            raise ex(status, body, data, json)
+        if raw:
+            self.rate_limiter.report(endpoint)
+            return body
+        json = self.parse_json(body)
+        self.rate_limiter.report(endpoint, error=bool(json.get('error')))
+        if json.get('error'):
+            raise ResponseError(status, body, data, json)
+        return json
 
     async def search_stations(self, name):
-        endpoint = 'purchase/station/{}/'.format(name)
-        result = await self.call(endpoint)
-        return [Station.from_dict(i) for i in result['value']]
+        stations = self.station_cache.get(name)
+        if stations is None:
+            endpoint = 'purchase/station/{}/'.format(name)
+            result = await self.call(endpoint)
+            stations = [Station.from_dict(i) for i in result['value']]
+            self.station_cache.set(name, stations)
+        return stations
 
     async def fetch_first_station(self, name):
         stations = await self.search_stations(name)
         return stations and stations[0] or None
 
-    async def list_trains(self, date, source_station, destination_station):
+    async def search_trains(self, date, source_station, destination_station, deadline=None):
+        """
+        Returns raw trains
+        """
         data = dict(
             station_id_from=source_station.id,
             station_id_till=destination_station.id,
@@ -125,16 +251,21 @@ class UZClient(object):
             time_dep_till='',
             another_ec=0,
             search='')
-        result = await self.call('purchase/search/', data=data)
-        return [Train.from_dict(i) for i in result['value']]
+        result = await self.call('purchase/search/', data=data, deadline=deadline)
+        return result['value']
+
+    async def list_trains(self, date, source_station, destination_station, deadline=None):
+        trains = await self.search_trains(date, source_station, destination_station, deadline)
+        return [LazyTrain(i) for i in trains]
 
-    async def fetch_train(self, date, source_station, destination_station, train_num):
-        trains = await self.list_trains(date, source_station, destination_station)
+    async def fetch_train(self, date, source_station, destination_station, train_num,
+                          deadline=None):
+        trains = await self.search_trains(date, source_station, destination_station, deadline)
         for train in trains:
-            if train.num == train_num:
-                return train
+            if train['num'] == train_num:
+                return LazyTrain(train)
 
-    async def list_coaches(self, train, coach_type):
+    async def list_coaches(self, train, coach_type, deadline=None):
         data = dict(
             station_id_from=train.source_station.id,
             station_id_till=train.destination_station.id,
@@ -145,10 +276,10 @@ class UZClient(object):
             another_ec=0,
             coach_type=coach_type.letter
         )
-        result = await self.call('purchase/coaches/', data=data)
+        result = await self.call('purchase/coaches/', data=data, deadline=deadline)
         return [Coach.from_dict(i) for i in result['coaches']]
 
-    async def list_seats(self, train, coach):
+    async def list_seats(self, train, coach, deadline=None):
         data = dict(
             station_id_from=train.source_station.id,
             station_id_till=train.destination_station.id,
@@ -158,10 +289,10 @@ class UZClient(object):
             coach_type_id=coach.type_id,
             date_dep=train.departure_time.timestamp
         )
-        result = await self.call('purchase/coach/', data=data)
+        result = await self.call('purchase/coach/', data=data, deadline=deadline)
         return set(chain(*result['value']['places'].values()))
 
-    async def book_seat(self, train, coach, seat, firstname, lastname):
+    async def book_seat(self, train, coach, seat, firstname, lastname, deadline=None):
         data = dict(
             code_station_from=train.source_station.id,
             code_station_to=train.destination_station.id,
@@ -184,5 +315,5 @@ class UZClient(object):
             reserve=0)
         for key, value in place.items():
             data['places[0][{}]'.format(key)] = value
-        result = await self.call('cart/add/', data=data)
+        result = await self.call('cart/add/', data=data, deadline=deadline)
         return result
@@ -0,0 +1,164 @@
+import asyncio
+import os
+import socket
+import time
+import weakref
+
+from uz.client.tracing import TracingConnector, tracer
+from uz.metrics import statsd
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+class ConnectorConfig(object):
+    """
+    Settings applied to every connector (hence every session) the project creates.
+    limit is the max number of concurrent connections per host, None is unlimited.
+    """
+
+    def __init__(self, limit=None, keepalive_timeout=30, conn_timeout=None,
+                 dns_cache=True, dns_ttl=300):
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self.conn_timeout = conn_timeout
+        self.dns_cache = dns_cache
+        self.dns_ttl = dns_ttl
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            limit=_env_int('UZ_CONN_LIMIT', None),
+            keepalive_timeout=_env_float('UZ_CONN_KEEPALIVE', 30),
+            conn_timeout=_env_float('UZ_CONN_TIMEOUT', None),
+            dns_cache=os.environ.get('UZ_DNS_CACHE', '1') not in ('0', 'false', 'no'),
+            dns_ttl=_env_float('UZ_DNS_TTL', 300))
+
+    def connector_kwargs(self):
+        return dict(
+            limit=self.limit,
+            keepalive_timeout=self.keepalive_timeout,
+            conn_timeout=self.conn_timeout)
+
+
+class DNSCache(object):
+    """
+    Resolved addresses shared by all connectors, so a new session
+    does not pay for a lookup. Concurrent lookups of a host are merged.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._hosts = {}
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._hosts)
+
+    def clear(self):
+        self._hosts.clear()
+
+    async def resolve(self, loop, host, port, family=0):
+        key = (host, port, family)
+        item = self._hosts.get(key)
+        if item is not None and item[0] > time.monotonic():
+            statsd.increment('client.dns_cache.hit')
+            return list(item[1])
+        statsd.increment('client.dns_cache.miss')
+        future = self._pending.get(key)
+        if future is None:
+            future = self._pending[key] = asyncio.ensure_future(
+                self._lookup(loop, host, port, family))
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+        return list(await asyncio.shield(future))
+
+    async def _lookup(self, loop, host, port, family):
+        infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM, family=family)
+        hosts = [
+            {'hostname': host, 'host': address[0], 'port': address[1],
+             'family': family, 'proto': proto, 'flags': socket.AI_NUMERICHOST}
+            for family, _, proto, _, address in infos]
+        self._hosts[(host, port, family)] = (time.monotonic() + self.ttl, hosts)
+        return hosts
+
+
+class UZConnector(TracingConnector):
+    """
+    TCP connector with the shared DNS cache, which counts
+    new and reused connections and may be inspected by connector_stats()
+    """
+
+    instances = weakref.WeakSet()
+
+    def __init__(self, *, dns_cache=None, **kwargs):
+        super().__init__(**kwargs)
+        self.dns_cache = dns_cache
+        self.instances.add(self)
+
+    async def _resolve_host(self, host, port):
+        if self.dns_cache is None:
+            return await super()._resolve_host(host, port)
+        if not tracer.enabled:
+            return await self.dns_cache.resolve(self._loop, host, port, self._family)
+        start = time.monotonic()
+        result = await self.dns_cache.resolve(self._loop, host, port, self._family)
+        statsd.histogram('client.request.dns', time.monotonic() - start,
+                         tags=['host:{}'.format(host)])
+        return result
+
+    def _get(self, key):
+        # not called by aiohttp other than 0.21, nothing is counted then
+        transport, proto = super()._get(key)
+        statsd.increment('client.connector.{}'.format('new' if transport is None else 'reused'))
+        return transport, proto
+
+    def stats(self):
+        """
+        Reads connection pool internals of aiohttp 0.21 (pinned in requirements.txt),
+        None if this aiohttp version has them changed
+        """
+        try:
+            acquired, conns, waiters = self._acquired, self._conns, self._waiters
+            return dict(
+                acquired=sum(len(i) for i in acquired.values()),
+                idle=sum(len(i) for i in conns.values()),
+                waiting=sum(1 for i in waiters.values() for f in i if not f.done()),
+                capacity=self._limit * max(len(acquired), 1) if self._limit else 0)
+        except (AttributeError, TypeError):
+            return None
+
+
+def connector_stats():
+    """
+    Totals over all live connectors
+    """
+    result = dict(connectors=0, acquired=0, idle=0, waiting=0, capacity=0)
+    for connector in list(UZConnector.instances):
+        if connector.closed:
+            continue
+        result['connectors'] += 1
+        for key, value in (connector.stats() or {}).items():
+            result[key] += value
+    return result
+
+
+def report_connector_stats():
+    stats = connector_stats()
+    for key in ('connectors', 'acquired', 'idle', 'waiting'):
+        statsd.gauge('client.connector.{}'.format(key), stats[key])
+    if stats['capacity']:
+        statsd.gauge('client.connector.utilization', stats['acquired'] / stats['capacity'])
+    return stats
+
+
+def make_connector(config, dns_cache, **overrides):
+    kwargs = config.connector_kwargs()
+    kwargs.update(overrides)
+    return UZConnector(dns_cache=dns_cache if config.dns_cache else None, **kwargs)
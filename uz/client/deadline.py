@@ -0,0 +1,31 @@
+import time
+
+from uz.client.exceptions import DeadlineExceeded
+
+
+class Deadline(object):
+    """
+    Time budget shared by all requests of a single unit of work (e.g. a scan),
+    so every request only gets the time that remains
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.expires = time.monotonic() + budget
+
+    @property
+    def remaining(self):
+        return max(0, self.expires - time.monotonic())
+
+    @property
+    def expired(self):
+        return time.monotonic() >= self.expires
+
+    def timeout(self, timeout=None):
+        if timeout is None:
+            return self.remaining
+        return min(timeout, self.remaining)
+
+    def check(self, stage):
+        if self.expired:
+            raise DeadlineExceeded(stage, self.budget)
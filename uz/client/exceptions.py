@@ -1,3 +1,10 @@
+MAX_BODY_LENGTH = 1024
+
+
+def truncate(body, length=MAX_BODY_LENGTH):
+    return body[:length]
+
+
 class UZException(Exception):
     pass
 
@@ -10,7 +17,7 @@ class HTTPError(UZException):
 
     def __init__(self, status_code, body, data=None, json=None):
         self.status_code = status_code
-        self.body = body
+        self.body = body = truncate(body)
         self.data = data
         self.json = json
         super().__init__(
@@ -28,3 +35,33 @@ class ResponseError(HTTPError):
 
 class ImproperlyConfigured(UZException):
     pass
+
+
+class RateLimited(UZException):
+
+    def __init__(self, endpoint, retry_in):
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+        super().__init__(
+            'endpoint {} is rate limited, wait {:.1f}s'.format(endpoint, retry_in))
+
+
+class CircuitOpen(UZException):
+
+    def __init__(self, endpoint, retry_in):
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+        super().__init__(
+            'endpoint {} is unavailable, retry in {:.0f}s'.format(endpoint, retry_in))
+
+
+class CassetteError(UZException):
+    pass
+
+
+class DeadlineExceeded(UZException):
+
+    def __init__(self, stage, budget):
+        self.stage = stage
+        self.budget = budget
+        super().__init__('scan did not complete in {:.0f}s, stuck at {}'.format(budget, stage))
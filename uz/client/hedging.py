@@ -0,0 +1,133 @@
+import asyncio
+import os
+from collections import deque
+
+from uz.metrics import statsd
+
+
+class LatencyWindow(object):
+    """
+    Latencies of the last `size` successful requests to an endpoint.
+    Percentile is recomputed every `refresh` observations only.
+    """
+
+    def __init__(self, size=200, refresh=20):
+        self.samples = deque(maxlen=size)
+        self.refresh = refresh
+        self._since_refresh = 0
+        self._sorted = []
+
+    def __len__(self):
+        return len(self.samples)
+
+    def observe(self, latency):
+        self.samples.append(latency)
+        self._since_refresh += 1
+
+    def percentile(self, p):
+        if self._since_refresh >= self.refresh or not self._sorted:
+            self._sorted = sorted(self.samples)
+            self._since_refresh = 0
+        if not self._sorted:
+            return None
+        return self._sorted[min(len(self._sorted) - 1, int(len(self._sorted) * p / 100))]
+
+
+class HedgePolicy(object):
+    """
+    Sends a duplicate of an idempotent request which did not respond within
+    the `percentile` of recent latency of its endpoint; the first response wins.
+    Hedges are limited to `budget` share of requests and `max_inflight` at a time.
+    """
+
+    endpoints = ('purchase/search', 'purchase/station', 'purchase/coaches', 'purchase/coach')
+
+    def __init__(self, enabled=False, percentile=95, min_delay=0.05, max_delay=2,
+                 min_samples=20, budget=0.1, max_inflight=10):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.budget = budget
+        self.max_inflight = max_inflight
+        self.inflight = 0
+        self._credit = 0
+        self._windows = {}
+
+    def applies(self, key):
+        return self.enabled and key in self.endpoints
+
+    def window(self, key):
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = LatencyWindow()
+        return window
+
+    def observe(self, key, latency):
+        self.window(key).observe(latency)
+
+    def delay(self, key):
+        """
+        Returns time to wait before hedging or None if there is not enough data yet
+        """
+        window = self.window(key)
+        self._credit = min(self._credit + self.budget, self.max_inflight)
+        if len(window) < self.min_samples:
+            return
+        delay = window.percentile(self.percentile)
+        return min(self.max_delay, max(self.min_delay, delay))
+
+    def acquire(self):
+        if self._credit < 1 or self.inflight >= self.max_inflight:
+            return False
+        self._credit -= 1
+        self.inflight += 1
+        return True
+
+    def release(self):
+        self.inflight -= 1
+
+    async def call(self, key, make_call):
+        """
+        make_call() returns a new coroutine sending the request
+        """
+        if not self.applies(key):
+            return await make_call()
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        primary = asyncio.ensure_future(make_call())
+        delay = self.delay(key)
+        if delay is not None:
+            try:
+                await asyncio.wait([primary], timeout=delay)
+            except asyncio.CancelledError:
+                primary.cancel()
+                raise
+        if primary.done() or delay is None or not self.acquire():
+            result = await primary
+            self.observe(key, loop.time() - start)
+            return result
+
+        tags = ['endpoint:{}'.format(key)]
+        statsd.increment('client.hedge.fired', tags=tags)
+        hedge = asyncio.ensure_future(make_call())
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.observe(key, loop.time() - start)
+                        if task is hedge:
+                            statsd.increment('client.hedge.won', tags=tags)
+                        return task.result()
+            return primary.result()  # both failed
+        finally:
+            self.release()
+            for task in (primary, hedge):
+                task.cancel()
+
+
+hedge_policy = HedgePolicy(enabled=bool(os.environ.get('UZ_HEDGING')))
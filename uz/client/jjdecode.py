@@ -1,17 +1,53 @@
-#!/usr/bin/env python
-#
-# https://github.com/crackinglandia/python-jjdecoder
-#
-# Python version of the jjdecode function written by Syed Zainudeen
-# http://csc.cs.utm.my/syed/images/files/jjdecode/jjdecode.html
-#
-# +NCR/CRC! [ReVeRsEr] - crackinglandia@gmail.com
-# Thanks to Jose Miguel Esparza (@EternalTodo) for the final push to make it work!
-#
+"""
+Single pass decoder of jjencode'd javascript
+(http://utf-8.jp/public/jjencode.html).
+
+Output is the same as of the python-jjdecoder port by +NCR/CRC! [ReVeRsEr]
+(https://github.com/crackinglandia/python-jjdecoder), quirks included,
+but the payload is scanned with a cursor instead of being re-sliced
+after every token, so decoding is linear in its size.
+"""
+import re
+from functools import lru_cache
 
-# flake8: noqa
 
-import re
+# hex digits are encoded as $.___+ (0) ... $.$$$$+ (f)
+DIGIT_CODES = [
+    '___', '__$', '_$_', '_$$', '$__', '$_$', '$$_', '$$$',
+    '$___', '$__$', '$_$_', '$_$$', '$$__', '$$_$', '$$$_', '$$$$']
+DIGITS = {code: i for i, code in enumerate(DIGIT_CODES)}
+# no code is a prefix of another one followed by +, so the order does not matter
+DIGIT_REGEX = r'({})\+'.format('|'.join(re.escape(i) for i in DIGIT_CODES))
+DIGIT_PATTERN = re.compile(DIGIT_REGEX)
+
+QUOTE = '\\\\\\"'
+SLASH = '\\\\\\\\'
+LOWER = '\\\\"+'  # octal escape, char < 128
+STRING_END = '"+'
+# punctuation is kept as is, except of " and \ which may start an escape
+LITERAL_PATTERN = re.compile(r'[\x21\x23-\x2f\x3a-\x40\x5b\x5d-\x60\x7b-\x7f]+')
+
+
+def letter_prefixes(gv):
+    return (
+        ('(![]+"")[' + gv + '._$_]+', 'l'),
+        (gv + '._$+', 'o'),
+        (gv + '.__+', 't'),
+        (gv + '._+', 'u'))
+
+
+@lru_cache(maxsize=16)
+def token_pattern(gv):
+    """
+    Groups 1-4: letters, 5-6: hex digit, 7: start of a string
+    """
+    return re.compile('|'.join(
+        ['({})'.format(re.escape(prefix)) for prefix, _ in letter_prefixes(gv)] +
+        ['({})(?:{})?'.format(re.escape(gv + '.'), DIGIT_REGEX), '(")']))
+
+
+def is_punctuation(n):
+    return 0x21 <= n <= 0x2f or 0x3a <= n <= 0x40 or 0x5b <= n <= 0x60 or 0x7b <= n <= 0x7f
 
 
 class JJDecoder(object):
@@ -20,294 +56,176 @@ class JJDecoder(object):
         self.encoded_str = jj_encoded_data
 
     def clean(self):
-        return re.sub('^\s+|\s+$', '', self.encoded_str)
+        return self.encoded_str.strip()
 
     def checkPalindrome(self, Str):
-        startpos = -1
-        endpos = -1
-        gv, gvl = -1, -1
-
         index = Str.find('"\'\\"+\'+",')
-
         if index == 0:
             startpos = Str.find('$$+"\\""+') + 8
-            endpos = Str.find('"\\"")())()')
-            gv = Str[Str.find('"\'\\"+\'+",') + 9:Str.find('=~[]')]
-            gvl = len(gv)
+            gv = Str[index + 9:Str.find('=~[]')]
         else:
-            gv = Str[0:Str.find('=')]
-            gvl = len(gv)
             startpos = Str.find('"\\""+') + 5
-            endpos = Str.find('"\\"")())()')
-
-        return (startpos, endpos, gv, gvl)
+            gv = Str[0:Str.find('=')]
+        endpos = Str.find('"\\"")())()')
+        return startpos, endpos, gv, len(gv)
 
     def decode(self):
-
         self.encoded_str = self.clean()
-        startpos, endpos, gv, gvl = self.checkPalindrome(self.encoded_str)
-
+        startpos, endpos, gv, _ = self.checkPalindrome(self.encoded_str)
         if startpos == endpos:
             raise Exception('No data!')
+        return _Decoder(self.encoded_str[startpos:endpos], gv).decode()
+
+
+class _Decoder(object):
+
+    def __init__(self, data, gv):
+        self.data = data
+        self.pos = 0
+        self.gvsig = gv + '.'
+        self.upper = LOWER + gv + '._+'  # hex escape, char >= 128
+        self.letters = letter_prefixes(gv)
+        self.token_pattern = token_pattern(gv)
+
+    def skip(self, prefix):
+        if self.data.startswith(prefix, self.pos):
+            self.pos += len(prefix)
+            return True
+        return False
+
+    def letter(self):
+        for prefix, letter in self.letters:
+            if self.skip(prefix):
+                return letter
+
+    def digit(self, pos, base=16):
+        """
+        Returns (digit, end) of the digit at pos or (None, pos)
+        """
+        match = DIGIT_PATTERN.match(self.data, pos)
+        if match is not None:
+            digit = DIGITS[match.group(1)]
+            if digit < base:
+                return digit, match.end()
+        return None, pos
+
+    def hex_digit(self):
+        digit, self.pos = self.digit(self.pos)
+        return digit
 
-        data = self.encoded_str[startpos:endpos]
-
-        b = ['___+', '__$+', '_$_+', '_$$+', '$__+', '$_$+', '$$_+', '$$$+',
-             '$___+', '$__$+', '$_$_+', '$_$$+', '$$__+', '$$_$+', '$$$_+', '$$$$+']
-
-        str_l = '(![]+"")[' + gv + '._$_]+'
-        str_o = gv + '._$+'
-        str_t = gv + '.__+'
-        str_u = gv + '._+'
-
-        str_hex = gv + '.'
-
-        str_s = '"'
-        gvsig = gv + '.'
-
-        str_quote = '\\\\\\"'
-        str_slash = '\\\\\\\\'
-
-        str_lower = '\\\\"+'
-        str_upper = '\\\\"+' + gv + '._+'
-
-        str_end = '"+'
-
-        out = ''
-        while data != '':
-            # l o t u
-            if data.find(str_l) == 0:
-                data = data[len(str_l):]
-                out += 'l'
-                continue
-            elif data.find(str_o) == 0:
-                data = data[len(str_o):]
-                out += 'o'
-                continue
-            elif data.find(str_t) == 0:
-                data = data[len(str_t):]
-                out += 't'
+    def decode(self):
+        out = []
+        data = self.data
+        length = len(data)
+        match_token = self.token_pattern.match
+        letters = [letter for _, letter in self.letters]
+        while self.pos < length:
+            token = match_token(data, self.pos)
+            if token is None:
+                break
+            self.pos = token.end()
+            group = token.lastindex
+            if group <= 4:
+                out.append(letters[group - 1])
                 continue
-            elif data.find(str_u) == 0:
-                data = data[len(str_u):]
-                out += 'u'
+            if group == 6:
+                out.append('%x' % DIGITS[token.group(6)])
+            if group <= 6:
                 continue
 
-            # 0123456789abcdef
-            if data.find(str_hex) == 0:
-                data = data[len(str_hex):]
-
-                for i in range(len(b)):
-                    if data.find(b[i]) == 0:
-                        data = data[len(b[i]):]
-                        out += '%x' % i
-                        break
+            if self.skip(self.upper):
+                out.append(self.short_hex_char())
+            elif self.skip(LOWER):
+                out.append(self.octal_char(stop_after_hex=True))
+            else:
+                self.string(out)
+        return ''.join(out)
+
+    def short_hex_char(self):
+        ch_str = ''
+        for _ in range(2):
+            if not self.skip(self.gvsig):
+                break
+            digit = self.hex_digit()
+            if digit is not None:
+                ch_str = '%x' % digit  # sic, the last digit only
+        return chr(int(ch_str, 16))
+
+    def long_hex_char(self):
+        ch_str = ''
+        for j in range(10):
+            if j > 1 and self.letter() is not None:
+                break  # sic, the letter is lost
+            if not self.skip(self.gvsig):
+                break
+            digit = self.hex_digit()
+            if digit is not None:
+                ch_str += '%x' % digit
+        return chr(int(ch_str, 16))
+
+    def octal_char(self, stop_after_hex):
+        ch_str = ''
+        ch_lotux = ''
+        too_big = False
+        for j in range(3):
+            if j > 1:
+                letter = self.letter()
+                if letter is not None:
+                    ch_lotux = letter
+                    break
+            if not self.data.startswith(self.gvsig, self.pos):
+                break
+            digit, end = self.digit(self.pos + len(self.gvsig), base=8)
+            if digit is not None:
+                if int(ch_str + str(digit), 8) > 128:
+                    too_big = True
+                else:
+                    ch_str += str(digit)
+                    self.pos = end
+            if too_big and self.skip(self.gvsig):
+                digit = self.hex_digit()
+                if digit is not None:
+                    ch_lotux = '%x' % digit
+                if stop_after_hex:
+                    break
+        return chr(int(ch_str, 8)) + ch_lotux
+
+    def string(self, out):
+        """
+        Literal chars, closed by "+ or an escaped char
+        """
+        data = self.data
+        match_literal = LITERAL_PATTERN.match
+        match = 0
+        while True:
+            n = ord(data[self.pos])
+            literal = match_literal(data, self.pos)
+            if literal is not None:
+                out.append(literal.group())
+                self.pos = literal.end()
+                match += 1
                 continue
-
-            # start of s block
-            if data.find(str_s) == 0:
-                data = data[len(str_s):]
-
-                # check if "R
-                if data.find(str_upper) == 0:  # r4 n >= 128
-                    data = data[len(str_upper):]  # skip sig
-                    ch_str = ''
-                    for i in range(2):  # shouldn't be more than 2 hex chars
-                        # gv + "."+b[ c ]
-                        if data.find(gvsig) == 0:
-                            data = data[len(gvsig):]
-                            for k in range(len(b)):  # for every entry in b
-                                if data.find(b[k]) == 0:
-                                    data = data[len(b[k]):]
-                                    ch_str = '%x' % k
-                                    break
-                        else:
-                            break
-
-                    out += chr(int(ch_str, 16))
-                    continue
-
-                elif data.find(str_lower) == 0:  # r3 check if "R // n < 128
-                    data = data[len(str_lower):]  # skip sig
-
-                    ch_str = ''
-                    ch_lotux = ''
-                    temp = ''
-                    b_checkR1 = 0
-                    for j in range(3):  # shouldn't be more than 3 octal chars
-                        if j > 1:  # lotu check
-                            if data.find(str_l) == 0:
-                                data = data[len(str_l):]
-                                ch_lotux = 'l'
-                                break
-                            elif data.find(str_o) == 0:
-                                data = data[len(str_o):]
-                                ch_lotux = 'o'
-                                break
-                            elif data.find(str_t) == 0:
-                                data = data[len(str_t):]
-                                ch_lotux = 't'
-                                break
-                            elif data.find(str_u) == 0:
-                                data = data[len(str_u):]
-                                ch_lotux = 'u'
-                                break
-
-                        # gv + "."+b[ c ]
-                        if data.find(gvsig) == 0:
-                            temp = data[len(gvsig):]
-                            for k in range(8):  # for every entry in b octal
-                                if temp.find(b[k]) == 0:
-                                    if int(ch_str + str(k), 8) > 128:
-                                        b_checkR1 = 1
-                                        break
-
-                                    ch_str += str(k)
-                                    data = data[len(gvsig):]  # skip gvsig
-                                    data = data[len(b[k]):]
-                                    break
-
-                            if b_checkR1 == 1:
-                                if data.find(str_hex) == 0:  # 0123456789abcdef
-                                    data = data[len(str_hex):]
-                                    # check every element of hex decode string for a match
-                                    for i in range(len(b)):
-                                        if data.find(b[i]) == 0:
-                                            data = data[len(b[i]):]
-                                            ch_lotux = '%x' % i
-                                            break
-                                    break
-                        else:
-                            break
-
-                    out += chr(int(ch_str, 8)) + ch_lotux
-                    continue
-
-                else:  # "S ----> "SR or "S+
-                    # if there is, loop s until R 0r +
-                    # if there is no matching s block, throw error
-
-                    match = 0
-                    n = None
-
-                    # searching for matching pure s block
-                    while True:
-                        n = ord(data[0])
-                        if data.find(str_quote) == 0:
-                            data = data[len(str_quote):]
-                            out += '"'
-                            match += 1
-                            continue
-                        elif data.find(str_slash) == 0:
-                            data = data[len(str_slash):]
-                            out += '\\'
-                            match += 1
-                            continue
-                        elif data.find(str_end) == 0:  # reached end off S block ? +
-                            if match == 0:
-                                raise '+ no match S block: ' + data
-                            data = data[len(str_end):]
-                            break  # step out of the while loop
-                        elif data.find(str_upper) == 0:  # r4 reached end off S block ? - check if "R n >= 128
-                            if match == 0:
-                                raise 'no match S block n>128: ' + data
-                            data = data[len(str_upper):]  # skip sig
-
-                            ch_str = ''
-                            ch_lotux = ''
-
-                            for j in range(10):  # shouldn't be more than 10 hex chars
-                                if j > 1:  # lotu check
-                                    if data.find(str_l) == 0:
-                                        data = data[len(str_l):]
-                                        ch_lotux = 'l'
-                                        break
-                                    elif data.find(str_o) == 0:
-                                        data = data[len(str_o):]
-                                        ch_lotux = 'o'
-                                        break
-                                    elif data.find(str_t) == 0:
-                                        data = data[len(str_t):]
-                                        ch_lotux = 't'
-                                        break
-                                    elif data.find(str_u) == 0:
-                                        data = data[len(str_u):]
-                                        ch_lotux = 'u'
-                                        break
-
-                                # gv + "."+b[ c ]
-                                if data.find(gvsig) == 0:
-                                    data = data[len(gvsig):]  # skip gvsig
-                                    for k in range(len(b)):  # for every entry in b
-                                        if data.find(b[k]) == 0:
-                                            data = data[len(b[k]):]
-                                            ch_str += '%x' % k
-                                            break
-                                else:
-                                    break  # done
-                            out += chr(int(ch_str, 16))
-                            break  # step out of the while loop
-                        elif data.find(str_lower) == 0:  # r3 check if "R // n < 128
-                            if match == 0:
-                                raise 'no match S block n<128: ' + data
-
-                            data = data[len(str_lower):]  # skip sig
-
-                            ch_str = ''
-                            ch_lotux = ''
-                            temp = ''
-                            b_checkR1 = 0
-
-                            for j in range(3):  # shouldn't be more than 3 octal chars
-                                if j > 1:  # lotu check
-                                    if data.find(str_l) == 0:
-                                        data = data[len(str_l):]
-                                        ch_lotux = 'l'
-                                        break
-                                    elif data.find(str_o) == 0:
-                                        data = data[len(str_o):]
-                                        ch_lotux = 'o'
-                                        break
-                                    elif data.find(str_t) == 0:
-                                        data = data[len(str_t):]
-                                        ch_lotux = 't'
-                                        break
-                                    elif data.find(str_u) == 0:
-                                        data = data[len(str_u):]
-                                        ch_lotux = 'u'
-                                        break
-
-                                # gv + "."+b[ c ]
-                                if data.find(gvsig) == 0:
-                                    temp = data[len(gvsig):]
-                                    for k in range(8):  # for every entry in b octal
-                                        if temp.find(b[k]) == 0:
-                                            if int(ch_str + str(k), 8) > 128:
-                                                b_checkR1 = 1
-                                                break
-
-                                            ch_str += str(k)
-                                            data = data[len(gvsig):]  # skip gvsig
-                                            data = data[len(b[k]):]
-                                            break
-
-                                    if b_checkR1 == 1:
-                                        if data.find(str_hex) == 0:  # 0123456789abcdef
-                                            data = data[len(str_hex):]
-                                            # check every element of hex decode string for a match
-                                            for i in range(len(b)):
-                                                if data.find(b[i]) == 0:
-                                                    data = data[len(b[i]):]
-                                                    ch_lotux = '%x' % i
-                                                    break
-                                else:
-                                    break
-                            out += chr(int(ch_str, 8)) + ch_lotux
-                            break  # step out of the while loop
-                        elif (0x21 <= n and n <= 0x2f) or (0x3A <= n and n <= 0x40) or (0x5b <= n and n <= 0x60) or (0x7b <= n and n <= 0x7f):
-                            out += data[0]
-                            data = data[1:]
-                            match += 1
-                    continue
-            break
-        return out
+            if self.skip(QUOTE):
+                out.append('"')
+            elif self.skip(SLASH):
+                out.append('\\')
+            elif self.skip(STRING_END):
+                if match == 0:
+                    raise Exception('+ no match S block: ' + data[self.pos:])
+                return
+            elif self.skip(self.upper):
+                if match == 0:
+                    raise Exception('no match S block n>128: ' + data[self.pos:])
+                out.append(self.long_hex_char())
+                return
+            elif self.skip(LOWER):
+                if match == 0:
+                    raise Exception('no match S block n<128: ' + data[self.pos:])
+                out.append(self.octal_char(stop_after_hex=False))
+                return
+            elif is_punctuation(n):
+                out.append(data[self.pos])
+                self.pos += 1
+            else:
+                raise Exception('unexpected char in S block: ' + data[self.pos:])
+            match += 1
@@ -4,7 +4,29 @@ from datetime import datetime
 DATE_FMT = '%m.%d.%Y'
 
 
-class Train(object):
+class Model(object):
+    """
+    Compared by key() subclasses define and hashed by hash_key(),
+    which must be a part of key() made of hashable fields
+    """
+    __slots__ = ()
+
+    def hash_key(self):
+        return self.key()
+
+    def __eq__(self, other):
+        if not (isinstance(other, self.__class__) or isinstance(self, other.__class__)):
+            return NotImplemented
+        return self is other or self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.hash_key())
+
+
+class Train(Model):
+    __slots__ = ('category', 'model', 'num', 'travel_time', 'coach_types',
+                 'source_station', 'destination_station', 'departure_time',
+                 'arrival_time')
 
     def __init__(self, category, model, num, travel_time, coach_types,
                  source_station, destination_station, departure_time,
@@ -38,8 +60,13 @@ class Train(object):
             self.destination_station,
             self.departure_time)
 
-    def __eq__(self, other):
-        return self.to_dict() == other.to_dict()
+    def key(self):
+        return (self.num, self.departure_time, self.arrival_time, self.category,
+                self.model, self.travel_time, self.source_station,
+                self.destination_station, self.coach_types)
+
+    def hash_key(self):
+        return self.num, self.departure_time
 
     def info(self):
         parts = [(
@@ -58,19 +85,19 @@ class Train(object):
 
     @classmethod
     def from_dict(cls, dikt):
+        source = dikt['from']
+        destination = dikt['till']
+        coach_type = CoachType.from_dict
         return cls(
-            category=dikt['category'],
-            model=dikt['model'],
-            num=dikt['num'],
-            travel_time=dikt['travel_time'],
-            coach_types=[CoachType.from_dict(i) for i in dikt['types']],
-            source_station=Station(dikt['from']['station_id'],
-                                   dikt['from']['station']),
-            destination_station=Station(dikt['till']['station_id'],
-                                        dikt['till']['station']),
-            departure_time=UZTimestamp.from_dict(dikt['from']),
-            arrival_time=UZTimestamp.from_dict(dikt['till'])
-        )
+            dikt['category'],
+            dikt['model'],
+            dikt['num'],
+            dikt['travel_time'],
+            [coach_type(i) for i in dikt['types']],
+            stations.get(source['station_id'], source['station']),
+            stations.get(destination['station_id'], destination['station']),
+            UZTimestamp(source['date'], source['src_date']),
+            UZTimestamp(destination['date'], destination['src_date']))
 
     @staticmethod
     def _station_point(uztimestamp, station):
@@ -94,7 +121,8 @@ class Train(object):
         return result
 
 
-class CoachType(object):
+class CoachType(Model):
+    __slots__ = ('letter', 'places', 'title')
 
     def __init__(self, letter, places, title):
         self.letter = letter
@@ -107,12 +135,16 @@ class CoachType(object):
     def __str__(self):
         return '%s: %s (%s)' % (self.letter, self.places, self.title)
 
-    def __eq__(self, other):
-        return self.to_dict() == other.to_dict()
+    def key(self):
+        return self.letter, self.places, self.title
+
+    def hash_key(self):
+        # places change from one search to another, the coach type does not
+        return self.letter
 
     @classmethod
     def from_dict(cls, dikt):
-        return cls(*(dikt[i] for i in ('letter', 'places', 'title')))
+        return cls(dikt['letter'], dikt['places'], dikt['title'])
 
     def to_dict(self):
         return dict(
@@ -121,7 +153,9 @@ class CoachType(object):
             title=self.title)
 
 
-class Coach(object):
+class Coach(Model):
+    __slots__ = ('allow_bonus', 'klass', 'type_id', 'has_bedding', 'num',
+                 'places_cnt', 'prices', 'reserve_price', 'services')
 
     def __init__(self, allow_bonus, klass, type_id, has_bedding, num,
                  places_cnt, prices, reserve_price, services):
@@ -150,21 +184,25 @@ class Coach(object):
     def __str__(self):
         return 'Coach %s' % self.num
 
-    def __eq__(self, other):
-        return self.to_dict() == other.to_dict()
+    def key(self):
+        return (self.num, self.type_id, self.klass, self.places_cnt, self.allow_bonus,
+                self.has_bedding, self.reserve_price, self.prices, self.services)
+
+    def hash_key(self):
+        return self.num, self.type_id, self.klass
 
     @classmethod
     def from_dict(cls, dikt):
         return cls(
-            allow_bonus=dikt['allow_bonus'],
-            klass=dikt['coach_class'],
-            type_id=dikt['coach_type_id'],
-            has_bedding=dikt['has_bedding'],
-            num=dikt['num'],
-            places_cnt=dikt['places_cnt'],
-            prices=dikt['prices'],
-            reserve_price=dikt['reserve_price'],
-            services=dikt['services'])
+            dikt['allow_bonus'],
+            dikt['coach_class'],
+            dikt['coach_type_id'],
+            dikt['has_bedding'],
+            dikt['num'],
+            dikt['places_cnt'],
+            dikt['prices'],
+            dikt['reserve_price'],
+            dikt['services'])
 
     def to_dict(self):
         return dict(
@@ -179,7 +217,8 @@ class Coach(object):
             services=self.services)
 
 
-class Station(object):
+class Station(Model):
+    __slots__ = ('id', 'title')
 
     def __init__(self, id, title):
         self.id = id
@@ -191,12 +230,12 @@ class Station(object):
     def __str__(self):
         return self.title
 
-    def __eq__(self, other):
-        return self.id == other.id
+    def key(self):
+        return self.id
 
     @classmethod
     def from_dict(cls, dikt):
-        return cls(dikt['station_id'], dikt['title'])
+        return stations.get(dikt['station_id'], dikt['title'])
 
     def to_dict(self):
         return dict(
@@ -204,15 +243,59 @@ class Station(object):
             title=self.title)
 
 
-class UZTimestamp(object):
+class StationRegistry(object):
+    """
+    Interns stations by id, so all results mentioning a station share
+    one object: search results and station lookups may spell the title
+    differently, the first one seen is kept. Ids come as ints or strings,
+    they are kept as ints. There are a few thousand stations,
+    they are kept forever.
+    """
+
+    def __init__(self):
+        self._stations = {}
+
+    def __len__(self):
+        return len(self._stations)
+
+    def clear(self):
+        self._stations.clear()
+
+    @staticmethod
+    def normalize(id):
+        try:
+            return int(id)
+        except (TypeError, ValueError):
+            return id
+
+    def get(self, id, title):
+        key = self.normalize(id)
+        try:
+            return self._stations[key]
+        except KeyError:
+            station = self._stations[key] = Station(key, title)
+            return station
+
+
+stations = StationRegistry()
+
+
+class UZTimestamp(Model):
     """
     src_date != datetime.strftime()
     """
+    __slots__ = ('timestamp', 'str_date', '_datetime')
 
     def __init__(self, timestamp, str_date):
         self.timestamp = timestamp
         self.str_date = str_date
-        self.datetime = datetime.fromtimestamp(timestamp)
+        self._datetime = None
+
+    @property
+    def datetime(self):
+        if self._datetime is None:
+            self._datetime = datetime.fromtimestamp(self.timestamp)
+        return self._datetime
 
     def __repr__(self):
         return 'UZTimestamp(%r, %r)' % (self.timestamp, self.str_date)
@@ -220,8 +303,8 @@ class UZTimestamp(object):
     def __str__(self):
         return self.str_date
 
-    def __eq__(self, other):
-        return self.timestamp == other.timestamp
+    def key(self):
+        return self.timestamp
 
     @classmethod
     def from_dict(cls, dikt):
@@ -232,3 +315,49 @@ class UZTimestamp(object):
             date=self.timestamp,
             src_date=self.str_date
         )
+
+
+class lazy(object):
+    """
+    Field parsed from the raw item on first access,
+    then read from the instance dict
+    """
+
+    def __init__(self, name, key, parse):
+        self.name = name
+        self.key = key
+        self.parse = parse
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = instance.__dict__[self.name] = self.parse(instance.raw[self.key])
+        return value
+
+
+def _station(point):
+    return stations.get(point['station_id'], point['station'])
+
+
+def _coach_types(types):
+    return [CoachType.from_dict(i) for i in types]
+
+
+class LazyTrain(Train):
+    """
+    Train over a raw purchase/search/ item, nested fields are parsed when read
+    """
+    __slots__ = ('raw', '__dict__')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.category = raw['category']
+        self.model = raw['model']
+        self.num = raw['num']
+        self.travel_time = raw['travel_time']
+
+    coach_types = lazy('coach_types', 'types', _coach_types)
+    source_station = lazy('source_station', 'from', _station)
+    destination_station = lazy('destination_station', 'till', _station)
+    departure_time = lazy('departure_time', 'from', UZTimestamp.from_dict)
+    arrival_time = lazy('arrival_time', 'till', UZTimestamp.from_dict)
@@ -0,0 +1,321 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from uz.client.client import UZClient
+from uz.client.session import new_session
+from uz.client.token import TokenProvider
+from uz.metrics import statsd
+
+
+logger = logging.getLogger('uz.client')
+
+
+def refresh_expiring(clients):
+    """
+    Starts background refreshes of tokens about to expire.
+    Clients must be idle: a refresh replaces cookies of their sessions.
+    """
+    for client in clients:
+        if client.token_provider.needs_refresh():
+            client.token_provider.start_refresh()
+
+
+class ClientPool(object):
+    """
+    Fixed size pool of UZClient instances with long living sessions.
+    Clients are checked out for a single unit of work and returned back:
+
+        async with pool.client() as uz:
+            await uz.list_trains(...)
+
+    Every client has a token of its own session, run() refreshes tokens
+    of idle clients before they expire.
+    """
+
+    def __init__(self, size=4, connector_limit=10, keepalive_timeout=30,
+                 name='client.pool'):
+        self.size = size
+        self.connector_limit = connector_limit
+        self.keepalive_timeout = keepalive_timeout
+        self.name = name
+        self._clients = []
+        self._queue = None
+        self._leased = set()
+        self._running = False
+
+    def make_session(self):
+        return new_session(
+            limit=self.connector_limit, keepalive_timeout=self.keepalive_timeout)
+
+    def make_client(self):
+        return UZClient(self.make_session())
+
+    def _ensure_clients(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            for _ in range(self.size):
+                client = self.make_client()
+                self._clients.append(client)
+                self._queue.put_nowait(client)
+
+    async def start(self):
+        """
+        Creates clients and obtains token upfront,
+        so the first command does not pay for it
+        """
+        self._ensure_clients()
+        results = await asyncio.gather(
+            *(i.get_token() for i in self._clients), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning('Failed to warm up client: %r', result)
+
+    async def run(self, check_interval=1):
+        self._running = True
+        while self._running:
+            refresh_expiring([i for i in self._clients if i not in self._leased])
+            await asyncio.sleep(check_interval)
+
+    def stop(self):
+        self._running = False
+
+    def close(self):
+        for client in self._clients:
+            client.session.close()
+        self._clients = []
+        self._queue = None
+        self._leased = set()
+
+    async def acquire(self):
+        self._ensure_clients()
+        start = time.time()
+        client = await self._queue.get()
+        self._leased.add(client)
+        statsd.timing('{}.acquire_time'.format(self.name), time.time() - start)
+        statsd.gauge('{}.available'.format(self.name), self._queue.qsize())
+        return client
+
+    def release(self, client):
+        if client not in self._clients:
+            return  # pool was closed meanwhile
+        self._leased.discard(client)
+        self._queue.put_nowait(client)
+        statsd.gauge('{}.available'.format(self.name), self._queue.qsize())
+
+    def client(self):
+        return PooledClient(self)
+
+
+class PooledClient(object):
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.client = None
+
+    async def __aenter__(self):
+        self.client = await self.pool.acquire()
+        return self.client
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.pool.release(self.client)
+
+
+class IdentityPool(object):
+    """
+    N independent identities, each with its own session, cookies,
+    user agent and token, shared by concurrent users.
+    Tokens are fetched with sessions of their identities. A refresh starts
+    a new UZ session in the cookie jar, so run() refreshes tokens only
+    while nobody uses their identity.
+    Work goes to the least loaded identity, ties are broken round-robin.
+
+        async with pool.client() as uz:
+            await uz.list_trains(...)
+    """
+
+    def __init__(self, size=4, name='scanner.identities'):
+        self.size = size
+        self.name = name
+        self._clients = []
+        self._load = {}
+        self._next = 0
+        self._running = False
+
+    def __len__(self):
+        return len(self._clients)
+
+    def make_client(self):
+        return UZClient(new_session())
+
+    def _ensure_clients(self):
+        if not self._clients:
+            self._clients = [self.make_client() for _ in range(self.size)]
+            self._load = {id(i): 0 for i in self._clients}
+
+    async def start(self):
+        """
+        Obtains tokens upfront
+        """
+        self._ensure_clients()
+        results = await asyncio.gather(
+            *(i.get_token() for i in self._clients), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning('Failed to warm up identity: %r', result)
+
+    async def run(self, check_interval=1):
+        self._running = True
+        while self._running:
+            refresh_expiring([i for i in self._clients if not self._load[id(i)]])
+            await asyncio.sleep(check_interval)
+
+    def stop(self):
+        self._running = False
+
+    def select(self):
+        self._ensure_clients()
+        count = len(self._clients)
+        best = None
+        for i in range(self._next, self._next + count):
+            client = self._clients[i % count]
+            if best is None or self._load[id(client)] < self._load[id(best)]:
+                best = client
+        self._next = (self._next + 1) % count
+        return best
+
+    def acquire(self):
+        client = self.select()
+        self._load[id(client)] += 1
+        statsd.gauge('{}.max_load'.format(self.name), max(self._load.values()))
+        return client
+
+    def release(self, client):
+        if id(client) in self._load:
+            self._load[id(client)] -= 1
+
+    def client(self):
+        return IdentityLease(self)
+
+    def close(self):
+        for client in self._clients:
+            client.session.close()
+        self._clients = []
+        self._load = {}
+
+
+class IdentityLease(object):
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.client = None
+
+    async def __aenter__(self):
+        self.client = self.pool.acquire()
+        return self.client
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.pool.release(self.client)
+
+
+class BookingPool(object):
+    """
+    Keeps a few idle clients with their own session, cookies and token,
+    ready to book a seat the moment it is found.
+    A client with a seat in its cart is handed off for good: its session id
+    identifies the user's cart. A client with an empty cart is released back.
+    """
+
+    def __init__(self, size=2, name='scanner.booking_pool'):
+        self.size = size
+        self.name = name
+        self._idle = deque()
+        self._warming = 0
+
+    def __len__(self):
+        return len(self._idle)
+
+    def make_client(self):
+        # the token is fetched with the session handed off, along with its cart cookie
+        client = UZClient(new_session())
+        client.token_provider = TokenProvider(client=client)
+        return client
+
+    @staticmethod
+    def close_client(client):
+        client.session.close()
+
+    @staticmethod
+    def is_stale(client):
+        return client.token_provider.needs_refresh()
+
+    def _report_depth(self):
+        statsd.gauge('{}.depth'.format(self.name), len(self._idle))
+
+    def drop_stale(self):
+        for client in [i for i in self._idle if self.is_stale(i)]:
+            self._idle.remove(client)
+            self.close_client(client)
+
+    def maintain(self):
+        """
+        Replaces stale clients and refills the pool in background
+        """
+        self.drop_stale()
+        for _ in range(self.size - len(self._idle) - self._warming):
+            self._warming += 1
+            asyncio.ensure_future(self._warm_up())
+        self._report_depth()
+
+    async def _warm_up(self):
+        client = self.make_client()
+        try:
+            await client.get_token()
+        except Exception as ex:
+            logger.warning('Failed to warm up booking client: %r', ex)
+            self.close_client(client)
+        else:
+            if len(self._idle) < self.size:
+                self._idle.append(client)
+            else:
+                # a released client took its place
+                self.close_client(client)
+        finally:
+            self._warming -= 1
+            self._report_depth()
+
+    async def acquire(self, deadline=None):
+        """
+        deadline limits the warm-up of a new client on a pool miss
+        """
+        start = time.time()
+        self.drop_stale()
+        if self._idle:
+            statsd.increment('{}.hit'.format(self.name))
+            client = self._idle.popleft()
+        else:
+            statsd.increment('{}.miss'.format(self.name))
+            client = self.make_client()
+            try:
+                await client.get_token(deadline)
+            except Exception:
+                self.close_client(client)
+                raise
+        statsd.timing('{}.acquire_time'.format(self.name), time.time() - start)
+        self.maintain()
+        return client
+
+    def release(self, client):
+        """
+        Takes back a client with nothing in its cart
+        """
+        if len(self._idle) < self.size and not self.is_stale(client):
+            self._idle.append(client)
+        else:
+            self.close_client(client)
+        self._report_depth()
+
+    def close(self):
+        while self._idle:
+            self.close_client(self._idle.popleft())
@@ -0,0 +1,139 @@
+import asyncio
+import time
+from collections import deque
+
+from uz.client.exceptions import RateLimited
+from uz.metrics import statsd
+
+
+def endpoint_key(endpoint):
+    """
+    purchase/station/Kyiv/ -> purchase/station, '' (the token page) -> token
+    """
+    return '/'.join(endpoint.split('/')[:2]) or 'token'
+
+
+class TokenBucket(object):
+    """
+    Token bucket with adaptive rate (AIMD): rate is cut on throttling signals
+    and slowly restored back to `max_rate` on successful responses.
+    Rate is cut at most once per `cooldown` seconds: responses to requests
+    sent at the old rate say nothing about the new one.
+    """
+
+    def __init__(self, rate, capacity=None, min_rate=0.5, decrease_factor=0.5,
+                 increase_step=None, cooldown=1):
+        self.max_rate = self.rate = rate
+        self.capacity = capacity or rate
+        self.min_rate = min_rate
+        self.decrease_factor = decrease_factor
+        self.increase_step = increase_step or rate / 100
+        self.cooldown = cooldown
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.decreased = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """
+        Time to wait until the next token is available
+        """
+        self._refill()
+        return max(0, (1 - self.tokens) / self.rate)
+
+    def consume(self):
+        """
+        Takes a token, possibly in advance: negative balance makes
+        subsequent callers queue behind this one
+        """
+        self._refill()
+        self.tokens -= 1
+
+    def penalize(self):
+        now = time.monotonic()
+        if self.decreased is not None and now - self.decreased < self.cooldown:
+            return
+        self.decreased = now
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+
+    def reward(self):
+        self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+
+class RateLimiter(object):
+    """
+    Limits request rate per host and per endpoint.
+    Callers wait for their turn; if the wait is longer than `max_wait`
+    request is rejected with RateLimited.
+    `isolated` endpoints (booking) are limited by their own bucket only,
+    so scans can neither starve them nor slow them down.
+    """
+
+    def __init__(self, host_rate=20, endpoint_rate=10, max_wait=10,
+                 error_spike=5, error_window=10, isolated=('cart/add',)):
+        self.endpoint_rate = endpoint_rate
+        self.isolated = frozenset(isolated)
+        self.max_wait = max_wait
+        self.error_spike = error_spike
+        self.error_window = error_window
+        self.host = TokenBucket(host_rate)
+        self.endpoints = {}
+        self._errors = {}
+
+    def bucket(self, key):
+        if key not in self.endpoints:
+            self.endpoints[key] = TokenBucket(self.endpoint_rate)
+        return self.endpoints[key]
+
+    def buckets(self, key):
+        if key in self.isolated:
+            return (self.bucket(key),)
+        return (self.host, self.bucket(key))
+
+    async def wait(self, endpoint):
+        key = endpoint_key(endpoint)
+        tags = ['endpoint:{}'.format(key)]
+        buckets = self.buckets(key)
+        delay = max(i.delay() for i in buckets)
+        if delay > self.max_wait:
+            statsd.increment('client.ratelimit.rejected', tags=tags)
+            raise RateLimited(key, delay)
+        for bucket in buckets:
+            bucket.consume()
+        statsd.timing('client.ratelimit.wait_time', delay, tags=tags)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def throttle(self, key):
+        statsd.increment('client.ratelimit.throttled', tags=['endpoint:{}'.format(key)])
+        for bucket in self.buckets(key):
+            bucket.penalize()
+        statsd.gauge('client.ratelimit.host_rate', self.host.rate)
+
+    def report(self, endpoint, status=200, error=False):
+        """
+        Adjusts rate according to response.
+        429, 5xx, timeouts (status=None) and ResponseError spikes slow us down.
+        """
+        key = endpoint_key(endpoint)
+        if status is None or status == 429 or status >= 500:
+            return self.throttle(key)
+        if error:
+            errors = self._errors.setdefault(key, deque())
+            now = time.monotonic()
+            errors.append(now)
+            while errors[0] < now - self.error_window:
+                errors.popleft()
+            if len(errors) >= self.error_spike:
+                errors.clear()
+                return self.throttle(key)
+            return
+        for bucket in self.buckets(key):
+            bucket.reward()
+
+
+rate_limiter = RateLimiter()
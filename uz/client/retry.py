@@ -0,0 +1,153 @@
+import asyncio
+import random
+import time
+
+import aiohttp
+
+from uz.client.exceptions import (
+    FailedObtainToken, HTTPError, BadRequest, ResponseError)
+from uz.metrics import statsd
+
+
+# exceptions which tell nothing about endpoint health: request was handled
+NOT_FAILURES = (BadRequest, ResponseError)
+FAILURES = (HTTPError, FailedObtainToken, asyncio.TimeoutError, aiohttp.ClientError)
+
+
+def is_failure(ex):
+    return isinstance(ex, FAILURES) and not isinstance(ex, NOT_FAILURES)
+
+
+class RetryPolicy(object):
+    """
+    Retries transient errors with jittered exponential backoff.
+    Number of retries is configured per exception class (the most specific wins).
+    Non idempotent endpoints are never retried.
+    """
+
+    default_retries = {
+        HTTPError: 2,
+        asyncio.TimeoutError: 2,
+        aiohttp.ClientError: 2,
+        FailedObtainToken: 1,
+    }
+    non_idempotent = ('cart/add',)
+
+    def __init__(self, retries=None, base_delay=0.5, max_delay=10):
+        self.retries = self.default_retries if retries is None else retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def max_retries(self, ex):
+        if not is_failure(ex):
+            return 0
+        for klass in type(ex).__mro__:
+            if klass in self.retries:
+                return self.retries[klass]
+        return 0
+
+    def backoff(self, key, ex, attempt):
+        """
+        Returns delay before the next attempt or None if we should give up
+        """
+        if key in self.non_idempotent or attempt >= self.max_retries(ex):
+            return
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker(object):
+    """
+    Stops calls to an endpoint after `threshold` consecutive failures.
+    After `reset_timeout` one trial call is let through (half-open):
+    success closes the circuit, failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, key, threshold=5, reset_timeout=30):
+        self.key = key
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened = None
+        self._trial = None
+
+    @property
+    def state(self):
+        if self.opened is None:
+            return self.CLOSED
+        if time.time() - self.opened > self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    @property
+    def retry_in(self):
+        if self.opened is None:
+            return 0
+        return max(0, self.opened + self.reset_timeout - time.time())
+
+    @property
+    def available(self):
+        """
+        Whether a call would be let through now, without taking the trial
+        """
+        state = self.state
+        if state == self.HALF_OPEN:
+            return self._trial_lost()
+        return state == self.CLOSED
+
+    def _trial_lost(self):
+        # one trial call at a time, unless it got lost (e.g. cancelled)
+        return self._trial is None or time.time() - self._trial > self.reset_timeout
+
+    def allow(self):
+        state = self.state
+        if state == self.HALF_OPEN:
+            if self._trial_lost():
+                self._trial = time.time()
+                return True
+        return state == self.CLOSED
+
+    def release(self):
+        """
+        The call let through never reached the endpoint, another one may try
+        """
+        self._trial = None
+
+    def record(self, success):
+        self._trial = None
+        if success:
+            if self.opened is not None:
+                self._report(self.CLOSED)
+            self.failures = 0
+            self.opened = None
+            return
+        self.failures += 1
+        if self.opened is not None or self.failures >= self.threshold:
+            self.opened = time.time()
+            self._report(self.OPEN)
+
+    def _report(self, state):
+        statsd.gauge('client.breaker.open', int(state == self.OPEN),
+                     tags=['endpoint:{}'.format(self.key)])
+
+
+class CircuitBreakers(object):
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.breakers = {}
+
+    def __getitem__(self, key):
+        if key not in self.breakers:
+            self.breakers[key] = CircuitBreaker(key, **self.kwargs)
+        return self.breakers[key]
+
+    def open(self):
+        return [i for i in self.breakers.values() if i.state != CircuitBreaker.CLOSED]
+
+
+retry_policy = RetryPolicy()
+circuit_breakers = CircuitBreakers()
@@ -0,0 +1,63 @@
+import logging
+import os
+
+import aiohttp
+
+from uz.client.cassette import Cassette
+from uz.client.connector import ConnectorConfig, DNSCache, make_connector
+
+
+logger = logging.getLogger('uz.client')
+
+RECORD = 'record'
+REPLAY = 'replay'
+
+_cassette = None
+_mode = None
+_speed = None
+
+connector_config = ConnectorConfig.from_env()
+dns_cache = DNSCache(connector_config.dns_ttl)
+
+
+def use_cassette(cassette, mode=REPLAY, speed=None):
+    """
+    Switches every new session to record to / replay from the cassette.
+    use_cassette(None) goes back to the network.
+    """
+    global _cassette, _mode, _speed
+    _cassette, _mode, _speed = cassette, mode, speed
+
+
+def init_cassette():
+    path = os.environ.get('UZ_CASSETTE')
+    if not path:
+        return
+    mode = os.environ.get('UZ_CASSETTE_MODE') or REPLAY
+    speed = float(os.environ.get('UZ_CASSETTE_SPEED') or 0) or None
+    cassette = Cassette(path)
+    if mode == REPLAY:
+        cassette.load()
+    logger.warning('Using cassette %s in %s mode', path, mode)
+    use_cassette(cassette, mode, speed)
+
+
+def close_cassette():
+    """
+    Writes interactions recorded so far
+    """
+    if _cassette is not None:
+        _cassette.close()
+
+
+def new_session(**connector_kwargs):
+    """
+    connector_kwargs override connector_config for this session only
+    """
+    if _mode == REPLAY:
+        return _cassette.replaying(_speed)
+    connector = make_connector(connector_config, dns_cache, **connector_kwargs)
+    session = aiohttp.ClientSession(connector=connector)
+    if _mode == RECORD:
+        return _cassette.recording(session)
+    return session
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import time
+
+from uz.metrics import statsd
+
+
+logger = logging.getLogger('uz.client')
+
+
+class Token(object):
+    """
+    GV token and the user agent it was issued for. The token comes along with
+    the _gv_sessid cookie of the session it was fetched with, which identifies
+    the user's cart: it is only good for requests sent with that session.
+    """
+
+    def __init__(self, value, user_agent, date=None):
+        self.value = value
+        self.user_agent = user_agent
+        self.date = time.time() if date is None else date
+
+    def __repr__(self):
+        return 'Token(%r, %r)' % (self.value, self.user_agent)
+
+    @property
+    def age(self):
+        return time.time() - self.date
+
+
+class TokenProvider(object):
+    """
+    GV token of a session, shared by clients using that session.
+    The token is fetched with `client`, the session it is sent with.
+    A refresh starts a new UZ session in its cookie jar: it is single-flight,
+    requests started meanwhile wait for the new token. Tokens of idle
+    sessions are refreshed in background `refresh_margin` seconds before
+    they expire, see ClientPool.run, so callers do not wait for them.
+    """
+
+    def __init__(self, client, max_age=600, refresh_margin=60):
+        self.client = client
+        self.max_age = max_age
+        self.refresh_margin = refresh_margin
+        self._token = None
+        self._refresh_task = None
+
+    def is_outdated(self, token):
+        return token is None or token.age > self.max_age
+
+    def is_expiring(self, token):
+        return token.age > self.max_age - self.refresh_margin
+
+    def needs_refresh(self):
+        token = self._token
+        return self.is_outdated(token) or self.is_expiring(token)
+
+    def reset(self):
+        self._token = None
+
+    async def get(self):
+        token = self._token
+        # cookies of the old token are being replaced
+        if self._refresh_task is not None or self.is_outdated(token):
+            statsd.increment('client.token.miss')
+            return await self.refresh()
+        statsd.increment('client.token.hit')
+        return token
+
+    def refresh(self):
+        return asyncio.shield(self.start_refresh())
+
+    def start_refresh(self):
+        """
+        Single-flight refresh: concurrent callers share one token fetch
+        """
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.ensure_future(self._refresh())
+            self._refresh_task.add_done_callback(self._refresh_done)
+        return self._refresh_task
+
+    async def _refresh(self):
+        with statsd.timed('client.token.refresh_time'):
+            token = await self.client.fetch_token()
+        self._token = token
+        return token
+
+    def _refresh_done(self, task):
+        self._refresh_task = None
+        if not task.cancelled() and task.exception() is not None:
+            statsd.increment('client.token.refresh_error')
+            logger.warning('Failed to refresh token: %r', task.exception())
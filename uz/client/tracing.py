@@ -0,0 +1,90 @@
+import os
+import time
+
+import aiohttp
+
+from uz.client.ratelimit import endpoint_key
+from uz.metrics import statsd
+
+
+def request_endpoint(path):
+    """
+    /en/purchase/search/ -> purchase/search
+    """
+    return endpoint_key(path.lstrip('/').partition('/')[2])
+
+
+class RequestTrace(object):
+    """
+    Collects durations of request phases:
+    headers (token), wait (rate limiter), ttfb, body and parse
+    """
+
+    __slots__ = ('endpoint', 'started', 'last', 'phases')
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = self.last = time.monotonic()
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.monotonic()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def finish(self, status):
+        if self.phases and self.phases[-1][0] == 'body':
+            self.mark('parse')
+        tags = ['endpoint:{}'.format(self.endpoint), 'status:{}'.format(status or 'error')]
+        for phase, elapsed in self.phases:
+            statsd.histogram('client.request.{}'.format(phase), elapsed, tags=tags)
+        statsd.histogram('client.request.total', time.monotonic() - self.started, tags=tags)
+
+
+class NoopTrace(object):
+
+    def mark(self, phase):
+        pass
+
+    def finish(self, status):
+        pass
+
+
+NOOP_TRACE = NoopTrace()
+
+
+class Tracer(object):
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+
+    def start(self, endpoint):
+        return RequestTrace(endpoint) if self.enabled else NOOP_TRACE
+
+
+tracer = Tracer(enabled=bool(os.environ.get('UZ_TRACING')))
+
+
+class TracingConnector(aiohttp.TCPConnector):
+    """
+    Reports DNS resolution and connection establishment time
+    (connect includes DNS) when tracing is enabled
+    """
+
+    async def _resolve_host(self, host, port):
+        if not tracer.enabled:
+            return await super()._resolve_host(host, port)
+        start = time.monotonic()
+        result = await super()._resolve_host(host, port)
+        statsd.histogram('client.request.dns', time.monotonic() - start,
+                         tags=['host:{}'.format(host)])
+        return result
+
+    async def _create_connection(self, req):
+        if not tracer.enabled:
+            return await super()._create_connection(req)
+        start = time.monotonic()
+        result = await super()._create_connection(req)
+        statsd.histogram('client.request.connect', time.monotonic() - start,
+                         tags=['endpoint:{}'.format(request_endpoint(req.path))])
+        return result
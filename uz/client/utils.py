@@ -1,11 +1,16 @@
+import asyncio
+import hashlib
 import random
 import re
 
+from uz.client.cache import TTLCache
 from uz.client.jjdecode import JJDecoder
 
 
 JJ_CODE_PATTERN = re.compile(';_gaq.push\(\[\'_trackPageview\'\]\);(.+)\(function')  # noqa
 TOKEN_PATTERN = re.compile('localStorage.setItem\(\"gv-token\", \"(\w+)\"\);')
+# same on bytes: token page is searched as it is downloaded
+JJ_CODE_BYTES_PATTERN = re.compile(JJ_CODE_PATTERN.pattern.encode('utf-8'))
 
 USER_AGENTS = [
     'Mozilla/5.0 (compatible, MSIE 11, Windows NT 6.3; Trident/7.0; rv:11.0) like Gecko',
@@ -30,14 +35,72 @@ USER_AGENTS = [
 ]
 
 
-def parse_gv_token(page):
+# decoded token scripts by hash of the encoded one
+jj_cache = TTLCache('client.jj_cache', maxsize=64, ttl=3600)
+
+
+def extract_jj_code(page):
     jj_code = JJ_CODE_PATTERN.search(page)
+    return jj_code and jj_code.groups()[0]
+
+
+async def read_token_script(response):
+    """
+    Reads token page until the line with the jj-encoded script is complete
+    and closes the response, returning that script block only.
+    The pattern never spans lines, so complete lines are searched just once.
+    Whole body is returned if there is no script.
+    """
+    buffer = bytearray()
+    scanned = 0
+    while True:
+        chunk = await response.content.readany()
+        if not chunk:
+            match = JJ_CODE_BYTES_PATTERN.search(buffer, scanned)
+            return bytes(match.group() if match else buffer)
+        buffer.extend(chunk)
+        end = buffer.rfind(b'\n')
+        if end < scanned:
+            continue
+        match = JJ_CODE_BYTES_PATTERN.search(buffer, scanned, end)
+        if match:
+            response.close()
+            return bytes(match.group())
+        scanned = end + 1
+
+
+def jj_hash(jj_code):
+    return hashlib.sha1(jj_code.encode('utf-8')).hexdigest()
+
+
+def find_gv_token(script):
+    token = TOKEN_PATTERN.search(script)
+    return token and token.groups()[0]
+
+
+def parse_gv_token(page):
+    jj_code = extract_jj_code(page)
     if jj_code is None:
         return
-    jj_code = jj_code.groups()[0]
-    parsed = JJDecoder(jj_code).decode()
-    token = TOKEN_PATTERN.search(parsed)
-    return token and token.groups()[0]
+    return find_gv_token(JJDecoder(jj_code).decode())
+
+
+async def parse_gv_token_async(page, executor=None):
+    """
+    parse_gv_token, which does not block the loop:
+    regex search and decoding run in the executor,
+    decoded scripts are memoized in jj_cache (accessed from the loop only)
+    """
+    loop = asyncio.get_event_loop()
+    jj_code = await loop.run_in_executor(executor, extract_jj_code, page)
+    if jj_code is None:
+        return
+    key = jj_hash(jj_code)
+    script = jj_cache.get(key)
+    if script is None:
+        script = await loop.run_in_executor(executor, JJDecoder(jj_code).decode)
+        jj_cache.set(key, script)
+    return find_gv_token(script)
 
 
 def get_random_user_agent():
@@ -1,3 +1,5 @@
+import asyncio
+
 from dateutil import parser as date_parser
 
 
@@ -12,9 +14,10 @@ class Deserializer(object):
 
     async def load(self, dikt):
         date = self.date(dikt.get('date'))
-        source_coro = self.station(dikt.get('source'))
-        destination_coro = self.station(dikt.get('destination'))
-        return date, await source_coro, await destination_coro
+        source, destination = await asyncio.gather(
+            self.station(dikt.get('source')),
+            self.station(dikt.get('destination')))
+        return date, source, destination
 
     @staticmethod
     def date(date_str):
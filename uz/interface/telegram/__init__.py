@@ -1,6 +1,6 @@
 import os
 
-from uz.client import UZClient
+from uz.client.pool import ClientPool
 from uz.interface.serializer import Deserializer, SerializerException
 from uz.interface.telegram.bot import UZTGBot
 from uz.interface.telegram.dev_bot import StdOutBot
@@ -11,6 +11,10 @@ from uz.scanner import UknkownScanID
 SCAN_DALAY_SEC = int(os.environ.get('SCAN_DALAY_SEC') or 10)
 TOKEN = os.environ.get('TG_BOT_TOKEN')
 BOT_NAME = os.environ.get('TG_BOT_NAME')
+CLIENT_POOL_SIZE = int(os.environ.get('CLIENT_POOL_SIZE') or 4)
+
+
+client_pool = ClientPool(size=CLIENT_POOL_SIZE)
 
 
 if TOKEN:
@@ -23,7 +27,7 @@ else:
 @bot.command(r'/trains (?P<date>[\w.\-]+) (?P<source>\w+) (?P<destination>\w+)')
 @count_hits('interface.telegram.command.trains')
 async def list_trains(chat, match):
-    with UZClient() as uz:
+    async with client_pool.client() as uz:
         try:
             date, source, destination = await Deserializer(uz).load(match.groupdict())
         except SerializerException as ex:
@@ -64,7 +68,7 @@ async def abort_scan(chat, match):
 @count_hits('interface.telegram.command.scan')
 async def scan(chat, match):
     raw_data = match.groupdict()
-    with UZClient() as uz:
+    async with client_pool.client() as uz:
         try:
             date, source, destination = await Deserializer(uz).load(raw_data)
         except SerializerException as ex:
@@ -76,7 +80,8 @@ async def scan(chat, match):
     lastname = raw_data['lastname']
 
     scan_id = chat.bot.scanner.add_item(
-        chat.message, firstname, lastname, date, source, destination, train_num, ct_letter)
+        chat.bot.callback_id(chat.message), firstname, lastname, date, source, destination,
+        train_num, ct_letter)
     msg = ('Scanning tickets for train {train} from {src} to {dst} on {date}.\n'
            'To monitor scan status: /status_{sid}\n'
            'To abort scan: /abort_{sid}').format(
@@ -13,8 +13,16 @@ class UZTGBot(aiotg.Bot):
     def set_scanner(self, scanner):
         self._scanner = scanner
 
-    def ticket_booked_cb(self, orig_msg, session_id):
-        chat = aiotg.Chat.from_message(self, orig_msg)
+    @staticmethod
+    def callback_id(message):
+        """
+        Chat to notify once the ticket is booked, it is saved with the scan
+        """
+        chat = message['chat']
+        return [chat['id'], chat['type']]
+
+    def ticket_booked_cb(self, callback_id, session_id):
+        chat = aiotg.Chat(self, *callback_id)
         msg = ('Ticket is booked! To proceed checkout use this session id '
                'in your browser: {}'.format(session_id))
         return chat.send_text(msg)
@@ -1,13 +1,21 @@
 import asyncio
+import gc
 import logging
+from collections import defaultdict
+from datetime import datetime
 from uuid import uuid4
 
-import aiohttp
-
-from uz.client import UZClient
-from uz.client.exceptions import ResponseError
+from uz.availability import AvailabilitySnapshot
+from uz.booking import BookingEngine
+from uz.client.connector import report_connector_stats
+from uz.client.pool import BookingPool, IdentityPool
+from uz.client.retry import circuit_breakers
+from uz.client.deadline import Deadline
+from uz.client.exceptions import CircuitOpen, DeadlineExceeded, UZException
+from uz.client.model import stations
 from uz.metrics import statsd
-from uz.utils import reliable_async_sleep
+from uz.schedule import Scheduler
+from uz.store import ScanStore
 
 
 logger = logging.getLogger('uz.scanner')
@@ -16,66 +24,273 @@ logger = logging.getLogger('uz.scanner')
 class UZScanner(object):
 
     metric_sample_rate = 5
+    # due scans are started in batches at most that often
+    schedule_resolution = 0.05
+    # scans of a route due within that part of their interval
+    # are started along with the first one, with a single trains lookup
+    coalesce_window = 0.5
+    # drift is reported for every started scan, only a part of them is sent
+    drift_sample_rate = 0.1
 
-    def __init__(self, success_cb, delay=60):
+    def __init__(self, success_cb, delay=60, booking_concurrency=8, identities=4,
+                 scan_budget=30, store=None, jitter=0.1):
         self.success_cb = success_cb
 
         self.loop = asyncio.get_event_loop()
+        # default interval between scans of an item
         self.delay = delay
-        self.session = aiohttp.ClientSession()
-        self.client = UZClient(self.session)
+        # time a single scan may take, from trains lookup to booking
+        self.scan_budget = scan_budget
+        self.identities = IdentityPool(identities)
+        self.circuit_breakers = circuit_breakers
+        self.booking_pool = BookingPool()
+        self.booking_engine = BookingEngine(self.booking_pool, booking_concurrency)
+        self.availability = AvailabilitySnapshot()
+        self.store = store or ScanStore()
+        self.scheduler = Scheduler(jitter)
         self.__state = dict()
+        # route key: {scan_id}
+        self.__routes = defaultdict(set)
+        self.__wakeup = asyncio.Event(loop=self.loop)
         self.__running = False
 
     async def run(self):
         logger.info('Starting UZScanner')
         self.__running = True
         asyncio.ensure_future(self.emit_stats())
+        asyncio.ensure_future(self.identities.run())
         while self.__running:
-            for scan_id, data in self.__state.items():
-                asyncio.ensure_future(self.scan(scan_id, data))
-            await reliable_async_sleep(self.delay)
+            routes = self.due_routes()
+            if routes:
+                self.booking_pool.maintain()
+            for items in routes.values():
+                asyncio.ensure_future(self.scan_route(items))
+            await self.wait_next_run()
+
+    def due_routes(self):
+        """
+        Groups scans due by now with scans of the same routes due soon
+        """
+        now = self.scheduler.time()
+        routes = defaultdict(list)
+        for scan_id, drift in self.scheduler.pop_due(now):
+            statsd.histogram(
+                'scanner.schedule_drift', drift, sample_rate=self.drift_sample_rate)
+            data = self.scan_data(scan_id)
+            routes[self.route_key(data)].append((scan_id, data))
+        for route, items in routes.items():
+            for scan_id in self.__routes[route].difference(i for i, _ in items):
+                window = self.scheduler.interval(scan_id) * self.coalesce_window
+                drift = self.scheduler.pull(scan_id, now, window)
+                if drift is not None:
+                    statsd.histogram(
+                        'scanner.schedule_drift', drift, sample_rate=self.drift_sample_rate)
+                    items.append((scan_id, self.scan_data(scan_id)))
+        return routes
+
+    async def wait_next_run(self):
+        """
+        Sleeps until the next scan is due or a scan is added
+        """
+        self.__wakeup.clear()
+        next_run = self.scheduler.next_run()
+        timeout = None
+        if next_run is not None:
+            timeout = max(next_run - self.scheduler.time(), self.schedule_resolution)
+        try:
+            await asyncio.wait_for(self.__wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
 
     def stop(self):
         logger.info('Stopping UZScanner')
         self.__running = False
+        self.identities.stop()
+        self.__wakeup.set()
 
     def cleanup(self):
-        self.session.close()
+        self.identities.close()
+        self.booking_pool.close()
+        self.store.close()
 
     async def emit_stats(self):
         while self.__running:
             cnt = len(self.__state)
             statsd.gauge('scanner.active_scans', cnt)
+            self.report_dedup(self.__routes)
+            self.availability.retain(self.__routes)
+            statsd.gauge('scanner.open_breakers', len(self.circuit_breakers.open()))
+            report_connector_stats()
             await asyncio.sleep(self.metric_sample_rate)
 
+    @staticmethod
+    def route_key(data):
+        return data['date'], data['source'], data['destination']
+
+    @staticmethod
+    def report_dedup(routes):
+        scans = sum(len(i) for i in routes.values())
+        statsd.gauge('scanner.active_routes', len(routes))
+        if scans:
+            statsd.gauge('scanner.route_dedup_ratio', 1 - len(routes) / scans)
+
     def add_item(self, success_cb_id, firstname, lastname, date,
-                 source, destination, train_num, ct_letter=None):
+                 source, destination, train_num, ct_letter=None, interval=None):
+        """
+        interval is seconds between scans of the item, delay by default
+        """
         scan_id = uuid4().hex
-        self.__state[scan_id] = dict(
-            success_cb_id=success_cb_id,
-            firstname=firstname,
-            lastname=lastname,
-            date=date,
-            source=source,
-            destination=destination,
-            train_num=train_num,
-            ct_letter=ct_letter,
-            lock=asyncio.Lock(),
-            attempts=0,
-            error=None)
+        data = self.new_scan(
+            success_cb_id, firstname, lastname, date, source, destination, train_num, ct_letter,
+            interval or self.delay)
+        self.schedule(scan_id, data)
+        self.store.add(scan_id, self.dump_scan(data))
+        self.__wakeup.set()
         return scan_id
 
+    def schedule(self, scan_id, data):
+        self.__state[scan_id] = data
+        self.__routes[self.route_key(data)].add(scan_id)
+        self.scheduler.add(scan_id, data['interval'])
+
+    def new_scan(self, success_cb_id, firstname, lastname, date,
+                 source, destination, train_num, ct_letter, interval):
+        return {
+            'success_cb_id': success_cb_id,
+            'firstname': firstname,
+            'lastname': lastname,
+            'date': date,
+            'source': source,
+            'destination': destination,
+            'train_num': train_num,
+            'ct_letter': ct_letter,
+            'interval': interval,
+            # a scan is running, next ones are skipped until it is done
+            'busy': False,
+            # coaches were looked up at least once
+            'checked': False,
+            'attempts': 0,
+            'error': None}
+
+    @staticmethod
+    def dump_route(date, source_id, source_title, destination_id, destination_title):
+        """
+        A route saved as a single field, scans share a few routes and each
+        of them is read once on restore. Titles follow the length of the first one,
+        there is nothing to escape in them. Station ids are numbers.
+        """
+        return '{},{},{},{},{}{}'.format(
+            date, source_id, destination_id, len(source_title), source_title, destination_title)
+
+    @staticmethod
+    def dump_scan(data):
+        source, destination = data['source'], data['destination']
+        route = UZScanner.dump_route(
+            data['date'].toordinal(), source.id, source.title, destination.id, destination.title)
+        return [
+            data['success_cb_id'], data['firstname'], data['lastname'], route,
+            data['train_num'], data['ct_letter'], data['interval']]
+
+    @staticmethod
+    def load_route(saved):
+        date, source_id, destination_id, length, titles = saved.split(',', 4)
+        length = int(length)
+        return (
+            datetime.fromordinal(int(date)),
+            stations.get(source_id, titles[:length]),
+            stations.get(destination_id, titles[length:]))
+
+    def upgrade_record(self, record):
+        """
+        Records saved before routes were a single field have 10 fields,
+        or 11 since intervals are stored
+        """
+        if len(record) == 7:
+            return record
+        if len(record) not in (10, 11):
+            raise ValueError(record)
+        route = self.dump_route(*record[3:8])
+        interval = record[10] if len(record) > 10 else self.delay
+        return record[:3] + [route] + record[8:10] + [interval]
+
+    def load_scan(self, record):
+        success_cb_id, firstname, lastname, route, train_num, ct_letter, interval = \
+            self.upgrade_record(record)
+        date, source, destination = self.load_route(route)
+        return self.new_scan(
+            success_cb_id, firstname, lastname, date, source, destination,
+            train_num, ct_letter, interval)
+
+    def scan_data(self, scan_id):
+        """
+        Restored scans keep their saved records until they are needed,
+        most of them are not before their first run
+        """
+        data = self.__state[scan_id]
+        if type(data) is list:
+            data = self.__state[scan_id] = self.load_scan(data)
+        return data
+
+    def restore(self):
+        """
+        Loads scans saved by the store, their first scans are spread over their intervals.
+        Only what scheduling needs is read from the records here, see scan_data.
+        """
+        # nothing to collect while scans are loaded, yet collection would run
+        # many times for as many new containers
+        gc.disable()
+        broken = []
+        try:
+            scans = self.store.load()
+            state = self.__state
+            # saved route: (route, its scan ids)
+            routes = {}
+            scan_ids = []
+            intervals = []
+            for scan_id, record in scans.items():
+                try:
+                    if len(record) != 7:
+                        record = self.upgrade_record(record)
+                    route = routes.get(record[3])
+                    if route is None:
+                        route = routes[record[3]] = (self.load_route(record[3]), [])
+                except (AttributeError, TypeError, ValueError, OverflowError):
+                    broken.append(scan_id)
+                    continue
+                route[1].append(scan_id)
+                state[scan_id] = record
+                scan_ids.append(scan_id)
+                intervals.append(record[6])
+            for route, route_scan_ids in routes.values():
+                self.__routes[route].update(route_scan_ids)
+            self.scheduler.add_many(zip(scan_ids, intervals))
+        finally:
+            gc.enable()
+        if broken:
+            logger.warning('Dropped %s broken scans', len(broken))
+            for scan_id in broken:
+                self.store.remove(scan_id)
+        restored = len(scans) - len(broken)
+        logger.info('Restored %s scans', restored)
+        return restored
+
     def status(self, scan_id):
         # TODO: add protection. status requests should be limited to scans for current user only
-        data = self.__state.get(scan_id)
-        if data is None:
+        if scan_id not in self.__state:
             raise UknkownScanID(scan_id)
+        data = self.scan_data(scan_id)
         return data['attempts'], data['error']
 
     def abort(self, scan_id):
         if scan_id in self.__state:
+            data = self.scan_data(scan_id)
             del self.__state[scan_id]
+            route = self.route_key(data)
+            self.__routes[route].discard(scan_id)
+            if not self.__routes[route]:
+                del self.__routes[route]
+            self.scheduler.remove(scan_id)
+            self.store.remove(scan_id)
             return True
         raise UknkownScanID(scan_id)
 
@@ -84,6 +299,12 @@ class UZScanner(object):
         data['error'] = error
         logger.debug('[%s] %s', scan_id, error)
 
+    @staticmethod
+    def find_train(trains, train_num):
+        for train in trains:
+            if train.num == train_num:
+                return train
+
     @staticmethod
     def find_coach_type(train, ct_letter):
         for coach_type in train.coach_types:
@@ -91,30 +312,78 @@ class UZScanner(object):
                 return coach_type
 
     @staticmethod
-    async def book(train, coach_types, firstname, lastname):
-        with UZClient() as client:
-            for coach_type in coach_types:
-                for coach in await client.list_coaches(train, coach_type):
-                    try:
-                        seats = await client.list_seats(train, coach)
-                    except ResponseError:
-                        continue
-                    for seat in seats:
-                        try:
-                            await client.book_seat(train, coach, seat, firstname, lastname)
-                        except ResponseError:
-                            continue
-                        return client.get_session_id()
-
-    async def scan(self, scan_id, data):
-        if data['lock'].locked():
+    def bookable_coach_types(train, coach_types, data, changes):
+        """
+        Coach types with places. Once a scan looked through the coaches,
+        only those where places appeared or increased since the previous lookup.
+        """
+        coach_types = [i for i in coach_types if i.places]
+        if changes is None or not data['checked']:
+            return coach_types
+        return [i for i in coach_types if (train.num, i.letter) in changes]
+
+    @staticmethod
+    def report_deadline(ex):
+        statsd.increment('scanner.deadline_exceeded', tags=['stage:{}'.format(ex.stage)])
+
+    async def book(self, train, coach_types, firstname, lastname, deadline=None):
+        return await self.booking_engine.book(
+            train, coach_types, firstname, lastname, deadline)
+
+    async def scan_route(self, items):
+        """
+        Fetches trains once for all scans watching the same route
+        """
+        scans = len(items)
+        items = [(scan_id, data) for scan_id, data in items if not data['busy']]
+        if not items:
+            return
+        breaker = self.circuit_breakers['purchase/search']
+        if not breaker.available:
+            return self.skip_route(items, CircuitOpen(breaker.key, breaker.retry_in))
+        data = items[0][1]
+        deadline = Deadline(self.scan_budget)
+        try:
+            async with self.identities.client() as client:
+                trains = await client.list_trains(
+                    data['date'], data['source'], data['destination'], deadline=deadline)
+        except CircuitOpen as ex:
+            # another route took the half-open trial meanwhile
+            return self.skip_route(items, ex)
+        except UZException as ex:
+            if isinstance(ex, DeadlineExceeded):
+                self.report_deadline(ex)
+            for scan_id, data in items:
+                data['attempts'] += 1
+                self.handle_error(scan_id, data, str(ex))
             return
+        route = self.route_key(data)
+        changes = self.availability.update(route, trains)
+        if len(items) < scans:
+            # scans still busy with the previous lookup should see these changes too
+            self.availability.forget(route, changes)
+        for scan_id, data in items:
+            asyncio.ensure_future(self.scan(scan_id, data, trains, deadline, changes))
 
-        async with data['lock']:
+    def skip_route(self, items, error):
+        # do not count attempts while UZ is down
+        for scan_id, data in items:
+            self.handle_error(scan_id, data, str(error))
+
+    async def scan(self, scan_id, data, trains, deadline=None, changes=None):
+        """
+        changes are (train num, coach letter) with new places, see AvailabilitySnapshot
+        """
+        if data['busy']:
+            if changes:
+                self.availability.forget(self.route_key(data), changes)
+            return
+
+        data['busy'] = True
+        try:
             data['attempts'] += 1
 
-            train = await self.client.fetch_train(
-                data['date'], data['source'], data['destination'], data['train_num'])
+            train = self.find_train(trains, data['train_num'])
             if train is None:
                 return self.handle_error(
                     scan_id, data, 'Train {} not found'.format(data['train_num']))
@@ -128,12 +397,30 @@ class UZScanner(object):
             else:
                 coach_types = train.coach_types
 
-            session_id = await self.book(train, coach_types, data['firstname'], data['lastname'])
+            coach_types = self.bookable_coach_types(train, coach_types, data, changes)
+            if not coach_types:
+                statsd.increment('scanner.booking_skipped')
+                return self.handle_error(scan_id, data, 'No available seats')
+
+            try:
+                session_id = await self.book(
+                    train, coach_types, data['firstname'], data['lastname'], deadline)
+            except Exception as ex:
+                # coaches were not looked through, they are new again on the next scan
+                self.availability.forget(
+                    self.route_key(data), [(train.num, i.letter) for i in coach_types])
+                if not isinstance(ex, DeadlineExceeded):
+                    raise
+                self.report_deadline(ex)
+                return self.handle_error(scan_id, data, str(ex))
+            data['checked'] = True
             if session_id is None:
                 return self.handle_error(scan_id, data, 'No available seats')
 
             await self.success_cb(data['success_cb_id'], session_id)
             self.abort(scan_id)
+        finally:
+            data['busy'] = False
 
 
 class UknkownScanID(Exception):
@@ -0,0 +1,120 @@
+import heapq
+import itertools
+import random
+import time
+
+
+# fractional part of the golden ratio, offsets of consecutive keys
+# stay evenly spread over the interval however many keys there are
+PHASE_STEP = 0.6180339887498949
+REMOVED = object()
+
+
+class Scheduler(object):
+    """
+    Heap of next run times of keys, each with its own interval.
+    First runs of keys are spread over their interval, every next run is
+    an interval later give or take `jitter` of it, so keys added at once
+    do not keep running at once.
+    """
+
+    def __init__(self, jitter=0.1, time=time.monotonic):
+        self.jitter = jitter
+        self.time = time
+        self._heap = []
+        self._entries = {}
+        self._seq = itertools.count()
+        self._phase = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def add(self, key, interval, now=None):
+        if now is None:
+            now = self.time()
+        self.remove(key)
+        self._phase = (self._phase + PHASE_STEP) % 1
+        self._push(key, now + self._phase * interval, interval)
+
+    def add_many(self, items, now=None):
+        """
+        Adds (key, interval) items as add does, the heap is rebuilt once
+        """
+        if now is None:
+            now = self.time()
+        entries, heap, seq = self._entries, self._heap, self._seq
+        phase = self._phase
+        for key, interval in items:
+            if key in entries:
+                self.remove(key)
+            phase = (phase + PHASE_STEP) % 1
+            entry = entries[key] = [now + phase * interval, next(seq), key, interval]
+            heap.append(entry)
+        self._phase = phase
+        heapq.heapify(self._heap)
+
+    def remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            # removed from the heap once it gets to the top
+            entry[2] = REMOVED
+
+    def interval(self, key):
+        return self._entries[key][3]
+
+    def next_run(self, key=None):
+        """
+        Target time of key or of the earliest key, None if there are none
+        """
+        if key is not None:
+            entry = self._entries.get(key)
+            return None if entry is None else entry[0]
+        while self._heap and self._heap[0][2] is REMOVED:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now=None):
+        """
+        Returns [(key, drift)] of keys due by now and schedules their next runs,
+        drift is how late a key is
+        """
+        if now is None:
+            now = self.time()
+        entries = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            entry = heapq.heappop(heap)
+            if entry[2] is not REMOVED:
+                entries.append(entry)
+        # rescheduled after the loop, a next run may be due by now as well
+        for target, _, key, interval in entries:
+            self._reschedule(key, target, interval, now)
+        return [(key, now - target) for target, _, key, _ in entries]
+
+    def pull(self, key, now, window):
+        """
+        Runs key now if it is due within window, returns its drift
+        (negative, it runs early) or None
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] > now + window:
+            return None
+        target, _, _, interval = entry
+        entry[2] = REMOVED
+        self._reschedule(key, now, interval, now)
+        return now - target
+
+    def _reschedule(self, key, target, interval, now):
+        target += interval * (1 + random.uniform(-self.jitter, self.jitter))
+        if target < now:
+            # skip runs missed while the loop was busy
+            target = now + interval * random.uniform(1 - self.jitter, 1)
+        self._push(key, target, interval)
+
+    def _push(self, key, target, interval):
+        entry = [target, next(self._seq), key, interval]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
@@ -0,0 +1,226 @@
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from operator import itemgetter
+
+from uz.metrics import statsd
+
+
+logger = logging.getLogger('uz.scanner')
+
+ADD = '+'
+REMOVE = '-'
+
+
+def fsync_dir(path):
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ScanStore(object):
+    """
+    Keeps scans in memory only, they are lost on restart
+    """
+
+    def load(self):
+        """
+        Returns {scan_id: record} of active scans
+        """
+        return {}
+
+    def add(self, scan_id, record):
+        pass
+
+    def remove(self, scan_id):
+        pass
+
+    async def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class LogStore(ScanStore):
+    """
+    Append-only JSON lines log of added and removed scans.
+    Entries are written and fsync'ed in batches by a single worker thread,
+    a line per entry `["+", scan_id, record]` and `["-", scan_id]`,
+    or per run of them `["+", {scan_id: record}]` and `["-", [scan_id]]`:
+    a few long lines decode much faster than a line per scan.
+    The log is rewritten with active scans only once it has
+    `compact_ratio` times more entries than that (and at least `min_compact`).
+    """
+
+    def __init__(self, path, compact_ratio=2, min_compact=1000, loop=None):
+        self.path = path
+        self.compact_ratio = compact_ratio
+        self.min_compact = min_compact
+        self.loop = loop or asyncio.get_event_loop()
+        self.executor = ThreadPoolExecutor(1)
+        self.scans = {}
+        self._entries = 0
+        self._pending = []
+        self._writer = None
+        self._file = None
+
+    def load(self):
+        self.scans = {}
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, encoding='utf-8') as f:
+            lines = f.read().split('\n')
+        torn = lines.pop()  # empty unless the last write was interrupted
+        try:
+            entries = json.loads('[' + ','.join(lines) + ']')
+        except ValueError:
+            entries = list(self.parse_lines(lines))
+        scans = self.scans
+        valid = 0
+        entries_count = 0
+        for entry in entries:
+            # additions checked inline, there may be as many of them as scans
+            if type(entry) is list and len(entry) == 3 and entry[0] == ADD and \
+                    type(entry[1]) is str:
+                scans[entry[1]] = entry[2]
+                entries_count += 1
+            elif type(entry) is list and len(entry) == 2 and entry[0] == ADD and \
+                    type(entry[1]) is dict:
+                scans.update(entry[1])
+                entries_count += len(entry[1])
+            else:
+                entry = self.read_entry(entry)
+                if entry is None:
+                    continue
+                op, value = entry
+                if op == ADD:
+                    scans.update(value)
+                else:
+                    for scan_id in value:
+                        scans.pop(scan_id, None)
+                entries_count += len(value)
+            valid += 1
+        self._entries = entries_count
+        if torn or valid < len(lines):
+            logger.warning('Dropped broken entries of %s', self.path)
+            self.compact(list(self.scans.items()))
+        return dict(self.scans)
+
+    @staticmethod
+    def read_entry(entry):
+        """
+        (op, {scan_id: record} or [scan_id]) of a decoded line,
+        None unless LogStore could have written it
+        """
+        if not isinstance(entry, list) or len(entry) not in (2, 3):
+            return None
+        op, value = entry[0], entry[1]
+        if isinstance(value, str):
+            if op == ADD and len(entry) == 3:
+                return op, {value: entry[2]}
+            return (op, [value]) if op == REMOVE and len(entry) == 2 else None
+        if len(entry) != 2:
+            return None
+        if op == ADD and isinstance(value, dict):
+            return op, value
+        if op == REMOVE and isinstance(value, list) and all(isinstance(i, str) for i in value):
+            return op, value
+        return None
+
+    @staticmethod
+    def encode(entries):
+        """
+        Lines of entries, a line for every run of additions or removals
+        """
+        lines = []
+        for op, run in groupby(entries, key=itemgetter(0)):
+            run = list(run)
+            if len(run) == 1:
+                line = run[0]
+            elif op == ADD:
+                line = [op, {scan_id: record for _, scan_id, record in run}]
+            else:
+                line = [op, [scan_id for _, scan_id in run]]
+            lines.append(json.dumps(line, ensure_ascii=False, separators=(',', ':')))
+            lines.append('\n')
+        return ''.join(lines)
+
+    def parse_lines(self, lines):
+        for line in lines:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                pass
+
+    def add(self, scan_id, record):
+        self.scans[scan_id] = record
+        self._append([ADD, scan_id, record])
+
+    def remove(self, scan_id):
+        if self.scans.pop(scan_id, None) is not None:
+            self._append([REMOVE, scan_id])
+
+    def _append(self, entry):
+        self._pending.append(entry)
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.ensure_future(self.write_pending(), loop=self.loop)
+
+    async def write_pending(self):
+        while self._pending:
+            entries, self._pending = self._pending, []
+            try:
+                await self.loop.run_in_executor(self.executor, self.write, entries)
+                if self._entries > max(self.min_compact, self.compact_ratio * len(self.scans)):
+                    await self.loop.run_in_executor(
+                        self.executor, self.compact, list(self.scans.items()))
+            except Exception:
+                statsd.increment('scanner.store.error')
+                logger.exception('Failed to write scans to %s', self.path)
+
+    async def flush(self):
+        while self._writer is not None and not self._writer.done():
+            await asyncio.shield(self._writer)
+
+    def write(self, entries):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(self.encode(entries))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._entries += len(entries)
+
+    def compact(self, scans):
+        """
+        Replaces the log with entries of active scans
+        """
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.encode([ADD, scan_id, record] for scan_id, record in scans))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        # the rename itself is durable once the directory is synced
+        fsync_dir(self.path)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._entries = len(scans)
+        statsd.increment('scanner.store.compacted')
+
+    def close(self):
+        """
+        Writes what is left synchronously, the loop may not be running any more
+        """
+        self.executor.shutdown(wait=True)
+        if self._pending:
+            entries, self._pending = self._pending, []
+            self.write(entries)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -1,9 +1,19 @@
 import asyncio
+import itertools
+import json
 import os
+from http.cookies import SimpleCookie
+from uuid import uuid4
 
 import mock
 
 from uz.client import UZClient
+from uz.client.cache import TTLCache
+from uz.client.hedging import HedgePolicy
+from uz.client.ratelimit import RateLimiter
+from uz.client.retry import RetryPolicy, CircuitBreakers
+from uz.client.token import Token
+from uz.client.utils import get_random_user_agent
 
 
 def read_file(path):
@@ -31,19 +41,45 @@ class Awaitable(object):
         return self.value
 
 
-def http_response(body, status=200):
+def http_response(body, status=200, chunk_size=None):
     response = AIOMock()
     response.status = status
-    response.read.return_value = Awaitable(str(body).encode('utf-8'))
-    response.json.return_value = Awaitable(body)
+    raw = body if isinstance(body, str) else json.dumps(body)
+    raw = raw.encode('utf-8')
+    response.read.return_value = Awaitable(raw)
+    chunk_size = chunk_size or len(raw) or 1
+    chunks = [raw[i:i + chunk_size] for i in range(0, len(raw), chunk_size)]
+    # body can be streamed again when the mock is reused
+    stream = itertools.cycle(chunks + [b''])
+    response.content.readany.side_effect = lambda: Awaitable(next(stream))
     return response
 
 
-def get_uz_client(response_mock=None):
+def get_uz_client(response_mock=None, **kwargs):
     session = AIOMock()
     if response_mock:
         session.request.return_value = response_mock
-    uz = UZClient(session)
-    # _is_token_outdated == False
-    uz._token_date = 9999999999
+    options = dict(
+        station_cache=TTLCache('test'),
+        rate_limiter=RateLimiter(), retry_policy=RetryPolicy(retries={}),
+        circuit_breakers=CircuitBreakers(), hedge_policy=HedgePolicy())
+    options.update(kwargs)
+    uz = UZClient(session, **options)
+    if 'token_provider' not in kwargs:
+        uz.token_provider._token = Token(None, get_random_user_agent(), date=9999999999)
+    return uz
+
+
+def with_token_page(uz, page):
+    """
+    Serves the token page to uz, it starts a new UZ session as UZ does
+    """
+    response = http_response(page)
+    uz.token_provider._token = None
+    uz.session.cookies = SimpleCookie()
+
+    def request(*args, **kwargs):
+        uz.session.cookies['_gv_sessid'] = uuid4().hex
+        return response
+    uz.session.request.side_effect = request
     return uz
@@ -0,0 +1,41 @@
+import mock
+
+from uz.client.cache import TTLCache
+
+
+def test_get_set():
+    cache = TTLCache('test')
+    assert cache.get('Kyiv') is None
+    cache.set('Kyiv', ['station'])
+    assert cache.get(' kyiv') == ['station']
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.hit_ratio == 0.5
+
+
+def test_lru_eviction():
+    cache = TTLCache('test', maxsize=2)
+    cache.set('a', [1])
+    cache.set('b', [2])
+    cache.get('a')
+    cache.set('c', [3])
+    assert len(cache) == 2
+    assert cache.get('b') is None
+    assert cache.get('a') == [1]
+    assert cache.get('c') == [3]
+
+
+@mock.patch('uz.client.cache.time')
+def test_ttl(time_mock):
+    time_mock.time.return_value = 1000
+    cache = TTLCache('test', ttl=100, negative_ttl=10)
+    cache.set('found', [1])
+    cache.set('not found', [])
+
+    time_mock.time.return_value = 1050
+    assert cache.get('found') == [1]
+    assert cache.get('not found') is None
+    assert len(cache) == 1
+
+    time_mock.time.return_value = 1101
+    assert cache.get('found') is None
+    assert len(cache) == 0
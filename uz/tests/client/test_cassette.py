@@ -0,0 +1,105 @@
+import json
+import time
+
+import mock
+import pytest
+
+from uz.client import cassette, exceptions
+from uz.tests import get_uz_client, http_response, read_file
+
+
+@pytest.fixture
+def cassette_path(tmpdir):
+    return str(tmpdir.join('uz.jsonl.gz'))
+
+
+def interaction(body, data=None, elapsed=0.2):
+    return cassette.Interaction(
+        'POST', 'http://booking.uz.gov.ua/en/purchase/search/', data, 200,
+        json.dumps(body).encode('utf-8'), {'_gv_sessid': 'sid'}, elapsed)
+
+
+@pytest.mark.asyncio
+async def test_record_load(cassette_path):
+    recorded = cassette.Cassette(cassette_path)
+    recorded.record(interaction({'value': 1}, data={'train': '741K', 'coach': 1}))
+    recorded.record(interaction({'value': 2}, data={'train': '741K', 'coach': 1}))
+    recorded.close()
+
+    loaded = cassette.Cassette(cassette_path).load()
+
+    assert len(loaded) == 2
+    uri = interaction(None).uri
+    bodies = [loaded.play('POST', uri, {'coach': '1', 'train': '741K'}).body for _ in range(3)]
+    assert bodies == [b'{"value": 1}', b'{"value": 2}', b'{"value": 2}']
+    with pytest.raises(exceptions.CassetteError):
+        loaded.play('POST', 'http://booking.uz.gov.ua/en/cart/add/')
+
+
+@pytest.mark.asyncio
+async def test_record_batches(cassette_path):
+    recorded = cassette.Cassette(cassette_path)
+    with mock.patch.object(recorded, 'write', wraps=recorded.write) as write:
+        for i in range(3):
+            recorded.record(interaction({'value': i}))
+        await recorded.flush()
+        recorded.record(interaction({'value': 3}))
+        await recorded.flush()
+    assert [len(args[0]) for args, _ in write.call_args_list] == [3, 1]
+    recorded.close()
+    assert len(cassette.Cassette(cassette_path).load()) == 4
+
+
+@pytest.mark.asyncio
+async def test_recording_session(cassette_path, train_raw):
+    body = {'value': [train_raw]}
+    uz = get_uz_client(http_response(body))
+    uz.session.request.return_value.cookies = {'_gv_sessid': mock.Mock(value='sid')}
+    recorder = cassette.Cassette(cassette_path)
+    uz._session = recorder.recording(uz.session)
+
+    assert await uz.call('purchase/search/', data={'train': 1}) == body
+
+    recorded = recorder.play('POST', uz.uri('purchase/search/'), {'train': 1})
+    assert json.loads(recorded.body.decode('utf-8')) == body
+    assert recorded.cookies == {'_gv_sessid': 'sid'}
+    recorder.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('speed', [None, 10])
+async def test_replay_session(cassette_path, speed):
+    recorded = cassette.Cassette(cassette_path)
+    recorded.record(interaction({'value': []}))
+    uz = get_uz_client()
+    uz._session = recorded.replaying(speed)
+
+    start = time.time()
+    assert await uz.call('purchase/search/') == {'value': []}
+    elapsed = time.time() - start
+
+    assert uz.get_session_id() == 'sid'
+    if speed:
+        assert 0.02 <= elapsed < 0.1
+    else:
+        assert elapsed < 0.02
+    recorded.close()
+
+
+@pytest.mark.asyncio
+async def test_record_replay_token_page(cassette_path):
+    page = read_file('fixtures/index.html') + '\n<p>footer</p>' * 1000
+    uz = get_uz_client(http_response(page, chunk_size=1024))
+    uz.session.request.return_value.cookies = {}
+    recorder = cassette.Cassette(cassette_path)
+    uz._session = recorder.recording(uz.session)
+    token = await uz.fetch_token()
+    assert token.value == '33107f87dadad37307f93da538b73138'
+
+    # page is recorded up to where it was read
+    recorded = recorder.play('POST', uz.uri(''))
+    assert len(recorded.body) < len(page)
+    recorder.close()
+    uz = get_uz_client()
+    uz._session = cassette.Cassette(cassette_path).load().replaying()
+    assert (await uz.fetch_token()).value == token.value
@@ -1,10 +1,13 @@
+import asyncio
+import json
 from datetime import datetime
 
 import mock
 import pytest
 
-from uz.client import client, model
-from uz.tests import http_response, get_uz_client
+from uz.client import client, exceptions, model, retry
+from uz.client.token import Token
+from uz.tests import http_response, get_uz_client, with_token_page
 
 
 class TestUZClient(object):
@@ -38,23 +41,47 @@ class TestUZClient(object):
     async def test_get_token(self, index_page):
         expected = '33107f87dadad37307f93da538b73138'
 
-        uz = get_uz_client(http_response(index_page))
-        uz._token_date = 0  # reset mocked value from previous call
+        uz = get_uz_client()
+        with_token_page(uz, index_page)
+        uz.session.cookies['_gv_sessid'] = 'old'
 
         result = await uz.get_token()
 
         assert result == expected
-        assert uz._token == expected
-        assert uz._token_date
+        assert uz._token.value == expected
+        assert uz.token_provider._token is uz._token
+        assert uz._user_agent == 'user_agent'
+        uz.session.request.assert_called_once_with(
+            'POST', self.uri(''), headers={'User-Agent': 'user_agent'})
+        # the token is good with the session it came with, which identifies the cart
+        assert uz.get_session_id() not in (None, 'old')
+
+    @pytest.mark.asyncio
+    async def test_get_token_shared(self, index_page):
+        uz = get_uz_client()
+        with_token_page(uz, index_page)
+        another = client.UZClient(uz.session, token_provider=uz.token_provider)
 
-        uz.session.cookies.clear.assert_called_once_with()
+        first = asyncio.ensure_future(uz.get_token())
+        await asyncio.sleep(0)
+        await asyncio.gather(first, another.get_token())
+
+        assert uz._token is another._token
         uz.session.request.assert_called_once_with(
             'POST', self.uri(''), headers={'User-Agent': 'user_agent'})
+        assert another.get_session_id() == uz.get_session_id()
+
+    @pytest.mark.asyncio
+    async def test_get_headers_refreshed_token(self):
+        uz = get_uz_client()
+        uz.token_provider._token = Token('new', 'new_agent', date=9999999999)
+        headers = await uz.get_headers()
+        assert (headers['User-Agent'], headers['GV-Token']) == ('new_agent', 'new')
 
     @pytest.mark.asyncio
     async def test_get_token_fail(self):
-        uz = get_uz_client(http_response(''))
-        uz._token_date = 0  # reset mocked value from previous call
+        uz = get_uz_client()
+        with_token_page(uz, '')
 
         with pytest.raises(client.FailedObtainToken):
             await uz.get_token()
@@ -74,11 +101,68 @@ class TestUZClient(object):
         uz.session.request.assert_called_once_with(
             'POST', self.uri(endpoint), headers=self.get_headers())
 
+    @pytest.mark.asyncio
+    async def test_call_error_body_truncated(self):
+        body = 'x' * 10000
+        uz = get_uz_client(http_response(body, 500))
+        with pytest.raises(client.HTTPError) as ex:
+            await uz.call('i/am/endpoint')
+        assert ex.value.body == body[:exceptions.MAX_BODY_LENGTH].encode('utf-8')
+        assert ex.value.json is None
+
+    @pytest.mark.asyncio
+    async def test_call_throttled(self):
+        uz = get_uz_client(http_response('body', 503))
+        with pytest.raises(client.HTTPError):
+            await uz.call('purchase/search/')
+
+        assert uz.rate_limiter.host.rate < uz.rate_limiter.host.max_rate
+        assert uz.rate_limiter.bucket('purchase/search').rate < uz.rate_limiter.endpoint_rate
+
+    @pytest.mark.asyncio
+    async def test_call_retry(self):
+        uz = get_uz_client()
+        uz.retry_policy = retry.RetryPolicy(base_delay=0)
+        uz.session.request.side_effect = [
+            http_response('body', 502), http_response({'hello': 'world'})]
+
+        assert await uz.call('purchase/search/') == {'hello': 'world'}
+        assert uz.session.request.call_count == 2
+        assert uz.circuit_breakers['purchase/search'].failures == 0
+
+    @pytest.mark.asyncio
+    async def test_call_circuit_open(self):
+        uz = get_uz_client(http_response('body', 502))
+        uz.circuit_breakers = retry.CircuitBreakers(threshold=1)
+
+        with pytest.raises(client.HTTPError):
+            await uz.call('purchase/search/')
+        with pytest.raises(client.CircuitOpen):
+            await uz.call('purchase/search/')
+        assert uz.session.request.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_call_local_error_is_not_recorded(self):
+        uz = get_uz_client(http_response('body', 502))
+        uz.circuit_breakers = retry.CircuitBreakers(threshold=1, reset_timeout=0)
+        breaker = uz.circuit_breakers['purchase/search']
+        with pytest.raises(client.HTTPError):
+            await uz.call('purchase/search/')
+
+        uz.rate_limiter.wait = mock.Mock(
+            side_effect=exceptions.RateLimited('purchase/search', 1))
+        with pytest.raises(exceptions.RateLimited):
+            await uz.call('purchase/search/')
+        # nothing reached UZ, the trial call is up for grabs again
+        assert breaker.opened is not None and breaker.failures == 1
+        assert breaker.available
+        assert uz.session.request.call_count == 1
+
     @pytest.mark.asyncio
     @pytest.mark.parametrize('is_raw', [True, False])
     async def test_call_ok(self, is_raw):
         body = {'hello': 'world'}
-        expected = str(body).encode('utf-8') if is_raw else body
+        expected = json.dumps(body).encode('utf-8') if is_raw else body
         endpoint = 'i/am/endpoint/ok'
 
         uz = get_uz_client(http_response(body))
@@ -101,6 +185,17 @@ class TestUZClient(object):
         assert result == expected
         self.assert_request_call(uz, endpoint)
 
+    @pytest.mark.asyncio
+    async def test_search_stations_cached(self, station_raw):
+        response = {'value': [station_raw]}
+        expected = [model.Station.from_dict(station_raw)]
+
+        uz = get_uz_client(http_response(response))
+        assert await uz.search_stations('Lviv') == expected
+        assert await uz.search_stations(' lviv ') == expected
+
+        self.assert_request_call(uz, 'purchase/station/Lviv/')
+
     @pytest.mark.asyncio
     @pytest.mark.parametrize('is_found', [True, False])
     async def test_fetch_first_station(self, is_found, station_raw):
@@ -233,7 +328,7 @@ class TestUZClient(object):
         self.assert_request_call(uz, 'cart/add/', data=data)
 
 
-@mock.patch('aiohttp.ClientSession')
+@mock.patch('uz.client.client.new_session')
 def test_client_context_manager(client_session):
     with client.UZClient() as uz:
         client_session.assert_called_once_with()
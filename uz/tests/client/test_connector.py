@@ -0,0 +1,93 @@
+import asyncio
+import socket
+
+import mock
+import pytest
+
+from uz.client import connector, session
+
+
+def test_config_from_env():
+    env = {'UZ_CONN_LIMIT': '50', 'UZ_CONN_KEEPALIVE': '120', 'UZ_DNS_CACHE': '0'}
+    with mock.patch.dict('os.environ', env):
+        config = connector.ConnectorConfig.from_env()
+    assert config.connector_kwargs() == dict(
+        limit=50, keepalive_timeout=120, conn_timeout=None)
+    assert not config.dns_cache
+    assert config.dns_ttl == 300
+
+
+def getaddrinfo(host, port, **kwargs):
+    return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('10.0.0.1', port))]
+
+
+@pytest.mark.asyncio
+async def test_dns_cache(event_loop):
+    cache = connector.DNSCache(ttl=60)
+    with mock.patch.object(event_loop, 'getaddrinfo', side_effect=asyncio.coroutine(
+            getaddrinfo)) as lookup:
+        results = await asyncio.gather(*(
+            cache.resolve(event_loop, 'booking.uz.gov.ua', 80) for _ in range(3)))
+        await cache.resolve(event_loop, 'booking.uz.gov.ua', 80)
+    assert lookup.call_count == 1
+    assert results[0] == results[2]
+    assert results[0][0]['host'] == '10.0.0.1'
+    assert results[0][0]['hostname'] == 'booking.uz.gov.ua'
+
+
+@pytest.mark.asyncio
+async def test_dns_cache_expires(event_loop):
+    cache = connector.DNSCache(ttl=0)
+    with mock.patch.object(event_loop, 'getaddrinfo', side_effect=asyncio.coroutine(
+            getaddrinfo)) as lookup:
+        await cache.resolve(event_loop, 'booking.uz.gov.ua', 80)
+        await cache.resolve(event_loop, 'booking.uz.gov.ua', 80)
+    assert lookup.call_count == 2
+
+
+def test_new_session_config():
+    config = connector.ConnectorConfig(limit=20, keepalive_timeout=60)
+    with mock.patch.object(session, 'connector_config', config):
+        default = session.new_session()
+        custom = session.new_session(limit=5)
+    try:
+        assert default.connector._limit == 20
+        assert default.connector._keepalive_timeout == 60
+        assert default.connector.dns_cache is session.dns_cache
+        assert custom.connector._limit == 5
+    finally:
+        default.close()
+        custom.close()
+
+
+@mock.patch('uz.client.connector.statsd')
+def test_report_connector_stats(statsd):
+    uz_session = session.new_session(limit=10)
+    try:
+        conn = uz_session.connector
+        conn._acquired[('booking.uz.gov.ua', 80, False)].update({'t1', 't2'})
+        conn._conns[('booking.uz.gov.ua', 80, False)] = [('t3', None, 0)]
+        stats = connector.report_connector_stats()
+    finally:
+        conn._acquired.clear()
+        conn._conns.clear()
+        uz_session.close()
+    assert stats['acquired'] >= 2
+    assert stats['idle'] >= 1
+    statsd.gauge.assert_any_call('client.connector.utilization', mock.ANY)
+
+
+def test_connector_stats_unknown_aiohttp():
+    uz_session = session.new_session(limit=10)
+    conn = uz_session.connector
+    acquired, conn._acquired = conn._acquired, None
+    try:
+        assert conn.stats() is None
+        del conn._waiters
+        assert conn.stats() is None
+        stats = connector.connector_stats()
+    finally:
+        conn._acquired = acquired
+        conn._waiters = {}
+        uz_session.close()
+    assert stats['connectors'] >= 1
@@ -0,0 +1,76 @@
+import asyncio
+
+import mock
+import pytest
+
+from uz.client import exceptions, retry
+from uz.client.deadline import Deadline
+from uz.client.token import Token, TokenProvider
+from uz.tests import http_response, get_uz_client
+
+
+def test_deadline():
+    deadline = Deadline(10)
+    assert 9 < deadline.remaining <= 10
+    assert deadline.timeout(3) == 3
+    assert 9 < deadline.timeout(30) <= 10
+    assert 9 < deadline.timeout() <= 10
+    deadline.check('purchase/search')
+
+    deadline.expires -= 10
+    assert deadline.expired
+    assert deadline.remaining == 0
+    with pytest.raises(exceptions.DeadlineExceeded) as ex:
+        deadline.check('purchase/search')
+    assert ex.value.stage == 'purchase/search'
+    assert ex.value.budget == 10
+
+
+@pytest.mark.asyncio
+async def test_call_expired():
+    uz = get_uz_client(http_response({'value': []}))
+    deadline = Deadline(0)
+    with pytest.raises(exceptions.DeadlineExceeded):
+        await uz.call('purchase/search/', deadline=deadline)
+    assert not uz.session.request.called
+
+
+@pytest.mark.asyncio
+async def test_call_gets_remaining_time():
+    response = http_response({'value': []})
+    response.read.return_value = asyncio.sleep(1)
+    uz = get_uz_client(response)
+    uz.circuit_breakers = retry.CircuitBreakers(threshold=1)
+    with pytest.raises(exceptions.DeadlineExceeded) as ex:
+        await uz.call('purchase/coach/', deadline=Deadline(0.01))
+    assert ex.value.stage == 'purchase/coach'
+    # running out of budget tells nothing about endpoint health
+    assert uz.circuit_breakers['purchase/coach'].state == 'closed'
+    assert uz.rate_limiter.host.rate == uz.rate_limiter.host.max_rate
+
+
+@pytest.mark.asyncio
+async def test_call_no_retry_after_deadline():
+    uz = get_uz_client()
+    uz.retry_policy = retry.RetryPolicy(base_delay=10, max_delay=10)
+    uz.session.request.side_effect = [
+        http_response('body', 502), http_response({'hello': 'world'})]
+    with mock.patch('uz.client.retry.random.uniform', return_value=5):
+        with pytest.raises(exceptions.HTTPError):
+            await uz.call('purchase/search/', deadline=Deadline(1))
+    assert uz.session.request.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_call_token_wait():
+    uz = get_uz_client(http_response({'value': []}))
+    fetched = asyncio.Future()
+    uz.token_provider = TokenProvider(client=mock.Mock(fetch_token=lambda: fetched))
+    with pytest.raises(exceptions.DeadlineExceeded) as ex:
+        await uz.call('purchase/search/', deadline=Deadline(0.01))
+    assert ex.value.stage == 'token'
+    assert not uz.session.request.called
+    # the fetch goes on for other callers
+    assert not fetched.cancelled()
+    fetched.set_result(Token('token', 'user_agent'))
+    assert await uz.call('purchase/search/', deadline=Deadline(1)) == {'value': []}
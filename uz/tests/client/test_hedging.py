@@ -0,0 +1,114 @@
+import asyncio
+
+import mock
+import pytest
+
+from uz.client.hedging import LatencyWindow, HedgePolicy
+from uz.tests import http_response, get_uz_client
+
+
+def test_latency_window():
+    window = LatencyWindow(size=100, refresh=1)
+    for i in range(200):
+        window.observe(i)
+    assert len(window) == 100
+    assert window.percentile(50) == 150
+    assert window.percentile(100) == 199
+
+
+def make_policy(**kwargs):
+    policy = HedgePolicy(enabled=True, min_samples=1, min_delay=0.01, budget=1, **kwargs)
+    policy.observe('purchase/search', 0.01)
+    return policy
+
+
+def make_call(*latencies):
+    calls = []
+
+    async def call(*args, **kwargs):
+        latency, result = latencies[len(calls)]
+        calls.append(latency)
+        await asyncio.sleep(latency)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return call, calls
+
+
+def test_delay():
+    policy = HedgePolicy(enabled=True, min_samples=2, min_delay=0.05, max_delay=1)
+    assert policy.delay('purchase/search') is None
+    for latency in (0.01, 0.02, 5):
+        policy.observe('purchase/search', latency)
+    assert policy.delay('purchase/search') == 1
+    policy._windows['purchase/search'] = LatencyWindow()
+    policy.observe('purchase/search', 0.01)
+    policy.observe('purchase/search', 0.01)
+    assert policy.delay('purchase/search') == 0.05
+
+
+@pytest.mark.asyncio
+async def test_not_applied():
+    policy = make_policy()
+    call, calls = make_call((0.05, 'primary'), (0, 'hedge'))
+    assert await policy.call('cart/add', call) == 'primary'
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_fast_response_not_hedged():
+    policy = make_policy()
+    call, calls = make_call((0, 'primary'), (0, 'hedge'))
+    with mock.patch('uz.client.hedging.statsd') as statsd:
+        assert await policy.call('purchase/search', call) == 'primary'
+    assert len(calls) == 1
+    assert not statsd.increment.called
+
+
+@pytest.mark.asyncio
+async def test_hedge_wins():
+    policy = make_policy()
+    call, calls = make_call((1, 'primary'), (0, 'hedge'))
+    with mock.patch('uz.client.hedging.statsd') as statsd:
+        assert await policy.call('purchase/search', call) == 'hedge'
+    assert len(calls) == 2
+    assert policy.inflight == 0
+    statsd.increment.assert_has_calls([
+        mock.call('client.hedge.fired', tags=['endpoint:purchase/search']),
+        mock.call('client.hedge.won', tags=['endpoint:purchase/search'])])
+
+
+@pytest.mark.asyncio
+async def test_failed_hedge_waits_for_primary():
+    policy = make_policy()
+    call, calls = make_call((0.05, 'primary'), (0, ValueError('hedge')))
+    assert await policy.call('purchase/search', call) == 'primary'
+
+
+@pytest.mark.asyncio
+async def test_both_failed():
+    policy = make_policy()
+    call, calls = make_call((0.05, ValueError('primary')), (0, ValueError('hedge')))
+    with pytest.raises(ValueError) as ex:
+        await policy.call('purchase/search', call)
+    assert str(ex.value) == 'primary'
+
+
+@pytest.mark.asyncio
+async def test_budget():
+    policy = make_policy()
+    policy.budget = 0.5
+    call, calls = make_call((0.05, 'primary'), (0.05, 'primary'), (0, 'hedge'))
+    assert await policy.call('purchase/search', call) == 'primary'
+    assert len(calls) == 1
+    assert await policy.call('purchase/search', call) == 'hedge'
+
+
+@pytest.mark.asyncio
+async def test_client_call_hedged():
+    uz = get_uz_client(http_response({'value': []}))
+    uz.hedge_policy = make_policy()
+    with mock.patch.object(uz, '_call', side_effect=make_call(
+            (1, 'primary'), (0, 'hedge'))[0]) as _call:
+        assert await uz.call('purchase/search/') == 'hedge'
+    assert _call.call_count == 2
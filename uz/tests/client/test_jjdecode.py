@@ -17,3 +17,22 @@ def encoded2():
 def test_jjdecoder(encoded, encoded2):
     assert JJDecoder(encoded).decode() == "alert('hello');"
     assert JJDecoder(encoded2).decode() == "alert('this is a test JJ encoded sample');"  # noqa
+
+
+def jj_script(payload):
+    return '$=~[];$.$($.$($.$$+"\\""+' + payload + '"\\"")())();'
+
+
+@pytest.mark.parametrize('payload,expected', [
+    ('"{#}"+', '{#}'),
+    ('"\\\\"+$.__$+$.___+$.__$+"\\\\"+$.__$+$.$$$+$._$_+', 'Az'),
+    ('"\\\\"+$.__$+$.$$$+$.___+"=\\\\"+$._+$.$__+$.__$+$.$$_+";"+', 'x=Ж;'),
+    ('"\\\\\\"\\\\\\\\"+$.$_$_+(![]+"")[$._$_]+$._$+$.__+$._+', '"\\alotu'),
+])
+def test_jjdecoder_escapes(payload, expected):
+    assert JJDecoder(jj_script(payload)).decode() == expected
+
+
+def test_jjdecoder_no_data():
+    with pytest.raises(Exception):
+        JJDecoder('$=~[];$.$($.$($.$$+"\\""+"\\"")())();').decode()
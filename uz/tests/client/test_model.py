@@ -1,4 +1,7 @@
-from uz.client.model import Train, CoachType, Coach, Station, UZTimestamp
+from datetime import datetime
+
+from uz.client.model import (
+    Train, LazyTrain, CoachType, Coach, Station, StationRegistry, UZTimestamp, stations)
 
 
 def assert_model(klass, dikt):
@@ -6,12 +9,21 @@ def assert_model(klass, dikt):
     assert instance.to_dict() == dikt
     exec('assert %r.to_dict() == %r' % (instance, dikt))
     assert instance == klass.from_dict(dikt)
+    assert hash(instance) == hash(klass.from_dict(dikt))
+    assert not hasattr(instance, '__dict__')
     assert str(instance)
     return instance
 
 
+def int_station_ids(train_raw):
+    for point in (train_raw['from'], train_raw['till']):
+        point['station_id'] = int(point['station_id'])
+    return train_raw
+
+
 def test_train(train_raw):
-    train = assert_model(Train, train_raw)
+    # search results have station ids as strings
+    train = assert_model(Train, int_station_ids(train_raw))
     assert train.info()
 
 
@@ -23,9 +35,69 @@ def test_coach_type(coach_type_raw):
     assert_model(CoachType, coach_type_raw)
 
 
+def test_coach_type_places(coach_type_raw):
+    coach_type = CoachType.from_dict(coach_type_raw)
+    seen = {coach_type}
+    coach_type.places += 1
+    # hash stays the same, equality follows places
+    assert coach_type in seen
+    assert CoachType.from_dict(coach_type_raw) != coach_type
+
+
 def test_coach(coach_raw):
     assert_model(Coach, coach_raw)
 
 
 def test_uz_timestamp(uz_timestamp):
     assert_model(UZTimestamp, uz_timestamp)
+
+
+def test_train_eq(train_raw):
+    train = Train.from_dict(train_raw)
+    other = Train.from_dict(train_raw)
+    other.coach_types[0].places -= 1
+    assert train != other
+    assert train != train_raw
+    assert len({train, Train.from_dict(train_raw)}) == 1
+
+
+def test_uz_timestamp_datetime(uz_timestamp):
+    timestamp = UZTimestamp.from_dict(uz_timestamp)
+    assert timestamp.datetime == datetime.fromtimestamp(uz_timestamp['date'])
+    assert timestamp.datetime is timestamp.datetime
+
+
+def test_lazy_train(train_raw):
+    train = LazyTrain(train_raw)
+    assert train.num == '741К'
+    # nested fields are not parsed until read
+    assert 'departure_time' not in train.__dict__
+    assert train == Train.from_dict(train_raw)
+    assert hash(train) == hash(Train.from_dict(train_raw))
+    assert train.to_dict() == int_station_ids(train_raw)
+    assert train.coach_types is train.coach_types
+    train.num = 'X3'
+    train.departure_time = None
+    assert (train.num, train.departure_time) == ('X3', None)
+
+
+def test_station_registry():
+    registry = StationRegistry()
+    station = registry.get(2200001, 'Kyiv')
+    assert registry.get(2200001, 'Kyiv') is station
+    # the same station from the stations lookup
+    assert registry.get('2200001', 'KYIV') is station
+    assert station.title == 'Kyiv'
+    assert registry.get(2218000, 'Lviv') is not station
+    assert len(registry) == 2
+    assert {station: 1}[Station(2200001, 'Kyiv')] == 1
+
+
+def test_stations_interned(train_raw, station_raw):
+    train = Train.from_dict(train_raw)
+    assert LazyTrain(train_raw).source_station is train.source_station
+    assert Station.from_dict(station_raw) is Station.from_dict(station_raw)
+    assert stations.get(station_raw['station_id'], station_raw['title']) is \
+        Station.from_dict(station_raw)
+    # the same station in search results, with id as a string
+    assert train.source_station is Station.from_dict(station_raw)
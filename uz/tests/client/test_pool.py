@@ -0,0 +1,258 @@
+import asyncio
+
+import mock
+import pytest
+
+from uz.client.deadline import Deadline
+from uz.client.exceptions import DeadlineExceeded
+from uz.client.pool import BookingPool, ClientPool, IdentityPool
+from uz.client.token import TokenProvider
+from uz.tests import AIOMock, Awaitable, get_uz_client, with_token_page
+
+
+def get_pool(size=2):
+    pool = ClientPool(size=size)
+    pool.make_client = mock.Mock(side_effect=lambda: mock.Mock(
+        get_token=mock.Mock(return_value=Awaitable('token'))))
+    return pool
+
+
+@pytest.mark.asyncio
+async def test_start_warms_up_clients():
+    pool = get_pool()
+    await pool.start()
+    assert pool.make_client.call_count == 2
+    for client in pool._clients:
+        client.get_token.assert_called_once_with()
+
+
+@pytest.mark.asyncio
+async def test_checkout_and_return():
+    pool = get_pool(size=1)
+    async with pool.client() as client:
+        assert pool._queue.empty()
+        waiter = asyncio.ensure_future(pool.acquire())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+    assert await asyncio.wait_for(waiter, 1) is client
+    pool.release(client)
+    assert pool._queue.qsize() == 1
+
+
+@pytest.mark.asyncio
+async def test_close():
+    pool = get_pool()
+    client = await pool.acquire()
+    clients = list(pool._clients)
+    pool.close()
+    pool.release(client)
+    for i in clients:
+        i.session.close.assert_called_once_with()
+    assert pool._queue is None
+
+
+@pytest.mark.asyncio
+async def test_run_refreshes_idle_clients():
+    pool = get_pool()
+    busy = await pool.acquire()
+    idle, = [i for i in pool._clients if i is not busy]
+    for client in pool._clients:
+        client.token_provider.needs_refresh.return_value = True
+    task = asyncio.ensure_future(pool.run(check_interval=0.01))
+    await asyncio.sleep(0.02)
+    pool.stop()
+    await asyncio.wait_for(task, 1)
+
+    assert idle.token_provider.start_refresh.called
+    # a refresh would replace cookies under its requests
+    assert not busy.token_provider.start_refresh.called
+
+
+def get_booking_pool(size=2, fail=False):
+    def make_client():
+        client = mock.Mock()
+        client.token_provider.needs_refresh.return_value = False
+        if fail:
+            client.get_token.side_effect = ValueError('boom')
+        else:
+            client.get_token.side_effect = lambda deadline=None: Awaitable('token')
+        return client
+
+    pool = BookingPool(size=size)
+    pool.make_client = mock.Mock(side_effect=make_client)
+    return pool
+
+
+@pytest.mark.asyncio
+async def test_booking_pool_refill():
+    pool = get_booking_pool()
+    pool.maintain()
+    pool.maintain()
+    await asyncio.sleep(0.01)
+    assert len(pool) == 2
+    assert pool.make_client.call_count == 2
+
+    client = await pool.acquire()
+    client.get_token.assert_called_once_with()
+    await asyncio.sleep(0.01)
+    assert len(pool) == 2
+    assert client not in pool._idle
+    pool.close()
+    assert len(pool) == 0
+
+
+@pytest.mark.asyncio
+async def test_booking_pool_client_session_id(index_page):
+    pool = BookingPool(size=1)
+    make_client = pool.make_client
+    pool.make_client = lambda: with_token_page(make_client(), index_page)
+    pool.maintain = mock.Mock()
+
+    with mock.patch('uz.client.pool.new_session', AIOMock):
+        client = await pool.acquire()
+    # the cart of the booking is paid for with this session
+    assert client.get_session_id() is not None
+
+
+@pytest.mark.asyncio
+async def test_booking_pool_drop_stale():
+    pool = get_booking_pool(size=1)
+    pool.maintain()
+    await asyncio.sleep(0.01)
+    stale = pool._idle[0]
+    stale.token_provider.needs_refresh.return_value = True
+
+    client = await pool.acquire()
+
+    assert client is not stale
+    stale.session.close.assert_called_once_with()
+    client.get_token.assert_called_once_with(None)
+
+
+@pytest.mark.asyncio
+async def test_booking_pool_release():
+    pool = get_booking_pool(size=1)
+    pool.maintain()
+    await asyncio.sleep(0.01)
+    client = await pool.acquire()
+    pool.release(client)
+    # the released client takes the place of the one warming up
+    assert list(pool._idle) == [client]
+    await asyncio.sleep(0.01)
+    assert list(pool._idle) == [client]
+    assert pool.make_client.call_count == 2
+    assert not client.session.close.called
+
+    stale = await pool.acquire()
+    stale.token_provider.needs_refresh.return_value = True
+    pool.release(stale)
+    stale.session.close.assert_called_once_with()
+    assert stale not in pool._idle
+
+
+@pytest.mark.asyncio
+async def test_booking_pool_warm_up_fail():
+    pool = get_booking_pool(size=1, fail=True)
+    pool.maintain()
+    await asyncio.sleep(0.01)
+    assert len(pool) == 0
+    assert pool._warming == 0
+
+
+@pytest.mark.asyncio
+async def test_booking_pool_miss_fail():
+    pool = get_booking_pool(size=1, fail=True)
+    clients = []
+    make_client = pool.make_client.side_effect
+    pool.make_client.side_effect = lambda: clients.append(make_client()) or clients[-1]
+    pool.maintain = mock.Mock()
+
+    with pytest.raises(ValueError):
+        await pool.acquire()
+    client, = clients
+    client.session.close.assert_called_once_with()
+
+
+@pytest.mark.asyncio
+async def test_booking_pool_miss_deadline():
+    pool = BookingPool(size=1)
+    client = get_uz_client()
+    fetched = asyncio.Future()
+    client.token_provider = TokenProvider(client=mock.Mock(fetch_token=lambda: fetched))
+    pool.make_client = mock.Mock(return_value=client)
+    pool.maintain = mock.Mock()
+
+    with pytest.raises(DeadlineExceeded) as ex:
+        await pool.acquire(Deadline(0.01))
+    assert ex.value.stage == 'token'
+    client.session.close.assert_called_once_with()
+    fetched.cancel()
+
+
+def get_identity_pool(size=3):
+    pool = IdentityPool(size=size)
+    pool.make_client = mock.Mock(side_effect=lambda: mock.Mock(
+        get_token=mock.Mock(return_value=Awaitable('token'))))
+    return pool
+
+
+def test_identities_round_robin():
+    pool = get_identity_pool()
+    clients = [pool.select() for _ in range(6)]
+    assert len(pool) == 3
+    assert len(set(clients)) == 3
+    assert clients[:3] == clients[3:]
+
+
+@pytest.mark.asyncio
+async def test_identities_least_loaded():
+    pool = get_identity_pool()
+    async with pool.client() as first:
+        async with pool.client() as second:
+            third = pool.acquire()
+            assert len({first, second, third}) == 3
+            pool.release(third)
+            assert pool.select() is third
+    assert set(pool._load.values()) == {0}
+
+
+@pytest.mark.asyncio
+async def test_identities_start_and_close():
+    pool = get_identity_pool(size=2)
+    await pool.start()
+    clients = list(pool._clients)
+    for client in clients:
+        client.get_token.assert_called_once_with()
+    pool.close()
+    for client in clients:
+        client.session.close.assert_called_once_with()
+    assert len(pool) == 0
+
+
+@pytest.mark.asyncio
+async def test_identities_refresh_unused():
+    pool = get_identity_pool(size=2)
+    async with pool.client() as busy:
+        idle, = [i for i in pool._clients if i is not busy]
+        task = asyncio.ensure_future(pool.run(check_interval=0.01))
+        await asyncio.sleep(0.02)
+        assert idle.token_provider.start_refresh.called
+        # a refresh would replace cookies under the scans using it
+        assert not busy.token_provider.start_refresh.called
+    await asyncio.sleep(0.02)
+    pool.stop()
+    await asyncio.wait_for(task, 1)
+    assert busy.token_provider.start_refresh.called
+
+
+def test_identities_are_isolated():
+    pool = IdentityPool(size=2)
+    first, second = pool.select(), pool.select()
+    try:
+        assert first.session is not second.session
+        assert first.session.cookies is not second.session.cookies
+        assert first.token_provider is not second.token_provider
+        # tokens come along with cookies of the sessions they are sent with
+        assert first.token_provider.client is first
+    finally:
+        pool.close()
@@ -0,0 +1,116 @@
+import time
+
+import mock
+import pytest
+
+from uz.client import exceptions
+from uz.client.ratelimit import RateLimiter, TokenBucket, endpoint_key
+
+
+@pytest.mark.parametrize('endpoint,expected', [
+    ('', 'token'),
+    ('purchase/station/Kyiv/', 'purchase/station'),
+    ('purchase/search/', 'purchase/search'),
+    ('cart/add/', 'cart/add')])
+def test_endpoint_key(endpoint, expected):
+    assert endpoint_key(endpoint) == expected
+
+
+@mock.patch('uz.client.ratelimit.time')
+def test_token_bucket(time_mock):
+    time_mock.monotonic.return_value = 100
+    bucket = TokenBucket(rate=2, capacity=2)
+    for _ in range(2):
+        assert bucket.delay() == 0
+        bucket.consume()
+    assert bucket.delay() == 0.5
+    bucket.consume()
+    assert bucket.delay() == 1
+
+    time_mock.monotonic.return_value = 101
+    assert bucket.delay() == 0
+
+
+def test_token_bucket_adaptive():
+    bucket = TokenBucket(rate=10, min_rate=2, cooldown=0)
+    bucket.penalize()
+    assert bucket.rate == 5
+    bucket.penalize()
+    bucket.penalize()
+    assert bucket.rate == 2
+    for _ in range(1000):
+        bucket.reward()
+    assert bucket.rate == 10
+
+
+@mock.patch('uz.client.ratelimit.time')
+def test_token_bucket_cooldown(time_mock):
+    time_mock.monotonic.return_value = 100
+    bucket = TokenBucket(rate=16, min_rate=1, cooldown=1)
+    # a burst of errors of requests in flight
+    for _ in range(5):
+        bucket.penalize()
+    assert bucket.rate == 8
+    time_mock.monotonic.return_value = 101
+    bucket.penalize()
+    assert bucket.rate == 4
+
+
+@pytest.mark.asyncio
+async def test_wait():
+    limiter = RateLimiter(host_rate=100, endpoint_rate=20, max_wait=0.1)
+    limiter.bucket('purchase/search').tokens = 1
+    start = time.time()
+    await limiter.wait('purchase/search/')
+    assert time.time() - start < 0.04
+    await limiter.wait('purchase/search/')
+    assert 0.04 < time.time() - start < 0.1
+
+    limiter.bucket('purchase/search').tokens = -5
+    with pytest.raises(exceptions.RateLimited) as ex:
+        await limiter.wait('purchase/search/')
+    assert ex.value.endpoint == 'purchase/search'
+    assert str(exceptions.RateLimited('purchase/search', 0.594)) == \
+        'endpoint purchase/search is rate limited, wait 0.6s'
+    await limiter.wait('purchase/coach/')
+
+
+@pytest.mark.parametrize('status,error,throttled', [
+    (200, False, False),
+    (400, False, False),
+    (429, False, True),
+    (502, False, True),
+    (None, False, True),
+    (200, True, False)])
+def test_report(status, error, throttled):
+    limiter = RateLimiter(host_rate=10, endpoint_rate=10)
+    limiter.host.rate = limiter.bucket('purchase/search').rate = 8
+    limiter.report('purchase/search/', status, error)
+    expected = 4 if throttled else (8 if error else 8.1)
+    assert round(limiter.host.rate, 6) == expected
+    assert round(limiter.bucket('purchase/search').rate, 6) == expected
+
+
+def test_report_error_spike():
+    limiter = RateLimiter(host_rate=10, endpoint_rate=10, error_spike=3)
+    for _ in range(2):
+        limiter.report('purchase/search/', error=True)
+    assert limiter.host.rate == 10
+    limiter.report('purchase/search/', error=True)
+    assert limiter.host.rate == 5
+
+
+@pytest.mark.asyncio
+async def test_isolated():
+    limiter = RateLimiter(host_rate=10, endpoint_rate=10, max_wait=0.1)
+    limiter.report('purchase/search/', 503)
+    limiter.host.tokens = -100
+    # scans exhausted the host bucket, booking does not wait for it
+    await limiter.wait('cart/add/')
+    with pytest.raises(exceptions.RateLimited):
+        await limiter.wait('purchase/search/')
+
+    limiter.report('cart/add/', 503)
+    assert limiter.host.rate == 5
+    assert limiter.bucket('cart/add').rate == 5
+    assert limiter.bucket('purchase/search').rate == 5
@@ -0,0 +1,70 @@
+import asyncio
+
+import mock
+import pytest
+
+from uz.client import exceptions
+from uz.client.retry import CircuitBreaker, CircuitBreakers, RetryPolicy, is_failure
+
+
+@pytest.mark.parametrize('ex,expected', [
+    (exceptions.HTTPError(500, 'body'), True),
+    (exceptions.FailedObtainToken(), True),
+    (asyncio.TimeoutError(), True),
+    (exceptions.BadRequest(400, 'body'), False),
+    (exceptions.ResponseError(200, 'body'), False),
+    (ValueError(), False)])
+def test_is_failure(ex, expected):
+    assert is_failure(ex) is expected
+
+
+@pytest.mark.parametrize('key,ex,attempt,retry', [
+    ('purchase/search', exceptions.HTTPError(500, 'body'), 0, True),
+    ('purchase/search', exceptions.HTTPError(500, 'body'), 2, False),
+    ('purchase/search', exceptions.FailedObtainToken(), 0, True),
+    ('purchase/search', exceptions.FailedObtainToken(), 1, False),
+    ('purchase/search', exceptions.ResponseError(200, 'body'), 0, False),
+    ('cart/add', asyncio.TimeoutError(), 0, False)])
+def test_backoff(key, ex, attempt, retry):
+    policy = RetryPolicy(base_delay=1, max_delay=3)
+    delay = policy.backoff(key, ex, attempt)
+    if retry:
+        assert 0 <= delay <= min(3, 2 ** attempt)
+    else:
+        assert delay is None
+
+
+@mock.patch('uz.client.retry.time')
+def test_circuit_breaker(time_mock):
+    time_mock.time.return_value = 100
+    breaker = CircuitBreaker('purchase/search', threshold=2, reset_timeout=10)
+    assert breaker.state == breaker.CLOSED
+    breaker.record(success=False)
+    assert breaker.allow()
+    breaker.record(success=False)
+    assert breaker.state == breaker.OPEN
+    assert not breaker.allow()
+    assert breaker.retry_in == 10
+
+    time_mock.time.return_value = 111
+    assert breaker.state == breaker.HALF_OPEN
+    assert breaker.available
+    assert breaker.allow()
+    assert not breaker.available
+    assert not breaker.allow()
+    breaker.record(success=False)
+    assert breaker.state == breaker.OPEN
+
+    time_mock.time.return_value = 122
+    assert breaker.allow()
+    breaker.record(success=True)
+    assert breaker.state == breaker.CLOSED
+    assert breaker.failures == 0
+
+
+def test_circuit_breakers():
+    breakers = CircuitBreakers(threshold=1)
+    assert breakers['cart/add'] is breakers['cart/add']
+    assert breakers.open() == []
+    breakers['cart/add'].record(success=False)
+    assert breakers.open() == [breakers['cart/add']]
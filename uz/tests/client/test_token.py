@@ -0,0 +1,66 @@
+import asyncio
+
+import mock
+import pytest
+
+from uz.client.token import Token, TokenProvider
+from uz.tests import Awaitable
+
+
+def get_client(*tokens):
+    client = mock.Mock()
+    client.fetch_token.side_effect = [Awaitable(i) for i in tokens]
+    return client
+
+
+@pytest.mark.asyncio
+async def test_get_miss_and_hit():
+    token = Token('token', 'ua')
+    client = get_client(token)
+    provider = TokenProvider(client=client)
+
+    assert await provider.get() is token
+    assert await provider.get() is token
+    client.fetch_token.assert_called_once_with()
+
+
+@pytest.mark.asyncio
+async def test_get_single_flight():
+    token = Token('token', 'ua')
+    client = get_client(token)
+    provider = TokenProvider(client=client)
+
+    result = await asyncio.gather(*(provider.get() for _ in range(5)))
+
+    assert result == [token] * 5
+    client.fetch_token.assert_called_once_with()
+
+
+@pytest.mark.asyncio
+async def test_get_waits_for_refresh():
+    old = Token('old', 'ua')
+    new = Token('new', 'ua')
+    client = get_client(new)
+    provider = TokenProvider(client, max_age=10, refresh_margin=5)
+    provider._token = old
+    old.date = new.date - 7
+    assert provider.needs_refresh()
+
+    # expiring token is still good, it is refreshed while the session is idle
+    assert await provider.get() is old
+    assert not client.fetch_token.called
+    provider.start_refresh()
+    # cookies of the old token are being replaced
+    assert await provider.get() is new
+    client.fetch_token.assert_called_once_with()
+
+
+@pytest.mark.asyncio
+async def test_refresh_error():
+    client = mock.Mock()
+    client.fetch_token.side_effect = [ValueError('boom')]
+    provider = TokenProvider(client=client)
+
+    with pytest.raises(ValueError):
+        await provider.get()
+    assert provider._refresh_task is None
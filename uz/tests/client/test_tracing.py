@@ -0,0 +1,41 @@
+import mock
+import pytest
+
+from uz.client import tracing
+from uz.tests import http_response, get_uz_client
+
+
+@pytest.mark.parametrize('path,expected', [
+    ('/en/', 'token'),
+    ('/en/purchase/search/', 'purchase/search'),
+    ('/en/purchase/station/Kyiv/', 'purchase/station')])
+def test_request_endpoint(path, expected):
+    assert tracing.request_endpoint(path) == expected
+
+
+def test_tracer_disabled():
+    assert tracing.Tracer().start('cart/add') is tracing.NOOP_TRACE
+
+
+@mock.patch('uz.client.tracing.statsd')
+def test_request_trace(statsd):
+    trace = tracing.Tracer(enabled=True).start('cart/add')
+    for phase in ('headers', 'wait', 'ttfb', 'body'):
+        trace.mark(phase)
+    trace.finish(200)
+
+    tags = ['endpoint:cart/add', 'status:200']
+    metrics = [args[0] for args, kwargs in statsd.histogram.call_args_list]
+    assert metrics == ['client.request.{}'.format(i) for i in (
+        'headers', 'wait', 'ttfb', 'body', 'parse', 'total')]
+    for args, kwargs in statsd.histogram.call_args_list:
+        assert kwargs == {'tags': tags}
+
+
+@pytest.mark.asyncio
+async def test_call_traced():
+    uz = get_uz_client(http_response('body', 502), tracer=tracing.Tracer(enabled=True))
+    with mock.patch('uz.client.tracing.statsd') as statsd, pytest.raises(Exception):
+        await uz.call('purchase/search/')
+    statsd.histogram.assert_any_call(
+        'client.request.total', mock.ANY, tags=['endpoint:purchase/search', 'status:502'])
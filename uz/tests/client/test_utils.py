@@ -0,0 +1,59 @@
+import mock
+import pytest
+
+from uz.client import utils
+from uz.client.cache import TTLCache
+from uz.tests import http_response, read_file
+
+
+TOKEN = '33107f87dadad37307f93da538b73138'
+
+
+@pytest.fixture
+def page():
+    return read_file('fixtures/index.html')
+
+
+def test_parse_gv_token(page):
+    assert utils.parse_gv_token(page) == TOKEN
+    assert utils.parse_gv_token('<html></html>') is None
+
+
+@pytest.mark.asyncio
+async def test_parse_gv_token_async_memoized(page):
+    with mock.patch.object(utils, 'jj_cache', TTLCache('test')) as cache, \
+            mock.patch.object(utils, 'JJDecoder', wraps=utils.JJDecoder) as decoder:
+        assert await utils.parse_gv_token_async(page) == TOKEN
+        assert await utils.parse_gv_token_async(page) == TOKEN
+    assert decoder.call_count == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_parse_gv_token_async_no_code():
+    assert await utils.parse_gv_token_async('<html></html>') is None
+
+
+@pytest.mark.asyncio
+async def test_read_token_script(page):
+    tail = '\n<p>footer</p>' * 1000
+    response = http_response(page + tail, chunk_size=512)
+    script = await utils.read_token_script(response)
+    assert utils.parse_gv_token(script.decode('utf-8')) == TOKEN
+    assert response.close.called
+    assert response.content.readany.call_count < len(page + tail) // 512
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('chunk_size', [1, 7, 4096])
+async def test_read_token_script_until_eof(page, chunk_size):
+    response = http_response(page, chunk_size=chunk_size)
+    script = await utils.read_token_script(response)
+    assert script == utils.JJ_CODE_BYTES_PATTERN.search(page.encode('utf-8')).group()
+    assert not response.close.called
+
+
+@pytest.mark.asyncio
+async def test_read_token_script_no_code():
+    response = http_response('<html>\n</html>', chunk_size=3)
+    assert await utils.read_token_script(response) == b'<html>\n</html>'
@@ -6,6 +6,15 @@ from uz import utils
 from uz.client import model, utils as client_utils
 
 
+@pytest.fixture(autouse=True)
+def stations():
+    """
+    Stations interned by a test do not leak into the others
+    """
+    model.stations.clear()
+    return model.stations
+
+
 @pytest.fixture(autouse=True)
 def user_agent():
     ua = 'user_agent'
@@ -132,7 +132,7 @@ async def test_scan(source_station, destination_station, ct_letter):
         'train_num': train_num,
         'ct_letter': ct_letter})
     scanner.add_item.assert_called_once_with(
-        mock.ANY, firstname, lastname, date, source_station, destination_station,
+        [CHAT_ID, 'private'], firstname, lastname, date, source_station, destination_station,
         train_num, ct_letter)
     expected = ('Scanning tickets for train {train} from {src} to {dst} on {date}.\n'
                 'To monitor scan status: /status_{sid}\n'
@@ -157,3 +157,12 @@ async def test_help_msg():
     bot.send_message = send_message = mock.MagicMock(return_value=Awaitable())
     await bot._process_message(tg_message('/help'))
     send_message.assert_called_once_with(CHAT_ID, mock.ANY)
+
+
+@pytest.mark.asyncio
+async def test_ticket_booked_cb():
+    bot.send_message = send_message = mock.MagicMock(return_value=Awaitable())
+    callback_id = bot.callback_id(tg_message('/scan'))
+    await bot.ticket_booked_cb(callback_id, 'sid')
+    assert send_message.call_args[0][0] == CHAT_ID
+    assert 'sid' in get_reply(send_message)
@@ -12,8 +12,9 @@ from uz.interface import serializer
 @pytest.mark.asyncio
 async def test_deserializer(station_raw, another_station_raw):
     uz = get_uz_client()
-    uz.session.request.side_effect = (http_response({'value': [station_raw]}),
-                                      http_response({'value': [another_station_raw]}))
+    responses = {uz.uri('purchase/station/{}/'.format(i['title'])): http_response({'value': [i]})
+                 for i in (station_raw, another_station_raw)}
+    uz.session.request.side_effect = lambda method, uri, **kw: responses[uri]
     date = datetime(2016, 10, 21)
 
     result = await serializer.Deserializer(uz).load(dict(
@@ -21,9 +22,9 @@ async def test_deserializer(station_raw, another_station_raw):
         source=station_raw['title'],
         destination=another_station_raw['title']))
     assert result == (date, Station.from_dict(station_raw), Station.from_dict(another_station_raw))
-    calls = [mock.call('POST', uz.uri('purchase/station/{}/'.format(i['title'])), headers=mock.ANY)
-             for i in (station_raw, another_station_raw)]
-    assert uz.session.request.call_args_list == calls
+    calls = [mock.call('POST', i, headers=mock.ANY) for i in responses]
+    uz.session.request.assert_has_calls(calls, any_order=True)
+    assert uz.session.request.call_count == 2
 
 
 @pytest.mark.asyncio
@@ -0,0 +1,41 @@
+import mock
+
+from uz.availability import AvailabilitySnapshot
+from uz.client.model import CoachType
+
+
+def with_places(train, *places):
+    train.coach_types = [
+        CoachType(i.letter, n, i.title) for i, n in zip(train.coach_types, places)]
+    return train
+
+
+def test_update(train):
+    snapshot = AvailabilitySnapshot()
+    route = 'route'
+    assert snapshot.update(route, [with_places(train, 0, 5)]) == {(train.num, 'К')}
+    assert snapshot.update(route, [with_places(train, 0, 5)]) == set()
+    assert snapshot.update(route, [with_places(train, 2, 3)]) == {(train.num, 'Л')}
+    assert snapshot.update(route, [with_places(train, 2, 4)]) == {(train.num, 'К')}
+    assert snapshot.update(route, []) == set()
+    assert snapshot.update(route, [with_places(train, 2, 4)]) == {
+        (train.num, 'Л'), (train.num, 'К')}
+
+
+def test_refresh(train):
+    snapshot = AvailabilitySnapshot(refresh=60)
+    with mock.patch('uz.availability.time.monotonic', side_effect=[0, 30, 60, 70]):
+        assert len(snapshot.update('route', [with_places(train, 0, 5)])) == 1
+        assert len(snapshot.update('route', [with_places(train, 0, 5)])) == 0
+        assert len(snapshot.update('route', [with_places(train, 0, 5)])) == 1
+        assert len(snapshot.update('route', [with_places(train, 0, 5)])) == 0
+
+
+def test_forget_retain(train):
+    snapshot = AvailabilitySnapshot()
+    snapshot.update('route', [train])
+    snapshot.update('other', [train])
+    snapshot.forget('route', [(train.num, 'К')])
+    assert snapshot.update('route', [train]) == {(train.num, 'К')}
+    snapshot.retain(['route'])
+    assert len(snapshot) == 1
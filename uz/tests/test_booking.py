@@ -0,0 +1,126 @@
+import asyncio
+
+import mock
+import pytest
+
+from uz.tests import Awaitable
+
+from uz import booking
+from uz.client import exceptions, model
+from uz.client.pool import BookingPool
+
+
+def get_uz_client(coaches, seats, booked=()):
+    uz = mock.Mock()
+    uz.list_coaches.side_effect = lambda train, ct, deadline: Awaitable(coaches[ct.letter])
+    uz.list_seats.side_effect = lambda train, coach, deadline: Awaitable(seats[coach.num])
+
+    def book_seat(train, coach, seat, firstname, lastname, deadline):
+        if seat in booked:
+            return Awaitable()
+        raise exceptions.ResponseError(200, 'body')
+
+    uz.book_seat.side_effect = book_seat
+    uz.get_session_id.return_value = 'ssid'
+    return uz
+
+
+def get_engine(*clients, **kwargs):
+    pool = mock.Mock()
+    pool.acquire.side_effect = [Awaitable(i) for i in clients]
+    pool.close_client = BookingPool.close_client
+    return booking.BookingEngine(pool, **kwargs)
+
+
+def make_coach(num):
+    return model.Coach(False, 'Б', 3, True, num, 10, {'А': 33850}, 1700, [])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('booked', [True, False])
+async def test_book(booked, train, coach):
+    uz = get_uz_client({'Л': [coach]}, {coach.num: ['1']}, booked=['1'] if booked else [])
+    engine = get_engine(uz)
+
+    result = await engine.book(train, train.coach_types[:1], 'firstname', 'lastname')
+
+    assert result == ('ssid' if booked else None)
+    uz.book_seat.assert_called_once_with(train, coach, '1', 'firstname', 'lastname', None)
+    if booked:
+        uz.session.close.assert_called_once_with()
+        assert not engine.booking_pool.release.called
+    else:
+        # nothing went into the cart, the client is good for another booking
+        engine.booking_pool.release.assert_called_once_with(uz)
+        assert not uz.session.close.called
+
+
+@pytest.mark.asyncio
+async def test_book_all_coaches(train):
+    coaches = {'Л': [make_coach(1), make_coach(2)], 'К': [make_coach(3)]}
+    seats = {1: ['11'], 2: [], 3: ['31', '32']}
+    uz = get_uz_client(coaches, seats, booked=['32'])
+    engine = get_engine(uz)
+
+    result = await engine.book(train, train.coach_types, 'firstname', 'lastname')
+
+    assert result == 'ssid'
+    assert uz.list_coaches.call_count == 2
+    assert uz.list_seats.call_count == 3
+    assert '32' in [c[0][2] for c in uz.book_seat.call_args_list]
+    uz.session.close.assert_called_once_with()
+
+
+@pytest.mark.asyncio
+async def test_book_single_cart(train):
+    coaches = {'Л': [make_coach(1)]}
+    seats = {1: ['1', '2', '3']}
+    uz = get_uz_client(coaches, seats)
+    in_flight = []
+
+    def book_seat(train, coach, seat, firstname, lastname, deadline):
+        in_flight.append(seat)
+        assert len(in_flight) == 1, 'seats are added to the cart one at a time'
+
+        async def add_to_cart():
+            await asyncio.sleep(0)
+            in_flight.remove(seat)
+            if seat == '1':
+                raise exceptions.ResponseError(200, 'body')
+        return add_to_cart()
+
+    uz.book_seat.side_effect = book_seat
+    engine = get_engine(uz)
+
+    result = await engine.book(train, train.coach_types[:1], 'firstname', 'lastname')
+
+    assert result == 'ssid'
+    # nothing is tried once a seat is in the cart
+    assert [c[0][2] for c in uz.book_seat.call_args_list] == ['1', '2']
+    engine.booking_pool.acquire.assert_called_once_with(None)
+    uz.session.close.assert_called_once_with()
+
+
+@pytest.mark.asyncio
+async def test_book_coaches_error(train):
+    uz = get_uz_client({}, {})
+    uz.list_coaches.side_effect = exceptions.HTTPError(500, 'body')
+    engine = get_engine(uz)
+
+    with pytest.raises(exceptions.HTTPError):
+        await engine.book(train, train.coach_types[:1], 'firstname', 'lastname')
+    engine.booking_pool.release.assert_called_once_with(uz)
+    assert not uz.session.close.called
+
+
+@pytest.mark.asyncio
+async def test_book_cart_unknown(train, coach):
+    uz = get_uz_client({'Л': [coach]}, {coach.num: ['1', '2']})
+    uz.book_seat.side_effect = exceptions.HTTPError(502, 'body')
+    engine = get_engine(uz)
+
+    with pytest.raises(exceptions.HTTPError):
+        await engine.book(train, train.coach_types[:1], 'firstname', 'lastname')
+    # the seat may be in the cart, nobody else gets the session
+    uz.session.close.assert_called_once_with()
+    assert not engine.booking_pool.release.called
@@ -9,6 +9,26 @@ from flaky import flaky
 from uz.tests import AIOMock, Awaitable
 
 from uz import scanner, client
+from uz.client.deadline import Deadline
+from uz.client.retry import CircuitBreakers
+from uz.store import LogStore
+
+
+def due_routes(instance):
+    """
+    Scans grouped by route as run() starts them, once all of them are due
+    """
+    now = instance.scheduler.time() + 3600
+    with mock.patch.object(instance.scheduler, 'time', return_value=now):
+        return instance.due_routes()
+
+
+def mock_identities(instance):
+    uz = AIOMock()
+    instance.identities = mock.Mock()
+    instance.identities.client.return_value = uz
+    instance.identities.run.side_effect = lambda: Awaitable()
+    return uz
 
 
 @flaky(max_runs=5)
@@ -50,10 +70,11 @@ class TestUZScannerLive(object):
 
 
 @pytest.mark.asyncio
-async def test_run_stop(patch_sleep_resolution, source_station, destination_station):
+async def test_run_stop(source_station, destination_station):
     instance = scanner.UZScanner(mock.Mock(), 0)
-    instance.scan = AIOMock()
-    instance.session = mock.Mock()
+    instance.scan_route = mock.Mock(side_effect=lambda items: Awaitable())
+    mock_identities(instance)
+    instance.booking_pool = mock.Mock()
     run_task = instance.run()
     asyncio.ensure_future(run_task)
 
@@ -68,7 +89,7 @@ async def test_run_stop(patch_sleep_resolution, source_station, destination_stat
         train_num, ct_letter)
 
     await asyncio.sleep(0)
-    instance.scan.assert_called_once_with(scan_id, mock.ANY)
+    instance.scan_route.assert_called_once_with([(scan_id, mock.ANY)])
 
     assert instance.status(scan_id) == (0, None)
 
@@ -79,10 +100,21 @@ async def test_run_stop(patch_sleep_resolution, source_station, destination_stat
     with pytest.raises(scanner.UknkownScanID):
         instance.abort(scan_id)
 
+    # nothing is scheduled, the loop waits for a scan to be added
+    await asyncio.sleep(0.1)
+    instance.scan_route.reset_mock()
+    other_id = instance.add_item(
+        success_cb_id, firstname, lastname, date, destination_station, source_station,
+        train_num, ct_letter)
+    await asyncio.sleep(0)
+    instance.scan_route.assert_called_once_with([(other_id, mock.ANY)])
+
     instance.stop()
     asyncio.wait_for(run_task, 1)
+    instance.identities.run.assert_called_once_with()
+    instance.identities.stop.assert_called_once_with()
     instance.cleanup()
-    instance.session.close.assert_called_once_with()
+    instance.identities.close.assert_called_once_with()
 
 
 @pytest.mark.asyncio
@@ -98,35 +130,40 @@ async def test_scan(train_found, ct_letter, ct_found, booked, train,
     firstname = 'firstname'
     lastname = 'lastname'
     date = datetime(2016, 1, 1)
-    train_num = '741K'
+    train_num = train.num
 
     session_id = 'ssid'
 
     success_cb = mock.Mock(return_value=Awaitable())
     instance = scanner.UZScanner(success_cb, 1)
-    instance.client = mock.Mock()
-    instance.client.fetch_train.return_value = Awaitable(train if train_found else None)
+    uz = mock_identities(instance)
+    uz.list_trains.return_value = Awaitable([train] if train_found else [])
     instance.book = mock.Mock()
     instance.book.return_value = Awaitable(session_id if booked else None)
+    instance.booking_pool = mock.Mock()
 
     asyncio.ensure_future(instance.run())
 
     scan_id = instance.add_item(
         success_cb_id, firstname, lastname, date, source_station, destination_station,
         train_num, ct_letter)
-    await asyncio.sleep(0.01)
+    # the first scan is somewhere within the interval
+    for _ in range(200):
+        await asyncio.sleep(0.01)
+        if success_cb.called or instance.status(scan_id)[1]:
+            break
 
-    instance.client.fetch_train.assert_called_once_with(
-        date, source_station, destination_station, train_num)
+    uz.list_trains.assert_called_once_with(
+        date, source_station, destination_station, deadline=mock.ANY)
     if not train_found:
-        assert instance.status(scan_id) == (1, 'Train 741K not found')
+        assert instance.status(scan_id) == (1, 'Train {} not found'.format(train_num))
     elif not ct_found:
         assert instance.status(scan_id) == (1, 'Coach type {} not found'.format(ct_letter))
     else:
         coach_types = train.coach_types if ct_letter is None else [train.coach_types[-1]]
 
         instance.book.assert_called_once_with(
-            train, coach_types, firstname, lastname)
+            train, coach_types, firstname, lastname, mock.ANY)
         if booked:
             success_cb.assert_called_once_with(success_cb_id, session_id)
         else:
@@ -135,9 +172,278 @@ async def test_scan(train_found, ct_letter, ct_found, booked, train,
     instance.cleanup()
 
 
+@pytest.mark.asyncio
+async def test_scan_route_coalescing(train, source_station, destination_station):
+    instance = scanner.UZScanner(mock.Mock(), 1)
+    uz = mock_identities(instance)
+    uz.list_trains.return_value = Awaitable([train])
+    instance.scan = mock.Mock(side_effect=lambda *args: Awaitable())
+
+    date = datetime(2016, 1, 1)
+    scan_ids = [
+        instance.add_item('id', 'firstname', 'lastname', date, source_station,
+                          destination_station, train.num)
+        for _ in range(3)]
+    other_id = instance.add_item('id', 'firstname', 'lastname', date, destination_station,
+                                 source_station, train.num)
+
+    routes = due_routes(instance)
+    assert len(routes) == 2
+    items = routes[(date, source_station, destination_station)]
+    assert sorted(i for i, _ in items) == sorted(scan_ids)
+    assert [i for i, _ in routes[(date, destination_station, source_station)]] == [other_id]
+
+    await instance.scan_route(items)
+    await asyncio.sleep(0)
+    uz.list_trains.assert_called_once_with(
+        date, source_station, destination_station, deadline=mock.ANY)
+    instance.scan.assert_has_calls(
+        [mock.call(i, mock.ANY, [train], mock.ANY, mock.ANY) for i in scan_ids], any_order=True)
+    assert instance.scan.call_count == 3
+    instance.cleanup()
+
+
+def test_due_routes(source_station, destination_station):
+    instance = scanner.UZScanner(mock.Mock(), 60)
+    now = 1000
+    instance.scheduler.time = lambda: now
+    date = datetime(2016, 1, 1)
+    scan_ids = [
+        instance.add_item('id', 'firstname', 'lastname', date, source_station,
+                          destination_station, '741K')
+        for _ in range(3)]
+    other_id = instance.add_item('id', 'firstname', 'lastname', date, destination_station,
+                                 source_station, '741K')
+    runs = {i: instance.scheduler.next_run(i) for i in scan_ids}
+    first, *others = sorted(scan_ids, key=runs.get)
+
+    now = runs[first]
+    with mock.patch('uz.scanner.statsd') as statsd:
+        routes = instance.due_routes()
+    # siblings due within half of the interval are scanned along with the first one
+    pulled = [i for i in others if runs[i] - now <= 30]
+    assert list(routes) == [(date, source_station, destination_station)]
+    assert [i for i, _ in routes[(date, source_station, destination_station)]] == [
+        first] + pulled
+    rate = instance.drift_sample_rate
+    statsd.histogram.assert_has_calls(
+        [mock.call('scanner.schedule_drift', 0, sample_rate=rate)] +
+        [mock.call('scanner.schedule_drift', now - runs[i], sample_rate=rate) for i in pulled])
+    assert other_id in instance.scheduler
+
+    instance.abort(other_id)
+    assert other_id not in instance.scheduler
+    instance.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_scan_route_error(source_station, destination_station):
+    instance = scanner.UZScanner(mock.Mock(), 1)
+    uz = mock_identities(instance)
+    uz.list_trains.side_effect = client.exceptions.UZException('boom')
+    date = datetime(2016, 1, 1)
+    scan_id = instance.add_item('id', 'firstname', 'lastname', date, source_station,
+                                destination_station, '741K')
+
+    await instance.scan_route(due_routes(instance)[
+        (date, source_station, destination_station)])
+    assert instance.status(scan_id) == (1, 'boom')
+    instance.cleanup()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('state', ['open', 'trial_taken', 'trial_lost_race'])
+async def test_scan_route_circuit_open(state, source_station, destination_station):
+    instance = scanner.UZScanner(mock.Mock(), 1)
+    uz = mock_identities(instance)
+    instance.circuit_breakers = CircuitBreakers(threshold=1)
+    breaker = instance.circuit_breakers['purchase/search']
+    breaker.record(success=False)
+    if state != 'open':
+        # half-open
+        breaker.opened -= breaker.reset_timeout + 1
+    if state == 'trial_taken':
+        breaker.allow()
+    if state == 'trial_lost_race':
+        uz.list_trains.side_effect = client.exceptions.CircuitOpen(breaker.key, 0)
+    date = datetime(2016, 1, 1)
+    scan_id = instance.add_item('id', 'firstname', 'lastname', date, source_station,
+                                destination_station, '741K')
+
+    await instance.scan_route(due_routes(instance)[
+        (date, source_station, destination_station)])
+    assert uz.list_trains.called is (state == 'trial_lost_race')
+    attempts, error = instance.status(scan_id)
+    assert attempts == 0
+    assert error.startswith('endpoint purchase/search is unavailable')
+    instance.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_scan_deadline_exceeded(train, source_station, destination_station):
+    instance = scanner.UZScanner(mock.Mock(), 1, scan_budget=5)
+    instance.book = mock.Mock(side_effect=client.exceptions.DeadlineExceeded('cart/add', 5))
+    date = datetime(2016, 1, 1)
+    scan_id = instance.add_item('id', 'firstname', 'lastname', date, source_station,
+                                destination_station, train.num)
+    data = due_routes(instance)[(date, source_station, destination_station)][0][1]
+
+    with mock.patch('uz.scanner.statsd') as statsd:
+        await instance.scan(scan_id, data, [train], Deadline(5))
+    statsd.increment.assert_called_once_with(
+        'scanner.deadline_exceeded', tags=['stage:cart/add'])
+    assert instance.status(scan_id) == (1, 'scan did not complete in 5s, stuck at cart/add')
+    assert not data['busy']
+    instance.cleanup()
+
+
 @pytest.mark.parametrize('ct_letter,ct_found', [
     ('К', True),
     ('Z', False)])
 def test_find_coach_type(train, ct_letter, ct_found):
     result = scanner.UZScanner.find_coach_type(train, ct_letter)
     assert bool(result) is ct_found
+
+
+@pytest.mark.asyncio
+async def test_scan_unchanged_places(train, source_station, destination_station):
+    instance = scanner.UZScanner(mock.Mock(), 1)
+    instance.book = mock.Mock(side_effect=lambda *args: Awaitable())
+    scan_id = instance.add_item('id', 'firstname', 'lastname', datetime(2016, 1, 1),
+                                source_station, destination_station, train.num)
+    data = next(iter(due_routes(instance).values()))[0][1]
+    route = instance.route_key(data)
+
+    changes = instance.availability.update(route, [train])
+    await instance.scan(scan_id, data, [train], None, changes)
+    assert instance.book.call_count == 1
+
+    # places are the same: coaches are not looked up again
+    changes = instance.availability.update(route, [train])
+    with mock.patch('uz.scanner.statsd') as statsd:
+        await instance.scan(scan_id, data, [train], None, changes)
+    assert instance.book.call_count == 1
+    statsd.increment.assert_called_once_with('scanner.booking_skipped')
+    assert instance.status(scan_id) == (2, 'No available seats')
+
+    train.coach_types[1].places += 1
+    changes = instance.availability.update(route, [train])
+    await instance.scan(scan_id, data, [train], None, changes)
+    instance.book.assert_called_with(
+        train, [train.coach_types[1]], 'firstname', 'lastname', None)
+    instance.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_scan_book_error_keeps_changes(train, source_station, destination_station):
+    instance = scanner.UZScanner(mock.Mock(), 1)
+    instance.book = mock.Mock(side_effect=client.exceptions.HTTPError(502, 'body'))
+    scan_id = instance.add_item('id', 'firstname', 'lastname', datetime(2016, 1, 1),
+                                source_station, destination_station, train.num)
+    data = next(iter(due_routes(instance).values()))[0][1]
+    data['checked'] = True
+    route = instance.route_key(data)
+
+    changes = instance.availability.update(route, [train])
+    with pytest.raises(client.exceptions.HTTPError):
+        await instance.scan(scan_id, data, [train], None, changes)
+    # the places are still new to the scan
+    assert instance.availability.update(route, [train]) == changes
+    instance.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_scan_route_locked_keeps_changes(train, source_station, destination_station):
+    instance = scanner.UZScanner(mock.Mock(), 1)
+    uz = mock_identities(instance)
+    uz.list_trains.return_value = Awaitable([train])
+    instance.scan = mock.Mock(side_effect=lambda *args: Awaitable())
+    date = datetime(2016, 1, 1)
+    for _ in range(2):
+        instance.add_item('id', 'firstname', 'lastname', date, source_station,
+                          destination_station, train.num)
+    items = due_routes(instance)[(date, source_station, destination_station)]
+    busy = items[1][1]
+    busy['busy'] = True
+
+    await instance.scan_route(items)
+    assert instance.scan.call_count == 1
+    changes = instance.scan.call_args[0][4]
+    assert changes
+    # the busy scan sees them on the next lookup
+    route = instance.route_key(busy)
+    assert instance.availability.update(route, [train]) == changes
+    busy['busy'] = False
+    instance.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_restore(tmpdir, source_station, destination_station):
+    path = str(tmpdir.join('scans.log'))
+    instance = scanner.UZScanner(mock.Mock(), 1, store=LogStore(path))
+    date = datetime(2016, 1, 1)
+    message = {'chat': {'id': 1}, 'text': '/scan'}
+    scan_id = instance.add_item(message, 'firstname', 'lastname', date, source_station,
+                                destination_station, '741K', 'К')
+    aborted_id = instance.add_item(message, 'firstname', 'lastname', date, source_station,
+                                   destination_station, '743K')
+    instance.abort(aborted_id)
+    instance.cleanup()
+
+    restored = scanner.UZScanner(mock.Mock(), 1, store=LogStore(path))
+    assert restored.restore() == 1
+    (route, items), = due_routes(restored).items()
+    assert route == (date, source_station, destination_station)
+    (restored_id, data), = items
+    assert restored_id == scan_id
+    assert data['success_cb_id'] == message
+    assert (data['train_num'], data['ct_letter']) == ('741K', 'К')
+    assert restored.status(scan_id) == (0, None)
+    assert scan_id in restored.scheduler
+    restored.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_restore_broken_record(tmpdir, source_station, destination_station):
+    path = str(tmpdir.join('scans.log'))
+    instance = scanner.UZScanner(mock.Mock(), 1, store=LogStore(path))
+    scan_id = instance.add_item({'chat': {'id': 1}}, 'firstname', 'lastname',
+                                datetime(2016, 1, 1), source_station, destination_station, '741K')
+    instance.store.add('short', [1])
+    instance.store.add('route', ['id', 'firstname', 'lastname', '[1,', '741K', None, 60])
+    instance.cleanup()
+
+    restored = scanner.UZScanner(mock.Mock(), 1, store=LogStore(path))
+    assert restored.restore() == 1
+    assert restored.status(scan_id) == (0, None)
+    assert 'short' not in restored.scheduler
+    assert 'route' not in restored.scheduler
+    restored.cleanup()
+    assert set(LogStore(path).load()) == {scan_id}
+
+
+def test_load_scan(source_station, destination_station):
+    instance = scanner.UZScanner(mock.Mock(), 60)
+    data = instance.new_scan(
+        'id', 'firstname', 'lastname', datetime(2016, 1, 1), source_station,
+        destination_station, '741K', 'К', 600)
+    record = instance.dump_scan(data)
+    assert instance.load_scan(record) == data
+    # saved before routes were a single field
+    record = ['id', 'firstname', 'lastname', datetime(2016, 1, 1).toordinal(),
+              source_station.id, source_station.title,
+              destination_station.id, destination_station.title, '741K', 'К', 600]
+    assert instance.load_scan(record) == data
+    # saved before scans had intervals
+    assert instance.load_scan(record[:10])['interval'] == 60
+    with pytest.raises(ValueError):
+        instance.load_scan(record[:8])
+
+
+def test_load_route():
+    instance = scanner.UZScanner(mock.Mock(), 60)
+    saved = instance.dump_route(736000, 9900001, 'Ів.-Франківськ, 1,2', 9900002, ',"Дарниця"')
+    date, source, destination = instance.load_route(saved)
+    assert date == datetime.fromordinal(736000)
+    assert (source.id, source.title) == (9900001, 'Ів.-Франківськ, 1,2')
+    assert (destination.id, destination.title) == (9900002, ',"Дарниця"')
@@ -0,0 +1,85 @@
+from uz.schedule import Scheduler
+
+
+def test_spread():
+    scheduler = Scheduler(jitter=0, time=lambda: 0)
+    for i in range(100):
+        scheduler.add(i, 60)
+    assert len(scheduler) == 100
+    runs = sorted(scheduler.next_run(i) for i in range(100))
+    assert all(0 <= i < 60 for i in runs)
+    # every 6s of the interval gets about a tenth of the scans
+    for start in range(0, 60, 6):
+        assert 8 <= len([i for i in runs if start <= i < start + 6]) <= 12
+
+
+def test_add_many():
+    # same runs as added one by one, replaced keys included
+    added = Scheduler(jitter=0)
+    scheduler = Scheduler(jitter=0)
+    for i in (added, scheduler):
+        i.add(0, 5, now=0)
+    for i in range(100):
+        added.add(i, i + 1, now=0)
+    scheduler.add_many(((i, i + 1) for i in range(100)), now=0)
+    assert len(scheduler) == 100
+    assert [scheduler.next_run(i) for i in range(100)] == [added.next_run(i) for i in range(100)]
+    assert [key for key, _ in scheduler.pop_due(now=100)] == [
+        key for key, _ in added.pop_due(now=100)]
+
+
+def test_pop_due():
+    scheduler = Scheduler(jitter=0)
+    scheduler.add('a', 10, now=0)
+    scheduler.add('b', 100, now=0)
+    first = scheduler.next_run()
+    assert first == min(scheduler.next_run('a'), scheduler.next_run('b'))
+    assert scheduler.pop_due(now=-1) == []
+
+    due = scheduler.pop_due(now=100)
+    assert sorted(key for key, _ in due) == ['a', 'b']
+    assert round(dict(due)['a'], 3) == 93.82
+    assert round(dict(due)['b'], 3) == 76.393
+    # missed runs are skipped, otherwise the next run is an interval after the target
+    assert scheduler.next_run('a') == 110
+    assert round(scheduler.next_run('b'), 3) == 123.607
+
+
+def test_jitter():
+    scheduler = Scheduler(jitter=0.1)
+    scheduler.add('a', 10, now=0)
+    target = scheduler.next_run('a')
+    scheduler.pop_due(now=target)
+    assert target + 9 <= scheduler.next_run('a') <= target + 11
+
+
+def test_zero_interval():
+    scheduler = Scheduler()
+    scheduler.add('a', 0, now=0)
+    assert scheduler.pop_due(now=0) == [('a', 0)]
+    assert scheduler.pop_due(now=1) == [('a', 1)]
+
+
+def test_remove():
+    scheduler = Scheduler()
+    scheduler.add('a', 10, now=0)
+    scheduler.add('b', 20, now=0)
+    scheduler.remove('a')
+    scheduler.remove('unknown')
+    assert 'a' not in scheduler
+    assert len(scheduler) == 1
+    assert scheduler.next_run() == scheduler.next_run('b')
+    assert [key for key, _ in scheduler.pop_due(now=100)] == ['b']
+    scheduler.remove('b')
+    assert scheduler.next_run() is None
+
+
+def test_pull():
+    scheduler = Scheduler(jitter=0)
+    scheduler.add('a', 100, now=0)
+    target = scheduler.next_run('a')
+    assert scheduler.pull('a', target - 60, 50) is None
+    assert scheduler.pull('a', target - 40, 50) == -40
+    assert scheduler.next_run('a') == target + 60
+    assert scheduler.pop_due(now=target) == []
+    assert scheduler.pull('unknown', 0, 50) is None
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from uz.store import LogStore
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join('scans.log'))
+
+
+def read_entries(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(i) for i in f]
+
+
+@pytest.mark.asyncio
+async def test_log_store(path):
+    store = LogStore(path)
+    assert store.load() == {}
+    store.add('a', ['Дарниця', 1])
+    store.add('b', ['Lviv', 2])
+    store.remove('a')
+    store.remove('unknown')
+    await store.flush()
+    # a line for every run of additions or removals of a batch
+    assert read_entries(path) == [
+        ['+', {'a': ['Дарниця', 1], 'b': ['Lviv', 2]}], ['-', 'a']]
+    store.close()
+
+    assert LogStore(path).load() == {'b': ['Lviv', 2]}
+
+
+@pytest.mark.asyncio
+async def test_log_store_close_writes_pending(path):
+    store = LogStore(path)
+    store.add('a', [1])
+    store.close()
+    assert LogStore(path).load() == {'a': [1]}
+
+
+@pytest.mark.asyncio
+async def test_log_store_compaction(path):
+    store = LogStore(path, min_compact=4)
+    for i in range(6):
+        store.add(str(i), [i])
+        await store.flush()
+        if i:
+            store.remove(str(i - 1))
+            await store.flush()
+    assert len(read_entries(path)) < 4
+    store.close()
+    assert LogStore(path).load() == {'5': [5]}
+
+
+def test_log_store_broken_entries(path):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('["+","a",[1]]\n{broken\n["+","b",[2]]\n["+","c",[')
+    store = LogStore(path)
+    assert store.load() == {'a': [1], 'b': [2]}
+    assert read_entries(path) == [['+', {'a': [1], 'b': [2]}]]
+
+
+def test_log_store_lines(path):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('["+","a",[1]]\n["+",{"b":[2],"c":[3]}]\n["-",["a","b"]]\n["-","c"]\n'
+                '["+",{"d":[4]}]\n')
+    store = LogStore(path)
+    assert store.load() == {'d': [4]}
+    assert store._entries == 7
+
+
+@pytest.mark.parametrize('line', [
+    '{}', '[]', '["+","b"]', '["-"]', '["?","b",[2]]', '1',
+    '["+",["b"]]', '["-",{"b":[2]}]', '["-",[1]]', '["+",{"b":[2]},1]'])
+def test_log_store_malformed_entries(path, line):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('["+","a",[1]]\n' + line + '\n')
+    store = LogStore(path)
+    assert store.load() == {'a': [1]}
+    assert read_entries(path) == [['+', 'a', [1]]]